@@ -0,0 +1,84 @@
+# -*- coding: utf8 -*-
+
+import time
+import traceback
+import multiprocessing
+from converter import convert_file
+from io_pipeline import PrefetchedFile
+from stage_profiler import profiler
+
+# Configuration shared by the worker processes. It is set up by the pool
+# initializer and inherited by the forked workers, so it is parsed only once.
+_config = {}
+
+def _init_worker(settings, fmt, dsc, cache):
+	# Drop the statistics inherited from the main process
+	profiler.reset()
+	# Worker processes can not start processes of their own, so every BOM is
+	# parsed and rendered serially here
+	settings = dict(settings)
+	settings["parseJobs"] = 0
+	settings["renderJobs"] = 0
+	_config["settings"] = settings
+	_config["fmt"] = fmt
+	_config["dsc"] = dsc
+	_config["cache"] = cache
+
+def _convert_job(fileBom):
+	"""
+		Converts one BOM in a worker process.
+
+		fileBom:	the name of the BOM file;
+		return:		a tuple (BOM name, LaTeX name or None, seconds, error message or None,
+					profiler statistics or None).
+	"""
+	start = time.time()
+	fileTex = None
+	error = None
+	try:
+		source = None
+		if _config["settings"].get("pipeline"):
+			source = PrefetchedFile(fileBom)
+		fileTex = convert_file(fileBom, _config["settings"], _config["fmt"], _config["dsc"], _config["cache"],
+			source = source)
+	except Exception:
+		error = traceback.format_exc().strip().splitlines()[-1]
+	elapsed = time.time() - start
+	stats = None
+	if profiler.enabled:
+		stats = profiler.collect()
+	return fileBom, fileTex, elapsed, error, stats
+
+def convert_batch(listBom, settings, fmt, dsc, jobs, cache = None):
+	"""
+		Converts several BOM files spreading them across a pool of processes.
+		The results are reported in the order of listBom as soon as they are ready.
+
+		listBom:	a list of BOM file names;
+		settings:	the settings dictionary;
+		fmt:		FormatParser object;
+		dsc:		RefDesParser object;
+		jobs:		the number of worker processes;
+		cache:		TexCache object or None;
+		return:		the number of files which failed to convert.
+	"""
+	failed = 0
+	start = time.time()
+	pool = multiprocessing.Pool(jobs, _init_worker, (settings, fmt, dsc, cache))
+	try:
+		for fileBom, fileTex, elapsed, error, stats in pool.imap(_convert_job, listBom):
+			if stats is not None:
+				profiler.merge(stats)
+			if error is None:
+				print "%s -> %s: %.3f с" % (fileBom, fileTex, elapsed)
+			else:
+				failed += 1
+				print "%s: ошибка: %s (%.3f с)" % (fileBom, error, elapsed)
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+	print "Обработано файлов: %d, с ошибками: %d, время: %.3f с" % (len(listBom), failed, time.time() - start)
+	return failed
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+
+import os
+import csv
+import sys
+import json
+import time
+import random
+import shutil
+import getopt
+import resource
+import tempfile
+import itertools
+import multiprocessing
+from parser_refdes import RefDesParser
+from parser_format import FormatParser
+from parser_bom import BomParser
+from tex_writer import TexWriter
+from render_cache import renderCache
+import part_table
+from part_table import DesignatorIndex
+
+# Characters used to spoil the values of the synthetic BOM
+SPECIAL_CHARS = ['а', 'б', 'в', 'ж', 'Ом', 'мкФ', '&', '%', '$', '#', '_', '{', '}', '~', '^', '"', '\\', '+/-', ',', ' ']
+PLAIN_CHARS = list("ABCDEFGHJKLMNPQRSTUVWXYZ0123456789")
+
+HEADER = ["Designator", "Value", "Manufacturer", "ManufacturerPartNumber", "Quantity", "Name",
+	"Package", "Tolerance", "TU/GOST", "Type", "Power/Voltage", "TKC", "TKE"]
+
+FORMAT = """RefDes: field1
+Quantity: field5
+*: field10 field2 field11 field8, field7, field4 "field3" field9
+"""
+
+DEFAULTS = {
+	"rows": [10000],
+	"refs": [4],
+	"types": [10],
+	"distinct": [0.05],
+	"special": [0.1],
+}
+
+def type_name(index):
+	"""
+		Returns a letter-only element type for the index: A, B, ..., Z, AA, AB, ...
+	"""
+	name = ''
+	index += 1
+	while index:
+		index, rest = divmod(index - 1, 26)
+		name = chr(ord('A') + rest) + name
+	return name
+
+def random_value(rnd, length, special):
+	"""
+		Builds a random value, every piece is taken from SPECIAL_CHARS with
+		probability special.
+	"""
+	value = []
+	for i in range(length):
+		if rnd.random() < special:
+			value.append(rnd.choice(SPECIAL_CHARS))
+		else:
+			value.append(rnd.choice(PLAIN_CHARS))
+	return ''.join(value)
+
+def generate_bom(directory, rows, refs, types, distinct, special, seed = 1):
+	"""
+		Generates a synthetic BOM together with format and description files.
+
+		directory:	the directory to put the files into;
+		rows:		the number of rows;
+		refs:		the maximum number of designators per row;
+		types:		the number of element types;
+		distinct:	the ratio of distinct parts to rows;
+		special:	the share of Cyrillic and LaTeX special characters in values;
+		seed:		random seed, the same parameters and seed give the same files;
+		return:		a tuple of (BOM, format, description) file names.
+	"""
+	rnd = random.Random(seed)
+	listTypes = [type_name(index) for index in range(types)]
+	parts = []
+	for index in range(max(1, int(rows * distinct))):
+		parts.append([random_value(rnd, 8, special), random_value(rnd, 10, special),
+			random_value(rnd, 6, special), random_value(rnd, 4, special)])
+	counters = dict([(elemType, 1) for elemType in listTypes])
+
+	fileBom = os.path.join(directory, "bom.csv")
+	f = open(fileBom, 'wb')
+	writer = csv.writer(f, quoting = csv.QUOTE_ALL)
+	writer.writerow(HEADER)
+	for row in range(rows):
+		elemType = rnd.choice(listTypes)
+		refdes = []
+		for index in range(rnd.randint(1, refs)):
+			refdes.append("%s%d" % (elemType, counters[elemType]))
+			# Leave some gaps in numbering
+			counters[elemType] += 1 if rnd.random() < 0.9 else 2
+		partIndex = rnd.randrange(len(parts))
+		value, manufacturer, package, tolerance = parts[partIndex]
+		writer.writerow([', '.join(refdes), value, manufacturer, "PN%d" % partIndex, str(len(refdes)),
+			"", package, tolerance, "", "Type", "50 В", "", ""])
+	f.close()
+
+	fileFormat = os.path.join(directory, "format")
+	f = open(fileFormat, 'w')
+	f.write(FORMAT)
+	f.close()
+	fileDescription = os.path.join(directory, "description")
+	f = open(fileDescription, 'w')
+	for elemType in listTypes:
+		f.write("%s: Элемент %s, Элементы %s\n" % (elemType, elemType, elemType))
+	f.close()
+	return fileBom, fileFormat, fileDescription
+
+def measure(function, repeat):
+	"""
+		Runs the function several times.
+
+		return:		a tuple (best time in seconds, result of the last run).
+	"""
+	best = None
+	for index in range(repeat):
+		start = time.time()
+		result = function()
+		elapsed = time.time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best, result
+
+def run_case(args):
+	"""
+		Generates a BOM for the parameters and times every stage of the conversion.
+
+		args:		a tuple (parameters dictionary, repeat count);
+		return:		the results dictionary.
+	"""
+	params, repeat = args
+	directory = tempfile.mkdtemp(prefix = "bomparser-bench")
+	try:
+		fileBom, fileFormat, fileDescription = generate_bom(directory, params["rows"], params["refs"],
+			params["types"], params["distinct"], params["special"])
+		stages = {}
+
+		def load_config():
+			return FormatParser(fileFormat), RefDesParser(fileDescription)
+		stages["config"], (fmt, dsc) = measure(load_config, repeat)
+
+		def read_csv():
+			f = open(fileBom, 'rb')
+			rows = list(csv.reader(f))
+			f.close()
+			return rows
+		stages["csv_read"], rows = measure(read_csv, repeat)
+
+		def compose():
+			template = fmt.dictTemplate['*'].bind(rows[0])
+			return [template.render(row) for row in rows[1:]]
+		stages["compose"], names = measure(compose, repeat)
+		rows = names = None
+
+		def parse():
+			return BomParser(fileBom, fmt.dictFormat, dsc.dictDescription, dictTemplate = fmt.dictTemplate)
+		stages["parse"], bom = measure(parse, repeat)
+
+		settings = {"group": "flat", "strings": 0, "fileTex": os.path.join(directory, "bom.tex")}
+		tex = TexWriter(settings, bom.data, dsc.dictDescription)
+
+		def sort():
+			# Sorting is done while the designator index is built
+			return tex._TexWriter__sortElements(DesignatorIndex(bom.data.designators, bom.data.ranges))
+		stages["sort"], sortedKeys = measure(sort, repeat)
+
+		stages["group"], groupedKeys = measure(tex._TexWriter__combineElements, repeat)
+		groupNames = [''.join(bom.data.name(group[0])) for group in groupedKeys]
+
+		def escape():
+			escaped = []
+			firstQuote = True
+			for name in groupNames:
+				text, firstQuote = tex._TexWriter__escape_latex(name, firstQuote)
+				escaped.append(text)
+			return escaped
+		stages["escape"], escaped = measure(escape, repeat)
+
+		def beautify():
+			return [tex._TexWriter__beautifyStr(''.join(['\\Element{', name, '}{\\refbox{R1}}{1}']))
+				for name in escaped]
+		stages["beautify"], lines = measure(beautify, repeat)
+
+		def write():
+			# Every run renders the names anew, as a single conversion does
+			renderCache.clear()
+			tex.write_file()
+		stages["write"], result = measure(write, repeat)
+
+		def total():
+			renderCache.clear()
+			fmt = FormatParser(fileFormat)
+			dsc = RefDesParser(fileDescription)
+			bom = BomParser(fileBom, fmt.dictFormat, dsc.dictDescription, dictTemplate = fmt.dictTemplate)
+			TexWriter(settings, bom.data, dsc.dictDescription).write_file()
+		stages["total"], result = measure(total, repeat)
+
+		return {
+			"params": params,
+			"designators": len(bom.data),
+			"groups": len(groupedKeys),
+			# Sorting and grouping are vectorized if NumPy is installed
+			"engine": "numpy" if part_table.numpy is not None else "python",
+			"stages": stages,
+			"rows_per_second": params["rows"] / stages["total"] if stages["total"] else None,
+			# Kilobytes on Linux
+			"peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+		}
+	finally:
+		shutil.rmtree(directory)
+
+def run_suite(cases, repeat):
+	"""
+		Runs every case in a fresh process, so that peak memory of one case
+		does not hide the others.
+
+		cases:		a list of parameter dictionaries;
+		repeat:		the number of runs of every stage;
+		return:		a list of results dictionaries.
+	"""
+	results = []
+	for case in cases:
+		pool = multiprocessing.Pool(1)
+		try:
+			results.append(pool.apply(run_case, ((case, repeat),)))
+		finally:
+			pool.close()
+			pool.join()
+	return results
+
+def compare(results, baseline, threshold):
+	"""
+		Compares the results with a baseline run.
+
+		results:	the list of results of the current run;
+		baseline:	the list of results of a previous run;
+		threshold:	relative slowdown which is reported as a regression;
+		return:		a list of (parameters, stage, baseline time, current time) regressions.
+	"""
+	regressions = []
+	previous = dict([(json.dumps(entry["params"], sort_keys = True), entry) for entry in baseline])
+	for entry in results:
+		old = previous.get(json.dumps(entry["params"], sort_keys = True))
+		if old is None:
+			continue
+		for stage, elapsed in sorted(entry["stages"].items()):
+			oldElapsed = old["stages"].get(stage)
+			if oldElapsed and elapsed > oldElapsed * (1 + threshold):
+				regressions.append((entry["params"], stage, oldElapsed, elapsed))
+	return regressions
+
+def PrintHelp():
+	print "НАЗВАНИЕ"
+	print "\tbenchmark - измерение производительности bomparser на синтетических BOM.\n"
+	print "СИНТАКСИС"
+	print "\tbenchmark [--rows N,...] [--refs N,...] [--types N,...] [--distinct R,...] [--special R,...] [-r N] [-o файл] [-c файл] [-t R]\n"
+	print "ОПИСАНИЕ"
+	print "Для каждого сочетания параметров создаётся синтетический BOM и измеряется время каждого этапа преобразования (config, csv_read, compose, parse, sort, group, escape, beautify, write, total) и пиковое потребление памяти. Каждый параметр может содержать список значений через запятую.\n"
+	print "\t--rows N\n\t\tколичество строк BOM.\n"
+	print "\t--refs N\n\t\tмаксимальное количество позиционных обозначений в строке.\n"
+	print "\t--types N\n\t\tколичество типов элементов.\n"
+	print "\t--distinct R\n\t\tдоля различных наименований относительно количества строк.\n"
+	print "\t--special R\n\t\tдоля символов кириллицы и специальных символов LaTeX в значениях полей.\n"
+	print "\t-r, --repeat N\n\t\tколичество повторов каждого этапа, учитывается лучшее время. По умолчанию 3.\n"
+	print "\t-o, --output файл\n\t\tсохранить результаты в файл в формате JSON. По умолчанию результаты выводятся в стандартный вывод.\n"
+	print "\t-c, --compare файл\n\t\tсравнить результаты с результатами предыдущего запуска. При замедлении какого-либо этапа сценарий завершается с кодом 1.\n"
+	print "\t-t, --threshold R\n\t\tдопустимое относительное замедление этапа при сравнении. По умолчанию 0.2.\n"
+
+def main(argv):
+	params = dict(DEFAULTS)
+	repeat = 3
+	fileOutput = None
+	fileCompare = None
+	threshold = 0.2
+	try:
+		opts, args = getopt.getopt(argv, "hr:o:c:t:", ["help", "rows=", "refs=", "types=", "distinct=",
+			"special=", "repeat=", "output=", "compare=", "threshold="])
+	except getopt.GetoptError as err:
+		print str(err)
+		PrintHelp()
+		sys.exit(2)
+	try:
+		for opt, arg in opts:
+			if opt in ("-h", "--help"):
+				PrintHelp()
+				sys.exit()
+			elif opt in ("--rows", "--refs", "--types"):
+				params[opt[2:]] = [int(value) for value in arg.split(',')]
+			elif opt in ("--distinct", "--special"):
+				params[opt[2:]] = [float(value) for value in arg.split(',')]
+			elif opt in ("-r", "--repeat"):
+				repeat = max(int(arg), 1)
+			elif opt in ("-o", "--output"):
+				fileOutput = arg
+			elif opt in ("-c", "--compare"):
+				fileCompare = arg
+			elif opt in ("-t", "--threshold"):
+				threshold = float(arg)
+	except ValueError as err:
+		print str(err)
+		PrintHelp()
+		sys.exit(2)
+
+	names = sorted(params.keys())
+	cases = [dict(zip(names, values)) for values in itertools.product(*[params[name] for name in names])]
+	results = run_suite(cases, repeat)
+	output = json.dumps(results, sort_keys = True, indent = 2)
+	if fileOutput is None:
+		print output
+	else:
+		f = open(fileOutput, 'w')
+		f.write(output)
+		f.close()
+
+	if fileCompare is not None:
+		f = open(fileCompare)
+		baseline = json.load(f)
+		f.close()
+		regressions = compare(results, baseline, threshold)
+		for case, stage, oldElapsed, elapsed in regressions:
+			print "Замедление: %s, %s: %.4f с -> %.4f с" % (json.dumps(case, sort_keys = True), stage, oldElapsed, elapsed)
+		if regressions:
+			sys.exit(1)
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,132 @@
+# -*- coding: utf8 -*-
+
+"""
+	Conversion of BOMs in memory, for the programs using bomparser as a library.
+	Nothing is read from or written to the disk. The configuration objects are
+	not changed by the conversion, so they may be loaded once and shared by
+	several threads converting BOMs at the same time. The BOM and the
+	configuration may be given as UTF-8 byte strings or as unicode strings,
+	the latter are encoded to UTF-8, and the document is always UTF-8.
+
+	Example:
+
+		fmt, dsc = load_config(open("format").read(), open("description").read())
+		tex = convert(open("bom.csv", "rb"), fmt, dsc)
+"""
+
+import csv
+from parser_refdes import RefDesParser
+from parser_format import FormatParser
+from parser_bom import BomParser
+from tex_writer import TexWriter, TextSink
+from render_cache import renderCache
+
+def _utf8(text):
+	if isinstance(text, unicode):
+		return text.encode("utf-8")
+	return text
+
+def _utf8_lines(lines):
+	"""
+		Encodes the lines of a configuration file given as unicode strings.
+	"""
+	if isinstance(lines, basestring):
+		return _utf8(lines)
+	return [_utf8(line) for line in lines]
+
+def _utf8_rows(bom):
+	"""
+		Encodes the fields of the BOM given as unicode strings, the parser
+		works on UTF-8 byte strings.
+
+		bom:		a file-like object or an iterable of rows, see parse_bom();
+		return:		a generator of rows of byte strings.
+	"""
+	if hasattr(bom, "read"):
+		bom = csv.reader(_utf8(line) for line in bom)
+	for row in bom:
+		yield [_utf8(field) for field in row]
+
+def load_config(formatLines, descriptionLines):
+	"""
+		Parses the configuration given in memory.
+
+		formatLines:		the content of the format file: a string, a file-like object
+						or an iterable of lines, in UTF-8 or unicode;
+		descriptionLines:	the content of the description file, in the same form;
+		return:				a tuple (FormatParser, RefDesParser).
+	"""
+	fmt = FormatParser(lines = _utf8_lines(formatLines))
+	if not fmt.dictFormat:
+		raise ValueError("format is empty")
+	dsc = RefDesParser(lines = _utf8_lines(descriptionLines))
+	if not dsc.dictDescription:
+		raise ValueError("description is empty")
+	return fmt, dsc
+
+def parse_bom(bom, fmt, dsc):
+	"""
+		Parses the BOM. No messages are printed, the refdes met more than once
+		are left in data.duplicates and the types without format in exceptions
+		of the result.
+
+		bom:		a file-like object with CSV data or an iterable of rows split
+					into fields, the first row being the header; the lines or the
+					fields are UTF-8 byte strings or unicode strings;
+		fmt:		FormatParser object;
+		dsc:		RefDesParser object;
+		return:		BomParser object.
+	"""
+	parser = BomParser(_utf8_rows(bom), fmt.dictFormat, dsc.dictDescription, stream = True, dictTemplate = fmt.dictTemplate)
+	parser.verbose = False
+	parser.ParseData()
+	return parser
+
+def _writer(bom, fmt, dsc, group, strings):
+	if not isinstance(bom, BomParser):
+		bom = parse_bom(bom, fmt, dsc)
+	settings = {"group": group, "strings": strings}
+	return TexWriter(settings, bom.data, dsc.dictDescription)
+
+def convert(bom, fmt, dsc, group = "flat", strings = 0, sink = None):
+	"""
+		Converts the BOM to LaTeX document.
+
+		bom:		the BOM as for parse_bom(), UTF-8 or unicode, or BomParser
+					object returned by it;
+		fmt:		FormatParser object;
+		dsc:		RefDesParser object;
+		group:		grouping mode, "flat" or "none";
+		strings:	insert an empty line after every N lines, 0 to insert none;
+		sink:		binary file-like object to write the document to;
+		return:		the document as UTF-8 string if sink is not given, None otherwise.
+	"""
+	tex = _writer(bom, fmt, dsc, group, strings)
+	if sink is not None:
+		tex.write_file(sink)
+		return None
+	sink = TextSink()
+	tex.write_file(sink)
+	return sink.getvalue()
+
+def iter_convert(bom, fmt, dsc, group = "flat", strings = 0):
+	"""
+		Converts the BOM to LaTeX document yielding it by parts: the header, every
+		section and the footer. The parameters are the same as for convert().
+
+		return:		a generator of UTF-8 strings.
+	"""
+	tex = _writer(bom, fmt, dsc, group, strings)
+	yield tex.render_header()
+	firstQuote = True
+	for elemType, groups in tex.sections():
+		text, firstQuote = tex.render_section(groups, firstQuote)
+		yield text
+	yield tex.render_footer()
+
+def cache_stats():
+	"""
+		Returns the statistics of the cache of rendered names shared by the
+		conversions of this process, see RenderCache.stats().
+	"""
+	return renderCache.stats()
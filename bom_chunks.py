@@ -0,0 +1,161 @@
+# -*- coding: utf8 -*-
+
+import csv
+import mmap
+import cStringIO
+import multiprocessing
+from itertools import izip
+from part_table import PartTable
+from compression import detect
+
+# Files smaller than this per process are parsed serially
+CHUNK_MIN = 4 * 1024 * 1024
+# Every process gets several chunks, so that a slow chunk does not hold the others
+CHUNKS_PER_JOB = 4
+
+def _record_end(mm, pos, quotes):
+	"""
+		Finds the end of the CSV record starting before pos. A line feed ends the
+		record only if the number of quotes before it is even, otherwise it is
+		inside a quoted field. Doubled quotes do not change the parity.
+
+		mm:			the mapped file;
+		pos:		the offset to look for the end of the record from;
+		quotes:		the parity of the number of quotes before pos;
+		return:		the offset after the line feed or the size of the file.
+	"""
+	size = len(mm)
+	while pos < size:
+		end = mm.find('\n', pos)
+		if end < 0:
+			return size
+		quotes = (quotes + mm[pos:end].count('"')) & 1
+		pos = end + 1
+		if not quotes:
+			return pos
+	return size
+
+def split_ranges(mm, chunks):
+	"""
+		Splits the mapped CSV file into byte ranges of whole records.
+
+		mm:			the mapped file;
+		chunks:		the desired number of ranges;
+		return:		a tuple (header range, list of (start, end) ranges of the rows).
+	"""
+	size = len(mm)
+	headerEnd = _record_end(mm, 0, 0)
+	ranges = []
+	start = headerEnd
+	step = max((size - headerEnd) // chunks, 1)
+	while start < size:
+		target = start + step
+		if target >= size:
+			end = size
+		else:
+			# The range starts with a record, so the quote parity there is even
+			end = _record_end(mm, target, mm[start:target].count('"') & 1)
+		ranges.append((start, end))
+		start = end
+	return (0, headerEnd), ranges
+
+# The parser shared by the worker processes, set up by the pool initializer
+_config = {}
+
+def _init_worker(bom, fieldnames):
+	# Drop the statistics inherited from the main process
+	from stage_profiler import profiler
+	profiler.reset()
+	bom.verbose = False
+	_config["bom"] = bom
+	_config["fieldnames"] = fieldnames
+
+def _read_range(fileBom, bounds):
+	"""
+		Reads a range of the file.
+
+		return:		a file-like object with the data of the range.
+	"""
+	start, end = bounds
+	f = open(fileBom, 'rb')
+	mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+	data = cStringIO.StringIO(mm[start:end])
+	mm.close()
+	f.close()
+	return data
+
+def _parse_range(bounds):
+	"""
+		Parses a range of the BOM file in a worker process.
+
+		bounds:		a tuple (start, end) of the range;
+		return:		a tuple (PartTable of the range, list of the types without
+					format, profiler statistics or None). The table is pickled
+					as arrays, see PartTable.__getstate__().
+	"""
+	bom = _config["bom"]
+	bom.exceptions = []
+	table = PartTable()
+	for refdesSet, nameStr in bom.IterSets(csv.reader(_read_range(bom.fileBom, bounds)), _config["fieldnames"]):
+		table.add_set(refdesSet, table.add_part(nameStr))
+	# Imported here, the profiler module imports the parser itself
+	from stage_profiler import profiler
+	stats = None
+	if profiler.enabled:
+		stats = profiler.collect()
+	return table, bom.exceptions, stats
+
+def parse_chunks(bom, jobs):
+	"""
+		Parses the BOM file splitting it into ranges parsed by a pool of processes.
+		The tables of the ranges are merged into bom.data in bulk in the order of
+		the file. A range repeating a position of the table, which is rare, is
+		parsed again in this process row by row, so the result, including the
+		row which wins for a repeated refdes, is the same as of the serial parsing.
+
+		bom:		BomParser object;
+		jobs:		the number of worker processes;
+		return:		False if the file is too small to be split, nothing is parsed
+					then; True otherwise.
+	"""
+	if detect(bom.fileBom) is not None:
+		# A compressed file can only be read as a whole
+		return False
+	f = open(bom.fileBom, 'rb')
+	try:
+		mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+	except (ValueError, mmap.error):
+		# Empty files can not be mapped
+		mm = None
+	if mm is None or len(mm) < CHUNK_MIN * jobs:
+		if mm is not None:
+			mm.close()
+		f.close()
+		return False
+	(headerStart, headerEnd), ranges = split_ranges(mm, jobs * CHUNKS_PER_JOB)
+	fieldnames = csv.reader(cStringIO.StringIO(mm[headerStart:headerEnd])).next()
+	mm.close()
+	f.close()
+
+	from stage_profiler import profiler
+	table = bom.data
+	pool = multiprocessing.Pool(jobs, _init_worker, (bom, fieldnames))
+	try:
+		for bounds, (rangeTable, exceptions, stats) in izip(ranges, pool.imap(_parse_range, ranges)):
+			if stats is not None:
+				profiler.merge(stats)
+			for elemType in exceptions:
+				if elemType not in bom.exceptions:
+					bom.exceptions.append(elemType)
+					if bom.verbose:
+						print "Отсутствует формат строки описания для элемента ", elemType
+			if not table.merge(rangeTable):
+				for refdesSet, nameStr in bom.IterSets(csv.reader(_read_range(bom.fileBom, bounds)), fieldnames):
+					table.add_set(refdesSet, table.add_part(nameStr))
+		pool.close()
+	except:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+	return True
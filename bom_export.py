@@ -0,0 +1,168 @@
+# -*- coding: utf8 -*-
+
+import os
+import re
+import csv
+import json
+from tex_output import open_output
+from tex_writer import clean_run
+from compression import split_extension
+
+# Formats of the element list which may be written from a single parse
+EMIT_FORMATS = ("tex", "csv", "json")
+# Endings of the file names of the formats. The CSV list must not be taken
+# for a BOM, so it does not end with just ".csv".
+EMIT_SUFFIXES = {
+	"tex": ".tex",
+	"csv": "-elements.csv",
+	"json": ".json",
+}
+
+# Runs of two or more commas and spaces except a single ", ", which is left
+# as is by the clean up anyway and is too frequent to be passed to it
+RUN_RE = re.compile('[, ]{3,}|,,| ,|  ')
+
+def _clean_run(match):
+	return clean_run(match.group(0))
+
+def plain_name(nameParts):
+	"""
+		Composes the name of the part as plain text. Excessive commas and spaces
+		are removed the same way as in the LaTeX document, nothing is escaped.
+
+		nameParts:	the name parts of the group;
+		return:		UTF-8 string.
+	"""
+	return RUN_RE.sub(_clean_run, ''.join(nameParts)).strip(', ')
+
+def output_name(fileTex, fmt):
+	"""
+		Derives the name of the file of the format from the name of the LaTeX file.
+		The file is compressed the same way as the LaTeX file.
+
+		fileTex:	the name of the LaTeX file, "-" stands for the standard output;
+		fmt:		one of EMIT_FORMATS;
+		return:		the name of the file.
+	"""
+	if fmt == "tex" or fileTex == "-":
+		return fileTex
+	base, compress = split_extension(fileTex)
+	fileName = os.path.splitext(base)[0] + EMIT_SUFFIXES[fmt]
+	if compress:
+		fileName = '.'.join([fileName, compress])
+	return fileName
+
+def parse_formats(text):
+	"""
+		Parses the comma separated list of formats.
+
+		text:		e.g. "tex,csv,json";
+		return:		a list of formats without repetitions or None if the list is
+					empty or has an unknown format.
+	"""
+	formats = []
+	for fmt in text.split(','):
+		fmt = fmt.strip().lower()
+		if fmt not in EMIT_FORMATS:
+			return None
+		if fmt not in formats:
+			formats.append(fmt)
+	return formats or None
+
+def _designators(tex, elem):
+	# Designators of a rolled-up table are not shown
+	if tex.partTable.amounts is not None:
+		return []
+	# Groups holding spans are expanded
+	return list(elem)
+
+class CsvWriter:
+	"""
+		Writes the element list grouped by TexWriter as a flat CSV table, one
+		line per group: type, designators, name and quantity.
+	"""
+	def __init__(self, tex, fileName):
+		self.tex = tex
+		self.fileName = fileName
+
+	def write_file(self, sink = None):
+		"""
+			Writes the table.
+
+			sink:		binary file-like object, see TexWriter.write_file();
+			return:		none.
+		"""
+		hndFile = open_output(self.fileName, sink, self.tex.pipeline)
+		writer = csv.writer(hndFile, lineterminator = '\n')
+		writer.writerow(["Type", "Designator", "Name", "Quantity"])
+		for elemType, groups in self.tex.sections():
+			for elemType, elem, nameParts, plural in groups:
+				writer.writerow([elemType, ', '.join(_designators(self.tex, elem)), plain_name(nameParts), self.tex.count(elem)])
+		hndFile.close()
+
+class JsonWriter:
+	"""
+		Writes the element list grouped by TexWriter as JSON: a list of sections
+		with the type, the title and the elements of each. The document is written
+		section by section, so it is never held in memory as a whole.
+	"""
+	def __init__(self, tex, fileName):
+		self.tex = tex
+		self.fileName = fileName
+
+	def write_file(self, sink = None):
+		"""
+			Writes the document.
+
+			sink:		binary file-like object, see TexWriter.write_file();
+			return:		none.
+		"""
+		hndFile = open_output(self.fileName, sink, self.tex.pipeline)
+		hndFile.write('{"sections": [')
+		separator = '\n'
+		for elemType, groups in self.tex.sections():
+			title = self.tex.section_title(elemType, groups[0][3])
+			hndFile.write(separator)
+			hndFile.write('{"type": %s, "title": %s, "elements": [' % (_dump(elemType), _dump(title)))
+			elemSeparator = '\n'
+			for elemType, elem, nameParts, plural in groups:
+				hndFile.write(elemSeparator)
+				hndFile.write('{"designators": %s, "name": %s, "quantity": %d}' % (_dump(_designators(self.tex, elem)),
+					_dump(plain_name(nameParts)), self.tex.count(elem)))
+				elemSeparator = ',\n'
+			hndFile.write(']}')
+			separator = ',\n'
+		hndFile.write(']}\n')
+		hndFile.close()
+
+def _dump(value):
+	# Without indents and sorting the encoder implemented in C is used
+	return json.dumps(value, ensure_ascii = False, encoding = "utf-8")
+
+# Writer classes of the formats other than LaTeX
+WRITERS = {
+	"csv": CsvWriter,
+	"json": JsonWriter,
+}
+
+def write_outputs(tex, formats, sink = None, renderJobs = 0):
+	"""
+		Writes the element list grouped once by the TexWriter in every format.
+
+		tex:		TexWriter object with the parsed and grouped BOM;
+		formats:	a list of EMIT_FORMATS;
+		sink:		binary file-like object to write the only format to;
+		renderJobs:	the number of processes rendering the LaTeX sections;
+		return:		a list of the names of the files written.
+	"""
+	names = []
+	for fmt in formats:
+		if fmt == "tex":
+			if renderJobs > 1:
+				tex.write_parallel(renderJobs, sink)
+			else:
+				tex.write_file(sink)
+		else:
+			WRITERS[fmt](tex, output_name(tex.fileName, fmt)).write_file(sink)
+		names.append(output_name(tex.fileName, fmt))
+	return names
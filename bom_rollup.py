@@ -0,0 +1,80 @@
+# -*- coding: utf8 -*-
+
+import re
+from itertools import izip
+from parser_bom import BomParser
+from part_table import PartTable
+from io_pipeline import prefetch_files
+
+# A BOM given as "file:N" is counted N times
+COUNT_RE = re.compile(r'^(.+):(-?[0-9]+)$')
+
+def parse_input(arg):
+	"""
+		Splits the command line argument into the name of the BOM and the number
+		of the assemblies.
+
+		arg:		"file" or "file:N";
+		return:		a tuple (file name, number of assemblies).
+
+		Raises ValueError if N is less than 1.
+	"""
+	match = COUNT_RE.match(arg)
+	if match:
+		count = int(match.group(2))
+		if count < 1:
+			raise ValueError("the number of assemblies must be positive: %s" % arg)
+		return match.group(1), count
+	return arg, 1
+
+def rollup(listInputs, fmt, dsc, parseJobs = 0, pipeline = False):
+	"""
+		Combines several BOMs into one table. Parts of the same type with equal
+		composed names are joined on the name and their quantities are summed,
+		every BOM contributing its quantity multiplied by the number of assemblies.
+		Every part gets a designator of its type numbered in the order the parts
+		first appear in the inputs, and the quantity in PartTable.amounts.
+
+		listInputs:	a list of (BOM file name, number of assemblies) tuples;
+		fmt:		FormatParser object;
+		dsc:		RefDesParser object;
+		parseJobs:	the number of processes parsing every BOM;
+		pipeline:	read every BOM ahead while the previous one is parsed;
+		return:		PartTable object for TexWriter.
+	"""
+	# (type, name parts) -> quantity, and the keys in the order of appearance
+	totals = {}
+	order = []
+	fileNames = [fileBom for fileBom, count in listInputs]
+	counts = [count for fileBom, count in listInputs]
+	if pipeline:
+		sources = prefetch_files(fileNames)
+	else:
+		sources = [(fileBom, None) for fileBom in fileNames]
+	# izip takes the files one by one, as they are converted
+	for (fileBom, source), count in izip(sources, counts):
+		bom = BomParser(fileBom, fmt.dictFormat, dsc.dictDescription, dictTemplate = fmt.dictTemplate,
+			jobs = parseJobs, source = source)
+		index = bom.data.index()
+		names = bom.data.names
+		for elemType in index.types:
+			for part, number, end in zip(index.parts[elemType], index.numbers[elemType], index.ends[elemType]):
+				# A span stands for all of its designators
+				amount = count * (int(end - number) + 1)
+				key = (elemType, names[part])
+				if key in totals:
+					totals[key] += amount
+				else:
+					totals[key] = amount
+					order.append(key)
+
+	table = PartTable()
+	table.amounts = {}
+	positions = {}
+	for elemType, name in order:
+		number = positions.get(elemType, 0) + 1
+		positions[elemType] = number
+		refdes = "%s%d" % (elemType, number)
+		table.add_designator(refdes, elemType, number, table.add_part(name))
+		table.amounts[refdes] = totals[(elemType, name)]
+	return table
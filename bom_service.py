@@ -0,0 +1,316 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import time
+import signal
+import socket
+import urlparse
+import threading
+import traceback
+import cStringIO
+import SocketServer
+import BaseHTTPServer
+import multiprocessing
+import bom_api
+from stage_profiler import profiler, STAGES
+
+# Worker processes used if -j is not given
+SERVICE_JOBS = 2
+# Requests waiting for a free worker above which new ones are rejected
+SERVICE_QUEUE = 16
+# Largest BOM accepted by the service, bytes
+SERVICE_MAX_BODY = 64 * 1024 * 1024
+# Upper bounds of the latency histogram buckets, seconds
+BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0]
+
+# The configuration shared by the worker processes, set up by the pool initializer
+_config = {}
+
+def _init_worker(fmt, dsc):
+	# Ctrl+C is handled by the main process only
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	_config["fmt"] = fmt
+	_config["dsc"] = dsc
+	profiler.instrument()
+	profiler.reset()
+
+def _convert_job(data, group, strings):
+	"""
+		Converts one BOM in a worker process.
+
+		data:		the content of the BOM file;
+		group:		grouping mode;
+		strings:	empty line period;
+		return:		a tuple (LaTeX document or None, error message or None, seconds,
+					profiler statistics).
+	"""
+	start = time.time()
+	text = None
+	error = None
+	try:
+		text = bom_api.convert(cStringIO.StringIO(data), _config["fmt"], _config["dsc"], group, strings)
+	except Exception:
+		error = traceback.format_exc().strip().splitlines()[-1]
+	return text, error, time.time() - start, profiler.collect()
+
+class Histogram:
+	"""
+		Cumulative histogram of latencies with fixed buckets.
+	"""
+	def __init__(self, buckets = BUCKETS):
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)
+		self.total = 0.0
+		self.count = 0
+
+	def add(self, value):
+		for index, bound in enumerate(self.buckets):
+			if value <= bound:
+				break
+		else:
+			index = len(self.buckets)
+		self.counts[index] += 1
+		self.total += value
+		self.count += 1
+
+	def render(self, name, labels = ""):
+		"""
+			Returns the lines of the histogram in the text exposition format.
+		"""
+		lines = []
+		prefix = labels + "," if labels else ""
+		cumulative = 0
+		for bound, count in zip(self.buckets, self.counts):
+			cumulative += count
+			lines.append('%s_bucket{%sle="%g"} %d' % (name, prefix, bound, cumulative))
+		lines.append('%s_bucket{%sle="+Inf"} %d' % (name, prefix, self.count))
+		suffix = "{%s}" % labels if labels else ""
+		lines.append('%s_sum%s %.6f' % (name, suffix, self.total))
+		lines.append('%s_count%s %d' % (name, suffix, self.count))
+		return lines
+
+class ServiceMetrics:
+	"""
+		Counters of the service, updated by the request threads.
+	"""
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.started = time.time()
+		self.requests = {"ok": 0, "error": 0, "rejected": 0}
+		self.inFlight = 0
+		self.queued = 0
+		self.rows = 0
+		self.cacheHits = 0
+		self.cacheMisses = 0
+		self.busy = 0.0
+		self.latency = Histogram()
+		self.stages = dict([(name, Histogram()) for name, description in STAGES])
+
+	def record(self, status, elapsed = None, stats = None):
+		with self.lock:
+			self.requests[status] += 1
+			if elapsed is not None:
+				self.latency.add(elapsed)
+				self.busy += elapsed
+			if stats is not None:
+				stages, rows, (hits, misses) = stats
+				self.rows += rows
+				self.cacheHits += hits
+				self.cacheMisses += misses
+				for stage, (seconds, calls) in stages.items():
+					if calls:
+						self.stages[stage].add(seconds)
+
+	def render(self):
+		"""
+			Returns the metrics in the plain text exposition format of Prometheus.
+		"""
+		with self.lock:
+			lines = ["# HELP bomparser_requests_total Conversion requests by result.",
+				"# TYPE bomparser_requests_total counter"]
+			for status in sorted(self.requests):
+				lines.append('bomparser_requests_total{status="%s"} %d' % (status, self.requests[status]))
+			lines.append("# HELP bomparser_queue_depth Requests waiting for a free worker.")
+			lines.append("# TYPE bomparser_queue_depth gauge")
+			lines.append("bomparser_queue_depth %d" % self.queued)
+			lines.append("# HELP bomparser_in_flight Requests being converted or waiting.")
+			lines.append("# TYPE bomparser_in_flight gauge")
+			lines.append("bomparser_in_flight %d" % self.inFlight)
+			lines.append("# HELP bomparser_rows_total BOM rows converted.")
+			lines.append("# TYPE bomparser_rows_total counter")
+			lines.append("bomparser_rows_total %d" % self.rows)
+			lines.append("# HELP bomparser_rows_per_second BOM rows converted per second of conversion time.")
+			lines.append("# TYPE bomparser_rows_per_second gauge")
+			lines.append("bomparser_rows_per_second %.1f" % (self.rows / self.busy if self.busy else 0.0))
+			lines.append("# HELP bomparser_render_cache_total Lookups of rendered names in the cache by result.")
+			lines.append("# TYPE bomparser_render_cache_total counter")
+			lines.append('bomparser_render_cache_total{result="hit"} %d' % self.cacheHits)
+			lines.append('bomparser_render_cache_total{result="miss"} %d' % self.cacheMisses)
+			lines.append("# HELP bomparser_request_seconds Conversion latency in the worker.")
+			lines.append("# TYPE bomparser_request_seconds histogram")
+			lines.extend(self.latency.render("bomparser_request_seconds"))
+			lines.append("# HELP bomparser_stage_seconds Latency of the conversion stages per request.")
+			lines.append("# TYPE bomparser_stage_seconds histogram")
+			for name, description in STAGES:
+				lines.extend(self.stages[name].render("bomparser_stage_seconds", 'stage="%s"' % name))
+			lines.append("# HELP bomparser_uptime_seconds Time since the start of the service.")
+			lines.append("# TYPE bomparser_uptime_seconds gauge")
+			lines.append("bomparser_uptime_seconds %.3f" % (time.time() - self.started))
+		return "\n".join(lines) + "\n"
+
+class ConversionService:
+	"""
+		Pool of worker processes with the configuration loaded and a bounded
+		queue in front of it. Requests exceeding the queue are rejected at once
+		instead of piling up.
+	"""
+	def __init__(self, fmt, dsc, jobs = SERVICE_JOBS, queueSize = SERVICE_QUEUE, maxBody = SERVICE_MAX_BODY):
+		self.jobs = jobs
+		self.maxBody = maxBody
+		self.metrics = ServiceMetrics()
+		self.slots = threading.BoundedSemaphore(jobs + queueSize)
+		self.pool = multiprocessing.Pool(jobs, _init_worker, (fmt, dsc))
+
+	def convert(self, data, group, strings):
+		"""
+			Converts the BOM in a worker process.
+
+			return:		a tuple (LaTeX document or None, error message or None);
+						(None, None) if the queue is full.
+		"""
+		if not self.slots.acquire(False):
+			self.metrics.record("rejected")
+			return None, None
+		try:
+			with self.metrics.lock:
+				self.metrics.inFlight += 1
+				self.metrics.queued = max(self.metrics.inFlight - self.jobs, 0)
+			text, error, elapsed, stats = self.pool.apply(_convert_job, (data, group, strings))
+		finally:
+			with self.metrics.lock:
+				self.metrics.inFlight -= 1
+				self.metrics.queued = max(self.metrics.inFlight - self.jobs, 0)
+			self.slots.release()
+		self.metrics.record("ok" if error is None else "error", elapsed, stats)
+		return text, error
+
+	def close(self):
+		self.pool.terminate()
+		self.pool.join()
+
+class ServiceHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	"""
+		POST /convert?group=flat&strings=0 with the BOM in the body returns the
+		LaTeX document, GET /metrics returns the metrics.
+	"""
+	def address_string(self):
+		# Clients of a Unix socket have no address
+		if isinstance(self.client_address, tuple):
+			return self.client_address[0]
+		return "unix"
+
+	def log_message(self, format, *args):
+		sys.stderr.write("%s - - [%s] %s\n" % (self.address_string(), self.log_date_time_string(), format % args))
+
+	def __reply(self, code, body, contentType = "text/plain; charset=utf-8", headers = ()):
+		self.send_response(code)
+		self.send_header("Content-Type", contentType)
+		self.send_header("Content-Length", str(len(body)))
+		for name, value in headers:
+			self.send_header(name, value)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self):
+		path = urlparse.urlparse(self.path).path
+		if path == "/metrics":
+			self.__reply(200, self.server.service.metrics.render(), "text/plain; version=0.0.4")
+		else:
+			self.__reply(404, "неизвестный адрес\n")
+
+	def do_POST(self):
+		url = urlparse.urlparse(self.path)
+		if url.path != "/convert":
+			self.__reply(404, "неизвестный адрес\n")
+			return
+		query = urlparse.parse_qs(url.query)
+		group = query.get("group", ["flat"])[-1]
+		try:
+			strings = int(query.get("strings", ["0"])[-1])
+		except ValueError:
+			strings = -1
+		if group not in ("none", "flat") or strings < 0:
+			self.__reply(400, "неверные параметры\n")
+			return
+		length = self.headers.getheader("Content-Length")
+		if length is None:
+			self.__reply(411, "не указана длина запроса\n")
+			return
+		try:
+			length = int(length)
+		except ValueError:
+			length = -1
+		if length < 0:
+			self.__reply(400, "неверная длина запроса\n")
+			return
+		if length > self.server.service.maxBody:
+			self.__reply(413, "слишком большой запрос\n")
+			return
+		data = self.rfile.read(length)
+		text, error = self.server.service.convert(data, group, strings)
+		if text is not None:
+			self.__reply(200, text, "application/x-tex; charset=utf-8")
+		elif error is not None:
+			self.__reply(422, error + "\n")
+		else:
+			self.__reply(503, "очередь заполнена\n", headers = [("Retry-After", "1")])
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+
+class ThreadingUnixHTTPServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+	daemon_threads = True
+
+	def server_bind(self):
+		if os.path.exists(self.server_address):
+			os.unlink(self.server_address)
+		SocketServer.UnixStreamServer.server_bind(self)
+		self.server_name = "localhost"
+		self.server_port = 0
+
+def serve(address, fmt, dsc, jobs = SERVICE_JOBS, queueSize = SERVICE_QUEUE, maxBody = SERVICE_MAX_BODY):
+	"""
+		Runs the conversion service until interrupted.
+
+		address:	"host:port" to listen on TCP, only local addresses make sense,
+					or "unix:path" to listen on a Unix socket;
+		fmt:		FormatParser object;
+		dsc:		RefDesParser object;
+		jobs:		the number of worker processes;
+		queueSize:	the number of requests which may wait for a worker;
+		maxBody:	the largest BOM accepted, bytes;
+		return:		none.
+	"""
+	service = ConversionService(fmt, dsc, jobs, queueSize, maxBody)
+	try:
+		if address.startswith("unix:"):
+			server = ThreadingUnixHTTPServer(address[5:], ServiceHandler)
+		else:
+			host, port = address.rsplit(":", 1)
+			server = ThreadingHTTPServer((host, int(port)), ServiceHandler)
+	except (ValueError, socket.error) as err:
+		service.close()
+		print "Невозможно открыть адрес %s: %s" % (address, err)
+		return
+	server.service = service
+	print "Служба запущена: %s. Для завершения нажмите Ctrl+C." % address
+	sys.stdout.flush()
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
+	service.close()
+	if address.startswith("unix:") and os.path.exists(address[5:]):
+		os.unlink(address[5:])
@@ -0,0 +1,142 @@
+# -*- coding: utf8 -*-
+
+import os
+import time
+import sqlite3
+import hashlib
+import cPickle
+from part_table import PartTable
+from tex_cache import config_digest, file_digest
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS boms (
+	id INTEGER PRIMARY KEY,
+	identity TEXT UNIQUE NOT NULL,
+	path TEXT NOT NULL,
+	stored REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS boms_path ON boms (path);
+CREATE TABLE IF NOT EXISTS parts (
+	bom INTEGER NOT NULL,
+	part INTEGER NOT NULL,
+	name TEXT NOT NULL,
+	parts BLOB NOT NULL,
+	PRIMARY KEY (bom, part)
+);
+CREATE INDEX IF NOT EXISTS parts_name ON parts (name);
+CREATE TABLE IF NOT EXISTS designators (
+	bom INTEGER NOT NULL,
+	refdes TEXT NOT NULL,
+	type TEXT NOT NULL,
+	number INTEGER NOT NULL,
+	part INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS designators_type ON designators (bom, type, number);
+CREATE INDEX IF NOT EXISTS designators_refdes ON designators (refdes);
+CREATE TABLE IF NOT EXISTS groups (
+	bom INTEGER NOT NULL,
+	seq INTEGER NOT NULL,
+	type TEXT NOT NULL,
+	part INTEGER NOT NULL,
+	refdes TEXT NOT NULL,
+	PRIMARY KEY (bom, seq)
+);
+CREATE INDEX IF NOT EXISTS groups_type ON groups (bom, type);
+"""
+
+def _text(value):
+	return value.decode("utf-8", "replace")
+
+class BomStore:
+	"""
+		SQLite database of parsed BOMs. A BOM is identified by the digest of its
+		content and of the configuration it was parsed with. For every BOM the
+		database keeps the composed names of its parts, the designators and the
+		groups of designators, indexed by the BOM and the element type, so the
+		BOM may be rendered again with other settings without parsing it.
+		Storing a new version of a BOM replaces the previous one of the same path.
+	"""
+	def __init__(self, fileName, dictFormat, dictDescription):
+		self.config = config_digest(dictFormat, dictDescription)
+		# Concurrent batch workers wait for each other's transactions
+		self.db = sqlite3.connect(fileName, timeout = 60)
+		self.db.text_factory = str
+		self.db.executescript(SCHEMA)
+
+	def close(self):
+		self.db.close()
+
+	def identity(self, fileBom):
+		"""
+			Computes the identity of the BOM parsed with the configuration of the store.
+		"""
+		digest = hashlib.sha1(self.config)
+		digest.update(file_digest(fileBom))
+		return digest.hexdigest()
+
+	def load(self, identity):
+		"""
+			Loads the BOM from the store.
+
+			identity:	the identity returned by identity();
+			return:		PartTable object with the groups set, or None if the BOM
+						is not stored.
+		"""
+		row = self.db.execute("SELECT id FROM boms WHERE identity = ?", (identity,)).fetchone()
+		if row is None:
+			return None
+		bomId = row[0]
+		table = PartTable()
+		for part, parts in self.db.execute("SELECT part, parts FROM parts WHERE bom = ? ORDER BY part", (bomId,)):
+			table.add_part(cPickle.loads(str(parts)))
+		for refdes, elemType, number, part in self.db.execute(
+				"SELECT refdes, type, number, part FROM designators WHERE bom = ? ORDER BY type, number", (bomId,)):
+			table.add_designator(refdes, intern(elemType), number, part)
+		table.groups = [refdes.split(',') for (refdes,) in self.db.execute(
+			"SELECT refdes FROM groups WHERE bom = ? ORDER BY seq", (bomId,))]
+		return table
+
+	def save(self, identity, fileBom, table, groups):
+		"""
+			Puts the parsed BOM to the store.
+
+			identity:	the identity returned by identity();
+			fileBom:	the name of the BOM file;
+			table:		PartTable object of the parsed BOM;
+			groups:		a list of groups of refdes as computed by TexWriter;
+			return:		none.
+		"""
+		path = os.path.abspath(fileBom)
+		with self.db:
+			for (bomId,) in self.db.execute("SELECT id FROM boms WHERE path = ? OR identity = ?", (path, identity)).fetchall():
+				for name in ("parts", "designators", "groups"):
+					self.db.execute("DELETE FROM %s WHERE bom = ?" % name, (bomId,))
+				self.db.execute("DELETE FROM boms WHERE id = ?", (bomId,))
+			bomId = self.db.execute("INSERT INTO boms (identity, path, stored) VALUES (?, ?, ?)",
+				(identity, path, time.time())).lastrowid
+			self.db.executemany("INSERT INTO parts VALUES (?, ?, ?, ?)",
+				[(bomId, part, _text(''.join(name)), sqlite3.Binary(cPickle.dumps(name, cPickle.HIGHEST_PROTOCOL)))
+				for part, name in enumerate(table.names)])
+			self.db.executemany("INSERT INTO designators VALUES (?, ?, ?, ?, ?)",
+				[(bomId, refdes, designator.type, designator.number, designator.part)
+				for refdes, designator in table.iter_designators()])
+			self.db.executemany("INSERT INTO groups VALUES (?, ?, ?, ?, ?)",
+				[(bomId, seq, table.lookup(group[0]).type, table.lookup(group[0]).part, ','.join(group))
+				for seq, group in enumerate(groups)])
+
+	def query(self, text):
+		"""
+			Looks up the parts whose names contain the text and the designators
+			equal to it across all stored BOMs.
+
+			text:		the text to look for;
+			return:		a list of (BOM path, refdes list, name) tuples.
+		"""
+		results = self.db.execute("""SELECT b.path, d.refdes, p.name FROM designators d
+			JOIN boms b ON b.id = d.bom JOIN parts p ON p.bom = d.bom AND p.part = d.part
+			WHERE d.refdes = ? ORDER BY b.path""", (text,)).fetchall()
+		pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+		results.extend(self.db.execute("""SELECT b.path, g.refdes, p.name FROM groups g
+			JOIN boms b ON b.id = g.bom JOIN parts p ON p.bom = g.bom AND p.part = g.part
+			WHERE p.name LIKE ? ESCAPE '\\' ORDER BY b.path, g.seq""", (_text(pattern),)).fetchall())
+		return [(path, refdes.split(','), name) for path, refdes, name in results]
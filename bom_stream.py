@@ -0,0 +1,184 @@
+# -*- coding: utf8 -*-
+
+import heapq
+import tempfile
+import cPickle
+from itertools import chain, islice
+from parser_bom import BomParser
+from tex_writer import TexWriter
+from part_table import PartTable
+
+# Number of entries sorted in memory before a run is spilled to disk
+RUN_SIZE = 100000
+# Number of records pickled at once to a spilled run
+RUN_BLOCK = 1000
+
+def sort_elements(sets, runSize = RUN_SIZE):
+	"""
+		Sorts a stream of designators by type and position number. Every entry
+		of the sets, a single designator or a span, makes one record; the records
+		are collected into runs of runSize entries, every run is sorted in memory
+		and, once there is more than one run, spilled to a temporary file. The
+		runs are merged back lazily and the spans are expanded while merging.
+		When a refdes appears several times the last one wins, as it does for
+		BomParser.data.
+
+		sets:		an iterable of (DesignatorSet, name parts) tuples;
+		runSize:	maximum number of entries kept in memory;
+		return:		a generator of (type, position, refdes, name parts) tuples.
+	"""
+	runs = []
+	records = []
+	seq = 0
+	for refdesSet, nameStr in sets:
+		# The type and the number were found by the parser, a span goes under
+		# the refdes of its first designator
+		for elemType, start, end, refdes in refdesSet.entries:
+			if refdes is None:
+				refdes = elemType + str(start)
+			records.append((elemType, start, refdes, seq, nameStr, end))
+			seq += 1
+		if len(records) >= runSize:
+			runs.append(_spill_run(records))
+			records = []
+	records.sort()
+	if runs:
+		runs.append(_spill_run(records))
+		records = None
+		merged = heapq.merge(*[_read_run(run) for run in runs])
+	else:
+		merged = iter(records)
+
+	# Duplicates are adjacent after sorting, the latest one goes last
+	prev = None
+	for record in _expand_spans(merged):
+		if prev is not None and prev[2] != record[2]:
+			yield prev[0], prev[1], prev[2], prev[4]
+		prev = record
+	if prev is not None:
+		yield prev[0], prev[1], prev[2], prev[4]
+
+def _expand_spans(records):
+	"""
+		Expands the spans of the sorted records. A span yields its first
+		designator in place, the following ones wait in a heap until the records
+		sorted after them come.
+
+		records:	a sorted iterable of (type, position, refdes, seq, name parts,
+					last position) tuples;
+		return:		a generator of the records of single designators in the same order.
+	"""
+	pending = []
+	for record in records:
+		while pending and pending[0] < record:
+			yield _next_designator(pending, heapq.heappop(pending))
+		if record[5] != record[1]:
+			_next_designator(pending, record)
+		yield record
+	while pending:
+		yield _next_designator(pending, heapq.heappop(pending))
+
+def _next_designator(pending, record):
+	"""
+		Puts the designator following the record of a span to the heap.
+
+		return:		the record.
+	"""
+	elemType, number = record[0], record[1] + 1
+	if number <= record[5]:
+		heapq.heappush(pending, (elemType, number, elemType + str(number), record[3], record[4], record[5]))
+	return record
+
+def _spill_run(records):
+	"""
+		Sorts the run and dumps it to an anonymous temporary file by blocks of
+		records.
+
+		records:	a list of records to spill;
+		return:		a file object positioned at the beginning of the run.
+	"""
+	records.sort()
+	run = tempfile.TemporaryFile()
+	for start in xrange(0, len(records), RUN_BLOCK):
+		cPickle.dump(records[start:start + RUN_BLOCK], run, cPickle.HIGHEST_PROTOCOL)
+	run.seek(0)
+	return run
+
+def _read_run(run):
+	"""
+		Reads records back from a spilled run and closes the file at the end.
+
+		run:		a file object returned by _spill_run;
+		return:		a generator of records.
+	"""
+	try:
+		while True:
+			for record in cPickle.load(run):
+				yield record
+	except EOFError:
+		pass
+	run.close()
+
+def group_elements(records, groupMode = "flat"):
+	"""
+		Combines sorted elements into groups. Neighbouring elements of the same type
+		with identical name parts fall into one group unless grouping is disabled.
+
+		records:	a sorted iterable of (type, position, refdes, name parts) tuples;
+		groupMode:	"flat" or "none", see TexWriter;
+		return:		a generator of (type, refdes list, name parts) tuples.
+	"""
+	group = None
+	for elemType, elemPos, refdes, nameStr in records:
+		if group is not None:
+			if groupMode != "none" and elemType == group[0] and nameStr == group[2]:
+				group[1].append(refdes)
+				continue
+			yield group
+		group = (elemType, [refdes], nameStr)
+	if group is not None:
+		yield group
+
+def mark_sections(groups):
+	"""
+		Finds out whether each type has more than one element, which is needed
+		to choose the plural form of the section header. It looks one group ahead only.
+
+		groups:		an iterable of (type, refdes list, name parts) tuples;
+		return:		a generator of (type, refdes list, name parts, plural) tuples.
+	"""
+	prev = None
+	plural = False
+	for elemType, refdes, nameStr in groups:
+		if prev is not None:
+			if elemType == prev[0]:
+				plural = True
+			yield prev[0], prev[1], prev[2], plural
+		if prev is None or elemType != prev[0]:
+			plural = len(refdes) > 1
+		prev = (elemType, refdes, nameStr)
+	if prev is not None:
+		yield prev[0], prev[1], prev[2], plural
+
+def write_stream(fileBom, settings, dictFormat, dictDescription, sink = None, source = None):
+	"""
+		Converts the BOM file to LaTeX document passing the elements through
+		parse, sort, group and write stages without loading the whole BOM.
+
+		fileBom:		the name of the BOM file;
+		settings:		the settings dictionary, as for TexWriter;
+		dictFormat:		format description from FormatParser;
+		dictDescription:	refdes descriptions from RefDesParser;
+		sink:			binary file-like object to write the document to instead of
+						settings["fileTex"];
+		source:			the input of the BOM file opened in advance, see BomParser;
+		return:			none.
+	"""
+	bom = BomParser(fileBom, dictFormat, dictDescription, stream = True, source = source)
+	records = sort_elements(bom.IterElementSets(), settings.get("runSize", RUN_SIZE))
+	groups = mark_sections(group_elements(records, settings["group"]))
+	# The sort reads the whole BOM before the first group comes, so a damaged
+	# file fails before the document is created
+	first = list(islice(groups, 1))
+	tex = TexWriter(settings, PartTable(), dictDescription)
+	tex.write_stream(chain(first, groups), sink)
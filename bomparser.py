@@ -2,36 +2,86 @@
 # -*- coding: utf8 -*-
 
 import os
-import re
 import sys
 import getopt
+import cProfile
 from parser_refdes import RefDesParser
 from parser_format import FormatParser
-from parser_bom import BomParser
-from tex_writer import TexWriter
+from converter import convert_file, convert_pipelined, convert_rollup, ROLLUP_FILE
+from bom_rollup import parse_input
+from batch import convert_batch
+from tex_cache import TexCache, CACHE_DIR
+from stage_profiler import profiler
+from watcher import BomWatcher, WATCH_JOBS
+from bom_service import serve, SERVICE_JOBS, SERVICE_QUEUE, SERVICE_MAX_BODY
+from bom_store import BomStore
+from bom_export import parse_formats, EMIT_SUFFIXES
+from compression import EXTENSIONS
 
 
 def PrintHelp():
 	print "НАЗВАНИЕ"
 	print "\tbomparser - сценарий для конвертации списка материалов (BOM) в перечень элементов.\n"
 	print "СИНТАКСИС"
-	print "\tbomparser [-f файл] [-d файл] [-g none | flat] [-s N]  файл\n"
+	print "\tbomparser [-f файл] [-d файл] [-g none | flat] [-s N] [-j N] [-p N] [-r N] [-o файл] [--emit форматы] [--compress gz | xz | bz2] [--stream | --incremental] [--pipeline] [--watch] [--rollup] [--serve адрес [--queue N] [--max-body N]] [--store файл [--query текст]] [--no-cache] [--cache-dir каталог] [--profile] [--profile-dump файл]  файл ...\n"
 	print "ОПИСАНИЕ"
 	print "bomparser преобразует список материалов (BOM), представленный в формате CSV, в перечень элементов в формате LaTeX в соответствии с правилами, заданными в файлах настроек. Файлы настроек (""description"" и ""format"") могут находиться в одном каталоге со сценарием, и в этом случае нет необходимости передавать их сценарию через параметры командной строки.\n"
 	print "\t-f, --format файл\n\t\tданный файл содержит фомат вывода элемента в перечне\n"
 	print "\t-d, --description файл\n\t\tданный файл содержит описания позиционных обозначений элементов\n"
 	print "\t-g, --group none | flat\n\t\tрежим группировки элементов. none - группировка не используется, перечень элементов будет содержать линейный список по одному элементу в строке; flat - группировать элементы в порядке возрастания номеров (используется по умолчанию).\n"
 	print "\t-s, --strings N\n\t\tгруппировка по строкам в перечне элементов. После каждых N строк будет вставлена одна пустая строка. По умолчанию пустые строки не вставляются.\n"
+	print "\t-o, --output файл\n\t\tимя результирующего файла. По умолчанию оно образуется из имени BOM заменой расширения на .tex. Если указан символ \"-\", перечень выводится в стандартный вывод, а все сообщения сценария - в стандартный поток ошибок. Используется только при обработке одного BOM.\n"
+	print "\t--emit форматы\n\t\tформаты результата через запятую: tex - перечень в формате LaTeX (используется по умолчанию), csv - таблица с типом, позиционными обозначениями, наименованием и количеством элементов каждой строки перечня, json - разделы перечня с элементами в формате JSON. BOM разбирается и группируется один раз для всех форматов. Имена файлов образуются из имени файла LaTeX заменой расширения .tex на %s и %s. В потоковом и инкрементальном режимах используется только формат tex.\n" % (EMIT_SUFFIXES["csv"], EMIT_SUFFIXES["json"])
+	print "\t--compress gz | xz | bz2\n\t\tсжимать результирующие файлы, имена которых образуются из имени BOM, к имени добавляется расширение .gz, .xz или .bz2. Файл, заданный параметром -o, сжимается, если его имя оканчивается одним из этих расширений. BOM, сжатые gzip, xz или bzip2, распознаются по содержимому и читаются без распаковки во временные файлы.\n"
+	print "\t-j, --jobs N\n\t\tпакетный режим. BOM обрабатываются параллельно в N процессах, для каждого файла выводятся результат и время обработки. Если хотя бы один файл не удалось обработать, сценарий завершается с ненулевым кодом.\n"
+	print "\t-p, --parse-jobs N\n\t\tразбирать BOM параллельно в N процессах. Файл делится на части по границам строк CSV, результаты объединяются в порядке строк файла, поэтому перечень не отличается от полученного без этого параметра. Используется для очень больших BOM, небольшие файлы разбираются в одном процессе. В пакетном режиме не используется.\n"
+	print "\t-r, --render-jobs N\n\t\tформировать разделы перечня (по одному на каждый тип элементов) параллельно в N процессах. Результат не отличается от полученного без этого параметра. В пакетном режиме не используется.\n"
+	print "\t--incremental\n\t\tинкрементальный режим. Рядом с результирующим файлом сохраняется состояние предыдущего преобразования, и заново формируются только те разделы перечня, элементы которых изменились. Сводка изменений выводится в стандартный вывод в формате JSON, остальные сообщения выводятся в стандартный поток ошибок.\n"
+	print "\t--pipeline\n\t\tсовмещать ввод и вывод с обработкой, например для файлов в сетевой файловой системе. BOM читается (и распаковывается) большими блоками в отдельном потоке, пока уже прочитанные строки разбираются, результирующие файлы записываются (и сжимаются) в отдельном потоке, пока формируется перечень. Если указано несколько BOM, следующий читается во время обработки текущего. Кэш в этом режиме не используется.\n"
+	print "\t--watch\n\t\tрежим отслеживания изменений. Вместо BOM указываются каталоги (по умолчанию текущий каталог), все файлы *.csv (в том числе сжатые *.csv.gz, *.csv.xz, *.csv.bz2) в них преобразуются, после чего сценарий продолжает работу и заново преобразует BOM, содержимое которых изменилось. При изменении файлов настроек они читаются заново и преобразуются все BOM. Преобразование выполняется в N процессах, заданных параметром -j (по умолчанию %d). Для завершения нажмите Ctrl+C.\n" % WATCH_JOBS
+	print "\t--rollup\n\t\tобъединить несколько BOM в один перечень. Одинаковые элементы (одного типа с одинаковым наименованием) объединяются, их количество суммируется. Если BOM указан в виде файл:N, количество его элементов умножается на N (количество сборок). Позиционные обозначения в таком перечне не выводятся. Результат записывается в файл, заданный параметром -o, по умолчанию %s.\n" % ROLLUP_FILE
+	print "\t--serve адрес\n\t\tзапустить службу преобразования. Адрес указывается в виде хост:порт (например, 127.0.0.1:8080) или unix:путь для сокета Unix. Файлы настроек читаются один раз, BOM передаётся запросом POST /convert?group=flat&strings=0, в ответ возвращается перечень. Преобразование выполняется в N процессах, заданных параметром -j (по умолчанию %d). Запрос GET /metrics возвращает метрики службы в текстовом формате Prometheus. Для завершения нажмите Ctrl+C.\n" % SERVICE_JOBS
+	print "\t--queue N\n\t\tколичество запросов службы, ожидающих свободного процесса. При заполнении очереди запросы отклоняются с кодом 503. По умолчанию %d.\n" % SERVICE_QUEUE
+	print "\t--max-body N\n\t\tнаибольший размер BOM в байтах, принимаемый службой. Запросы большего размера отклоняются с кодом 413. По умолчанию %d.\n" % SERVICE_MAX_BODY
+	print "\t--store файл\n\t\tсохранять разобранные BOM (наименования, позиционные обозначения и группы элементов) в базе данных SQLite. Если BOM с тем же содержимым и теми же файлами настроек уже сохранён, перечень формируется из базы данных без разбора BOM, например для других значений параметров -g и -s. Кэш в этом режиме не используется.\n"
+	print "\t--query текст\n\t\tнайти в базе данных, заданной параметром --store, элементы всех сохранённых BOM, позиционное обозначение которых равно тексту или наименование которых содержит его. BOM при этом не указываются.\n"
+	print "\t--no-cache\n\t\tне использовать кэш. По умолчанию результаты преобразования сохраняются в кэше, и если ни BOM, ни файлы настроек не изменились, BOM повторно не обрабатывается.\n"
+	print "\t--cache-dir каталог\n\t\tкаталог кэша. По умолчанию используется каталог %s в текущем каталоге.\n" % CACHE_DIR
+	print "\t--profile\n\t\tвывести после преобразования таблицу с количеством вызовов, временем и производительностью (строк BOM в секунду) основных этапов обработки.\n"
+	print "\t--profile-dump файл\n\t\tсохранить статистику cProfile основного процесса в файл для просмотра модулем pstats.\n"
+	print "\t--stream\n\t\tпотоковый режим. BOM не загружается в память целиком, элементы сортируются частями с использованием временных файлов. Используется для очень больших BOM.\n"
 
 def main(argv):
 	fileFormat = None
 	fileDescription = None
 	fileBom = None
+	# Number of the BOM files given which do not exist
+	missing = 0
 	settings = {"group":"flat"}
 	settings["strings"] = 0
+	settings["stream"] = False
+	settings["jobs"] = 0
+	settings["incremental"] = False
+	settings["pipeline"] = False
+	settings["cache"] = True
+	settings["cacheDir"] = CACHE_DIR
+	settings["profile"] = False
+	settings["profileDump"] = None
+	settings["output"] = None
+	settings["emit"] = ["tex"]
+	settings["compress"] = None
+	settings["parseJobs"] = 0
+	settings["renderJobs"] = 0
+	settings["watch"] = False
+	settings["serve"] = None
+	settings["rollup"] = False
+	settings["store"] = None
+	settings["query"] = None
+	settings["queue"] = SERVICE_QUEUE
+	settings["maxBody"] = SERVICE_MAX_BODY
 
 	try:
-		opts, args = getopt.getopt(argv, "hf:d:g:s:", ["help", "format=", "description=", "group=", "strings="])
+		opts, args = getopt.getopt(argv, "hf:d:g:s:j:o:p:r:", ["help", "format=", "description=", "group=", "strings=", "jobs=", "output=", "emit=", "compress=", "parse-jobs=", "render-jobs=", "stream", "incremental", "pipeline", "watch", "rollup", "store=", "query=", "serve=", "queue=", "max-body=", "no-cache", "cache-dir=", "profile", "profile-dump="])
 	except getopt.GetoptError as err:
 		print str(err)
 		PrintHelp()
@@ -52,6 +102,67 @@ def main(argv):
 				settings["strings"] = int(arg)
 			except:
 				settings["strings"] = 0
+		elif opt in ("-j", "--jobs"):
+			try:
+				settings["jobs"] = max(int(arg), 1)
+			except:
+				settings["jobs"] = 0
+		elif opt in ("-p", "--parse-jobs"):
+			try:
+				settings["parseJobs"] = max(int(arg), 1)
+			except:
+				settings["parseJobs"] = 0
+		elif opt in ("-r", "--render-jobs"):
+			try:
+				settings["renderJobs"] = max(int(arg), 1)
+			except:
+				settings["renderJobs"] = 0
+		elif opt in ("-o", "--output"):
+			settings["output"] = arg
+		elif opt == "--emit":
+			settings["emit"] = parse_formats(arg)
+			if settings["emit"] is None:
+				print "Неизвестный формат: %s. Допустимые форматы: tex, csv, json." % arg
+				sys.exit(2)
+		elif opt == "--compress":
+			if '.' + arg not in EXTENSIONS:
+				print "Неизвестный формат сжатия: %s. Допустимые форматы: gz, xz, bz2." % arg
+				sys.exit(2)
+			settings["compress"] = arg
+		elif opt == "--stream":
+			settings["stream"] = True
+		elif opt == "--incremental":
+			settings["incremental"] = True
+		elif opt == "--pipeline":
+			settings["pipeline"] = True
+		elif opt == "--watch":
+			settings["watch"] = True
+		elif opt == "--store":
+			settings["store"] = arg
+		elif opt == "--query":
+			settings["query"] = arg
+		elif opt == "--rollup":
+			settings["rollup"] = True
+		elif opt == "--serve":
+			settings["serve"] = arg
+		elif opt == "--queue":
+			try:
+				settings["queue"] = max(int(arg), 0)
+			except:
+				settings["queue"] = SERVICE_QUEUE
+		elif opt == "--max-body":
+			try:
+				settings["maxBody"] = max(int(arg), 0)
+			except:
+				settings["maxBody"] = SERVICE_MAX_BODY
+		elif opt == "--no-cache":
+			settings["cache"] = False
+		elif opt == "--cache-dir":
+			settings["cacheDir"] = arg
+		elif opt == "--profile":
+			settings["profile"] = True
+		elif opt == "--profile-dump":
+			settings["profileDump"] = arg
 
 	if fileFormat == None:
 		if os.access("format", os.F_OK):
@@ -65,14 +176,48 @@ def main(argv):
 		else:
 			print "Не указан файл, содержащий описания элементов."
 			sys.exit()
-	if args:
+	if settings["query"] is not None:
+		if not settings["store"]:
+			print "Не указана база данных (параметр --store)."
+			sys.exit(2)
+		fileBom = []
+	elif settings["serve"]:
+		fileBom = []
+	elif settings["watch"]:
+		fileBom = args or ["."]
+		for elem in fileBom:
+			if not os.path.isdir(elem):
+				print "Каталог %s не существует." % elem
+				sys.exit(2)
+		if settings["output"]:
+			print "Имя результирующего файла не может быть указано в режиме отслеживания изменений."
+			sys.exit(2)
+	elif settings["rollup"]:
+		fileBom = []
+		for elem in args:
+			try:
+				fileBom.append(parse_input(elem))
+			except ValueError:
+				print "Неверное количество сборок: %s." % elem
+				sys.exit(2)
+		for elem, count in fileBom:
+			if not os.access(elem, os.F_OK):
+				print "Невозможно открыть указанный BOM: %s." % elem
+				sys.exit(2)
+		if not fileBom:
+			PrintHelp()
+			sys.exit()
+	elif args:
 		fileBom = []
 		for elem in args:
 			if os.access(elem, os.F_OK):
 				fileBom.append(elem)
+			else:
+				# The file is counted as failed to convert
+				print "Невозможно открыть указанный BOM: %s." % elem
+				missing += 1
 		if not fileBom:
-			print "Невозможно открыть указанный BOM."
-			sys.exit()
+			sys.exit(1)
 	else:
 		if os.access("bom", os.F_OK) == True:
 			fileBom = ["bom"]
@@ -83,6 +228,37 @@ def main(argv):
 	settings["fileDescription"]	= fileDescription
 	settings["fileBom"]			= fileBom
 
+	if settings["emit"] != ["tex"] and (settings["stream"] or settings["incremental"]):
+		print "В потоковом и инкрементальном режимах используется только формат tex."
+		sys.exit(2)
+	sink = None
+	if settings["output"]:
+		if len(fileBom) > 1 and not settings["rollup"]:
+			print "Имя результирующего файла может быть указано только для одного BOM."
+			sys.exit(2)
+		if settings["output"] == "-":
+			if settings["incremental"]:
+				print "Инкрементальный режим невозможен при выводе в стандартный вывод."
+				sys.exit(2)
+			if len(settings["emit"]) > 1:
+				print "В стандартный вывод может быть выведен только один формат."
+				sys.exit(2)
+			# The document goes to the standard output, messages to the standard error
+			sink = sys.stdout
+			sys.stdout = sys.stderr
+			settings["jobs"] = 0
+	if settings["incremental"]:
+		# Only the summaries go to the standard output, so it may be read as JSON
+		settings["summary"] = sys.stdout
+		sys.stdout = sys.stderr
+
+	if settings["profile"]:
+		profiler.instrument()
+	profile = None
+	if settings["profileDump"]:
+		profile = cProfile.Profile()
+		profile.enable()
+
 	fmt = FormatParser(settings["fileFormat"])
 	if not fmt.dictFormat:
 		print "Не удалось прочитать файл, содержаший формат описания наименования элементов."
@@ -91,14 +267,40 @@ def main(argv):
 	if not dsc.dictDescription:
 		print "Не удалось прочитать файл, содержащий описания элементов."
 		sys.exit()
-	for elem in settings["fileBom"]:
-		bom = BomParser(elem, fmt.dictFormat, dsc.dictDescription)
-		fileTex = []
-		fileTex = re.sub('\.[a-z]*', '', elem)
-		fileTex = '.'.join([fileTex, 'tex'])
-		settings["fileTex"] = fileTex
-		tex = TexWriter(settings, bom.data, dsc.dictDescription)
-		tex.write_file()
+	cache = None
+	# Computing the key of the cache would take one more reading of every BOM
+	if settings["cache"] and not settings["pipeline"]:
+		cache = TexCache(fmt.dictFormat, dsc.dictDescription, settings["cacheDir"])
+	failed = missing
+	if settings["query"] is not None:
+		store = BomStore(settings["store"], fmt.dictFormat, dsc.dictDescription)
+		results = store.query(settings["query"])
+		store.close()
+		for path, refdes, name in results:
+			print "%s\t%s\t%s" % (path, ', '.join(refdes), name)
+		if not results:
+			print "Ничего не найдено."
+	elif settings["serve"]:
+		serve(settings["serve"], fmt, dsc, settings["jobs"] or SERVICE_JOBS, settings["queue"], settings["maxBody"])
+	elif settings["rollup"]:
+		convert_rollup(settings["fileBom"], settings, fmt, dsc, sink)
+	elif settings["watch"]:
+		BomWatcher(settings["fileBom"], settings, fmt, dsc, settings["jobs"] or WATCH_JOBS).run()
+	elif settings["jobs"]:
+		failed += convert_batch(settings["fileBom"], settings, fmt, dsc, settings["jobs"], cache)
+	elif settings["pipeline"]:
+		convert_pipelined(settings["fileBom"], settings, fmt, dsc, sink)
+	else:
+		for elem in settings["fileBom"]:
+			convert_file(elem, settings, fmt, dsc, cache, sink)
+
+	if profile is not None:
+		profile.disable()
+		profile.dump_stats(settings["profileDump"])
+	if settings["profile"]:
+		profiler.report()
+	if failed:
+		sys.exit(1)
 
 if __name__ == "__main__":
 	main(sys.argv[1:])
@@ -0,0 +1,258 @@
+# -*- coding: utf8 -*-
+
+import os
+import bz2
+import zlib
+import cStringIO
+import subprocess
+try:
+	import lzma
+except ImportError:
+	# Python 2 has no lzma module, the xz program is used instead
+	try:
+		from backports import lzma
+	except ImportError:
+		lzma = None
+
+# Signatures at the start of compressed files: (magic bytes, format)
+MAGIC = [
+	("\x1f\x8b", "gz"),
+	("\xfd7zXZ\x00", "xz"),
+	("BZh", "bz2"),
+]
+# Extensions of compressed files and their formats
+EXTENSIONS = {
+	".gz": "gz",
+	".xz": "xz",
+	".bz2": "bz2",
+}
+# Amount of compressed data read at once
+READ_SIZE = 256 * 1024
+
+def detect(fileName):
+	"""
+		Detects the compression of the file by its first bytes.
+
+		fileName:	the name of the file;
+		return:		"gz", "xz", "bz2" or None for a plain file.
+	"""
+	f = open(fileName, 'rb')
+	head = f.read(8)
+	f.close()
+	for magic, fmt in MAGIC:
+		if head.startswith(magic):
+			return fmt
+	return None
+
+def split_extension(fileName):
+	"""
+		Splits the extension of a compressed file off the name.
+
+		fileName:	the name of the file, e.g. "board.csv.gz";
+		return:		a tuple (name without the extension, format or None), e.g.
+					("board.csv", "gz").
+	"""
+	base, extension = os.path.splitext(fileName)
+	fmt = EXTENSIONS.get(extension.lower())
+	if fmt is None:
+		return fileName, None
+	return base, fmt
+
+def _decompressor(fmt):
+	if fmt == "gz":
+		# Expect the gzip header
+		return zlib.decompressobj(16 + zlib.MAX_WBITS)
+	if fmt == "bz2":
+		return bz2.BZ2Decompressor()
+	return lzma.LZMADecompressor()
+
+def _stream_ended(decompressor):
+	"""
+		Tells whether the decompressor has reached the end of its stream. The
+		decompressors of Python 2 have no eof attribute: a copy of the zlib one
+		is fed with a byte, which is left unused after the end of the stream,
+		and the bz2 one refuses any data after the end.
+	"""
+	if hasattr(decompressor, "eof"):
+		return decompressor.eof
+	if isinstance(decompressor, bz2.BZ2Decompressor):
+		try:
+			decompressor.decompress('')
+		except EOFError:
+			return True
+		return False
+	probe = decompressor.copy()
+	try:
+		probe.decompress('\0')
+	except zlib.error:
+		return False
+	return probe.unused_data == '\0'
+
+def _compressor(fmt):
+	if fmt == "gz":
+		return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+	if fmt == "bz2":
+		return bz2.BZ2Compressor()
+	return lzma.LZMACompressor()
+
+class DecompressedFile:
+	"""
+		Read-only file decompressed on the fly block by block, nothing is written
+		to the disk. Iteration yields the lines as of a file opened in binary mode,
+		so the object may be passed to csv.reader. Files of several concatenated
+		streams, as produced by "cat a.gz b.gz", are read whole. A damaged or
+		truncated file raises IOError.
+	"""
+	def __init__(self, fileName, fmt):
+		self.fmt = fmt
+		self.process = None
+		if fmt == "xz" and lzma is None:
+			try:
+				self.process = subprocess.Popen(["xz", "-dc", fileName], stdout = subprocess.PIPE)
+			except OSError:
+				raise IOError("xz is not supported: neither the lzma module nor the xz program is found")
+			self.file = self.process.stdout
+		else:
+			self.file = open(fileName, 'rb')
+
+	def blocks(self):
+		"""
+			Yields the decompressed data by blocks.
+		"""
+		if self.process is not None:
+			while True:
+				block = self.file.read(READ_SIZE)
+				if not block:
+					break
+				yield block
+			if self.process.wait() != 0:
+				raise IOError("xz: the file is damaged")
+			return
+		decompressor = _decompressor(self.fmt)
+		while True:
+			data = self.file.read(READ_SIZE)
+			if not data:
+				break
+			while data:
+				try:
+					block = decompressor.decompress(data)
+				except EOFError:
+					# The previous stream ended right at the end of the data read
+					decompressor = _decompressor(self.fmt)
+					continue
+				except zlib.error as err:
+					raise IOError("%s: the file is damaged: %s" % (self.fmt, err))
+				yield block
+				data = decompressor.unused_data
+				if data:
+					# The next stream starts right after the end of the previous one
+					decompressor = _decompressor(self.fmt)
+		if not _stream_ended(decompressor):
+			raise IOError("%s: the file is truncated" % self.fmt)
+
+	def __iter__(self):
+		return iter_lines(self.blocks())
+
+	def read(self):
+		"""
+			Reads the whole decompressed content.
+		"""
+		return ''.join(self.blocks())
+
+	def close(self):
+		self.file.close()
+		if self.process is not None:
+			self.process.wait()
+
+class CompressedFile:
+	"""
+		Write-only file compressed on the fly, used as a sink of OutputBuffer.
+	"""
+	def __init__(self, fileName, fmt):
+		self.process = None
+		self.compressor = None
+		self.file = open(fileName, 'wb')
+		if fmt == "xz" and lzma is None:
+			try:
+				self.process = subprocess.Popen(["xz", "-c"], stdin = subprocess.PIPE, stdout = self.file)
+			except OSError:
+				self.file.close()
+				raise IOError("xz is not supported: neither the lzma module nor the xz program is found")
+		else:
+			self.compressor = _compressor(fmt)
+
+	def write(self, data):
+		if self.process is not None:
+			self.process.stdin.write(data)
+		else:
+			self.file.write(self.compressor.compress(data))
+
+	def flush(self):
+		# Flushing the compressor would worsen the compression, the data is
+		# complete only after close()
+		pass
+
+	def close(self):
+		if self.process is not None:
+			self.process.stdin.close()
+			self.process.wait()
+		else:
+			self.file.write(self.compressor.flush())
+		self.file.close()
+
+def iter_lines(blocks):
+	"""
+		Splits the data read by blocks into lines.
+
+		blocks:		an iterable of strings;
+		return:		a generator of lines as of a file opened in binary mode.
+	"""
+	pending = ''
+	for block in blocks:
+		block = pending + block
+		end = block.rfind('\n') + 1
+		pending = block[end:]
+		for line in cStringIO.StringIO(block[:end]):
+			yield line
+	if pending:
+		yield pending
+
+def read_blocks(fileName, blockSize = READ_SIZE):
+	"""
+		Reads the file by blocks, decompressing it if it is compressed.
+
+		fileName:	the name of the file;
+		blockSize:	the size of the blocks of a plain file;
+		return:		a generator of strings.
+	"""
+	fmt = detect(fileName)
+	if fmt is None:
+		f = open(fileName, 'rb')
+		try:
+			while True:
+				block = f.read(blockSize)
+				if not block:
+					break
+				yield block
+		finally:
+			f.close()
+		return
+	f = DecompressedFile(fileName, fmt)
+	try:
+		for block in f.blocks():
+			yield block
+	finally:
+		f.close()
+
+def open_input(fileName):
+	"""
+		Opens the file for reading in binary mode, decompressing it if it is
+		compressed.
+
+		fileName:	the name of the file;
+		return:		a file object or DecompressedFile object.
+	"""
+	fmt = detect(fileName)
+	if fmt is None:
+		return open(fileName, 'rb')
+	return DecompressedFile(fileName, fmt)
@@ -0,0 +1,141 @@
+# -*- coding: utf8 -*-
+
+import os
+from parser_bom import BomParser
+from tex_writer import TexWriter
+from bom_stream import write_stream
+from tex_diff import write_incremental, print_summary
+from bom_rollup import rollup
+from bom_store import BomStore
+from bom_export import write_outputs
+from compression import split_extension
+from io_pipeline import prefetch_files
+
+# The name of the combined document if -o is not given
+ROLLUP_FILE = "rollup.tex"
+
+def tex_file_name(fileBom, compress = None):
+	"""
+		Derives the name of the resulting LaTeX file from the name of the BOM,
+		only the extension of the file name is replaced: board.csv.gz gives board.tex.
+
+		fileBom:	the name of the BOM file;
+		compress:	the compression of the LaTeX file, "gz", "xz", "bz2" or None;
+		return:		the name of the LaTeX file.
+	"""
+	fileTex = os.path.splitext(split_extension(fileBom)[0])[0] + '.tex'
+	if compress:
+		fileTex = '.'.join([fileTex, compress])
+	return fileTex
+
+def convert_file(fileBom, settings, fmt, dsc, cache = None, sink = None, source = None):
+	"""
+		Converts a single BOM file to LaTeX document.
+
+		fileBom:	the name of the BOM file;
+		settings:	the settings dictionary, it is not modified;
+		fmt:		FormatParser object;
+		dsc:		RefDesParser object;
+		cache:		TexCache object or None, on cache hit the BOM is not parsed at all;
+		sink:		binary file-like object to write the document to, e.g. the
+					standard output; no file is created then;
+		source:		the input of the BOM file opened in advance, see BomParser;
+					it is closed in any case;
+		return:		the names of the files written, separated by commas.
+	"""
+	try:
+		return _convert_file(fileBom, settings, fmt, dsc, cache, sink, source)
+	finally:
+		if source is not None:
+			source.close()
+
+def _convert_file(fileBom, settings, fmt, dsc, cache, sink, source):
+	settings = dict(settings)
+	formats = settings.get("emit") or ["tex"]
+	if sink is not None:
+		settings["fileTex"] = "-"
+	elif settings.get("output"):
+		settings["fileTex"] = settings["output"]
+	else:
+		settings["fileTex"] = tex_file_name(fileBom, settings.get("compress"))
+	if settings.get("incremental"):
+		# The document is patched in place, the cache is of no use here
+		summary = write_incremental(fileBom, settings, fmt.dictFormat, dsc.dictDescription, fmt.dictTemplate, source)
+		print_summary(summary, settings.get("summary"))
+		return settings["fileTex"]
+	if formats != ["tex"]:
+		# The cache keeps LaTeX documents only
+		cache = None
+	elif settings.get("store"):
+		# A document taken from the cache would leave the BOM out of the store
+		cache = None
+	if cache is not None:
+		key = cache.key(fileBom, settings)
+		if cache.fetch(key, settings["fileTex"], sink):
+			return settings["fileTex"]
+	names = [settings["fileTex"]]
+	if settings["stream"]:
+		write_stream(fileBom, settings, fmt.dictFormat, dsc.dictDescription, sink, source)
+	else:
+		store = None
+		table = None
+		if settings.get("store"):
+			# A BOM stored before is rendered without parsing
+			store = BomStore(settings["store"], fmt.dictFormat, dsc.dictDescription)
+			identity = store.identity(fileBom)
+			table = store.load(identity)
+		if table is None:
+			bom = BomParser(fileBom, fmt.dictFormat, dsc.dictDescription, dictTemplate = fmt.dictTemplate,
+				jobs = settings.get("parseJobs", 0), source = source)
+			table = bom.data
+		tex = TexWriter(settings, table, dsc.dictDescription)
+		if store is not None:
+			if table.groups is None:
+				store.save(identity, fileBom, table, tex.groupedKeys)
+			store.close()
+		# All formats are written from the same grouped elements
+		names = write_outputs(tex, formats, sink, settings.get("renderJobs", 0))
+	# Only documents written to files are put into the cache
+	if cache is not None and sink is None:
+		cache.store(key, settings["fileTex"])
+	return ', '.join(names)
+
+def convert_pipelined(listBom, settings, fmt, dsc, sink = None):
+	"""
+		Converts the BOM files one after another overlapping the input and the
+		output with the work: every file is read ahead by a thread, the next one
+		while the current one is converted, and the documents are written by
+		threads as well. The cache is not used, its key would take one more
+		reading of every BOM.
+
+		listBom:	a list of BOM file names;
+		settings:	the settings dictionary, it is not modified;
+		fmt:		FormatParser object;
+		dsc:		RefDesParser object;
+		sink:		binary file-like object to write the only document to;
+		return:		none.
+	"""
+	settings = dict(settings)
+	settings["pipeline"] = True
+	for fileBom, source in prefetch_files(listBom):
+		convert_file(fileBom, settings, fmt, dsc, None, sink, source)
+
+def convert_rollup(listInputs, settings, fmt, dsc, sink = None):
+	"""
+		Combines several BOMs into a single LaTeX document, see bom_rollup.rollup().
+
+		listInputs:	a list of (BOM file name, number of assemblies) tuples;
+		settings:	the settings dictionary, it is not modified;
+		fmt:		FormatParser object;
+		dsc:		RefDesParser object;
+		sink:		binary file-like object to write the document to;
+		return:		the names of the files written, separated by commas.
+	"""
+	settings = dict(settings)
+	if sink is not None:
+		settings["fileTex"] = "-"
+	else:
+		settings["fileTex"] = settings.get("output") or tex_file_name(ROLLUP_FILE, settings.get("compress"))
+	table = rollup(listInputs, fmt, dsc, settings.get("parseJobs", 0), settings.get("pipeline", False))
+	tex = TexWriter(settings, table, dsc.dictDescription)
+	return ', '.join(write_outputs(tex, settings.get("emit") or ["tex"], sink))
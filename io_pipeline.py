@@ -0,0 +1,153 @@
+# -*- coding: utf8 -*-
+
+import sys
+import Queue
+import threading
+from compression import read_blocks, iter_lines
+
+# Amount of data read from the input at once
+BLOCK_SIZE = 1 << 20
+# Number of blocks waiting in a queue between a thread and the conversion
+QUEUE_DEPTH = 8
+
+def _raise(error):
+	raise error[0], error[1], error[2]
+
+class PrefetchedFile:
+	"""
+		Read-only input read ahead by a background thread. The thread reads the
+		file in large blocks, decompressing it if it is compressed, and puts them
+		to a bounded queue, so the file is being read while the lines taken
+		before are parsed. Iteration yields the lines as of a file opened in
+		binary mode. Errors of reading are raised by the iteration.
+	"""
+	def __init__(self, fileName, blockSize = BLOCK_SIZE, depth = QUEUE_DEPTH):
+		self.fileName = fileName
+		self.queue = Queue.Queue(depth)
+		self.closed = False
+		self.thread = threading.Thread(target = self.__run, args = (blockSize,))
+		# The thread never keeps the process running
+		self.thread.daemon = True
+		self.thread.start()
+
+	def __run(self, blockSize):
+		"""
+			Reads the file to the queue. The queue ends with None or with the
+			exception info if reading failed.
+		"""
+		blocks = read_blocks(self.fileName, blockSize)
+		try:
+			for block in blocks:
+				self.queue.put(block)
+				if self.closed:
+					return
+		except Exception:
+			self.queue.put(sys.exc_info())
+			return
+		finally:
+			blocks.close()
+		self.queue.put(None)
+
+	def blocks(self):
+		"""
+			Yields the blocks read by the thread.
+		"""
+		while True:
+			block = self.queue.get()
+			if block is None:
+				return
+			if isinstance(block, tuple):
+				_raise(block)
+			yield block
+
+	def __iter__(self):
+		return iter_lines(self.blocks())
+
+	def read(self):
+		"""
+			Reads the whole content.
+		"""
+		return ''.join(self.blocks())
+
+	def close(self):
+		"""
+			Stops reading. The queue is emptied, so the thread waiting for a place
+			in it sees the request.
+		"""
+		self.closed = True
+		while self.thread.is_alive():
+			try:
+				self.queue.get(timeout = 0.1)
+			except Queue.Empty:
+				pass
+
+def prefetch_files(fileNames):
+	"""
+		Opens the files for reading ahead one after another, the next file is
+		being read while the current one is processed. The files not processed
+		are closed when the generator is closed.
+
+		fileNames:	a list of file names;
+		return:		a generator of (file name, PrefetchedFile) tuples.
+	"""
+	sources = []
+	try:
+		for index, fileName in enumerate(fileNames):
+			if not sources:
+				sources.append(PrefetchedFile(fileName))
+			if index + 1 < len(fileNames):
+				sources.append(PrefetchedFile(fileNames[index + 1]))
+			yield fileName, sources[index]
+	finally:
+		for source in sources:
+			source.close()
+
+class BackgroundWriter:
+	"""
+		Write-only file written by a background thread, used as a sink of
+		OutputBuffer. write() puts the data to a bounded queue and returns at
+		once unless the queue is full, so the document is rendered while the
+		data written before is being sent to the file. Errors of writing are
+		raised by the next write() or by close().
+	"""
+	def __init__(self, target, depth = QUEUE_DEPTH):
+		self.target = target
+		self.queue = Queue.Queue(depth)
+		self.error = None
+		self.thread = threading.Thread(target = self.__run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def __run(self):
+		while True:
+			data = self.queue.get()
+			if data is None:
+				break
+			# The rest of the data is dropped after an error
+			if self.error is None:
+				try:
+					self.target.write(data)
+				except Exception:
+					self.error = sys.exc_info()
+
+	def __check(self):
+		if self.error is not None:
+			error, self.error = self.error, None
+			_raise(error)
+
+	def write(self, data):
+		self.__check()
+		self.queue.put(data)
+
+	def flush(self):
+		# The data is complete only after close()
+		pass
+
+	def close(self):
+		"""
+			Waits until all data is written and closes the file.
+		"""
+		self.queue.put(None)
+		self.thread.join()
+		self.target.close()
+		self.__check()
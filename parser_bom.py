@@ -1,16 +1,39 @@
 # -*- coding: utf8 -*-
 
-import re
 import csv
+from part_table import PartTable, TYPE_RE, parse_range, parse_designators
+from parser_format import compile_format
+from bom_chunks import parse_chunks
+from compression import open_input
 
 class BomParser:
-	def __init__(self, fileBom, dictFormat, dictDescription):
+	"""
+		Parses the BOM. fileBom is the name of the CSV file, which may be
+		compressed with gzip, xz or bzip2, a file-like object
+		with CSV data in UTF-8 or an iterable of rows already split into fields,
+		the first row being the header. source is the input of the file fileBom
+		opened in advance, e.g. PrefetchedFile already reading it.
+	"""
+	def __init__(self, fileBom, dictFormat, dictDescription, stream = False, dictTemplate = None, jobs = 0,
+			source = None):
 		self.dictFmt = dictFormat
+		# Format strings compiled by FormatParser, compile them here if not given
+		if dictTemplate is None:
+			dictTemplate = compile_format(dictFormat)
+		self.dictTpl = dictTemplate
 		self.dictDsc = dictDescription
 		self.fileBom = fileBom
-		self.data = {}
+		self.source = source
+		self.data = PartTable()
 		self.exceptions = []
-		self.ParseData()
+		# Number of processes parsing parts of the file, 0 or 1 to parse it serially
+		self.jobs = jobs
+		# Print the messages about the elements without format and duplicates
+		self.verbose = True
+		# In streaming mode the data is not collected, the caller is expected to
+		# consume IterElements() instead
+		if not stream:
+			self.ParseData()
 
 	def __create_converter(self, fields):
 		"""
@@ -37,37 +60,23 @@ class BomParser:
 			return:		a string containing the type of element.
 		"""
 		element = elem.split(',')[0]
-		element = re.sub('[0-9]', '', element)
+		if '-' in element or '..' in element:
+			span = parse_range(element.strip())
+			if span is not None:
+				# The numbers of both ends of the range are removed
+				return span[0]
+		element = TYPE_RE.sub('', element)
 		return element
 
 	def __get_refdes(self, refdes):
 		"""
-			Splits the refdef string into separate elements.
+			Splits the refdef string into separate elements. Ranges such as R1-R400
+			are kept as spans.
 
-			refdes:		string containing comma separated refdefs;
-			return:		a list of refdefs.
+			refdes:		string containing comma separated refdefs and ranges;
+			return:		DesignatorSet object.
 		"""
-		elements = refdes.split(',')
-		elements = [elem.strip() for elem in elements]
-		return elements
-
-	def __compose_name_str(self, listFormat, dictConverter):
-		"""
-			Composes the name string from its format string and the mapping given.
-
-			listFormat:	a list of fields wich should compose the name string;
-			dictConverter:	mapping dictionary.
-			return:		a list of composed elements.
-		"""
-		name = []
-		for elem in listFormat:
-			if elem in dictConverter.keys():
-				value = dictConverter[elem]
-				if value is not None and len(value) > 0:
-					name.append(value)
-			else:
-				name.append(elem)
-		return name
+		return parse_designators(refdes)
 
 	def __dump_data(self):
 		"""
@@ -78,9 +87,9 @@ class BomParser:
 		"""
 		f = open("dump", 'w')
 		name = []
-		for key, value in self.data.items():
-			for elem in value:
-				name.append(''.join(elem))
+		for key in self.data.keys():
+			name.append(''.join(self.data.name(key)))
+			name.append('1')
 			name.insert(0, key)
 			name.append("\n")
 			f.write(' '.join(name))
@@ -88,27 +97,107 @@ class BomParser:
 		f.close()
 
 	def ParseData(self):
-		csvfile = open(self.fileBom, 'rb')
-		reader = csv.DictReader(csvfile)
-		converter = self.__create_converter(reader.fieldnames)
-		for line in reader:
-			field = converter[self.dictFmt["RefDes"]]
-			elemRefDes = line[field]
-			field = converter[self.dictFmt["Quantity"]]
-			elemQuantity = line[field]
+		# Only a file on disk can be split into parts
+		if self.jobs < 2 or not isinstance(self.fileBom, basestring) or not parse_chunks(self, self.jobs):
+			# All refdes of a row share the same name list, so the part lookup
+			# is done once per row
+			for refdesSet, nameStr in self.IterElementSets():
+				self.data.add_set(refdesSet, self.data.add_part(nameStr))
+		if self.source is not None:
+			# The parts of the file were read by the processes
+			self.source.close()
+			self.source = None
+		if self.data.duplicates and self.verbose:
+			print "Позиционные обозначения встречаются в BOM несколько раз:", ', '.join(self.data.duplicates)
+		# Build the designator index once the table is complete
+		self.data.index()
+
+	def IterElements(self):
+		"""
+			Reads the BOM file row by row and yields its elements one at a time.
+
+			input:		none;
+			return:		a generator of (refdes, name parts) tuples in the order of the BOM file.
+		"""
+		for refdesSet, nameStr in self.IterElementSets():
+			for refdes in refdesSet:
+				yield refdes, nameStr
+
+	def IterElementSets(self):
+		"""
+			Reads the BOM file row by row and yields the designators of every row
+			at once, ranges are not expanded.
+
+			input:		none;
+			return:		a generator of (DesignatorSet, name parts) tuples in the order of the BOM file.
+		"""
+		csvfile = None
+		if self.source is not None:
+			# The input is used once
+			csvfile, self.source = self.source, None
+			reader = csv.reader(csvfile)
+		elif isinstance(self.fileBom, basestring):
+			# Compressed files are decompressed while being read
+			csvfile = open_input(self.fileBom)
+			reader = csv.reader(csvfile)
+		elif hasattr(self.fileBom, "read"):
+			reader = csv.reader(self.fileBom)
+		else:
+			reader = iter(self.fileBom)
+		fieldnames = reader.next()
+		for element in self.IterSets(reader, fieldnames):
+			yield element
+		if csvfile is not None:
+			csvfile.close()
+
+	def IterRows(self, reader, fieldnames):
+		"""
+			Yields the elements of the BOM rows following the header.
+
+			reader:		an iterator of rows split into fields, e.g. csv.reader;
+			fieldnames:	a list of field names from the header of the BOM file;
+			return:		a generator of (refdes, name parts) tuples in the order of the rows.
+		"""
+		for refdesSet, nameStr in self.IterSets(reader, fieldnames):
+			for refdes in refdesSet:
+				yield refdes, nameStr
+
+	def IterSets(self, reader, fieldnames):
+		"""
+			Yields the designators of the BOM rows following the header, a set
+			per row.
+
+			reader:		an iterator of rows split into fields, e.g. csv.reader;
+			fieldnames:	a list of field names from the header of the BOM file;
+			return:		a generator of (DesignatorSet, name parts) tuples in the order of the rows.
+		"""
+		converter = self.__create_converter(fieldnames)
+		# If column names repeat, the last column is used
+		columns = {}
+		for index, name in enumerate(fieldnames):
+			columns[name] = index
+		refdesColumn = columns[converter[self.dictFmt["RefDes"]]]
+		# Templates bound to the header of this file, element type -> BoundTemplate
+		templates = {}
+		for row in reader:
+			if not row:
+				continue
+			elemRefDes = row[refdesColumn]
 			elemType = self.__get_element_type(elemRefDes)
-			# Iterate through format string and compose resulting string
-			if elemType not in self.exceptions:
-				if elemType in self.dictFmt.keys() or self.dictFmt.has_key('*'):
-					# Use default format string for this element in case there is no
-					# dedicated format string
-					if not self.dictFmt.has_key(elemType):
-						elemType = '*'
-					nameFormat = self.dictFmt[elemType]
-					nameTemplate = self.__compose_name_str(nameFormat, converter)
-					nameStr = self.__compose_name_str(nameTemplate, line)
-					for each in self.__get_refdes(elemRefDes):
-						self.data[each] = [nameStr, '1']
+			template = templates.get(elemType)
+			if template is None:
+				if elemType in self.exceptions:
+					continue
+				# Use default format string for this element in case there is no
+				# dedicated format string
+				if elemType in self.dictTpl:
+					template = self.dictTpl[elemType].bind(fieldnames)
+				elif '*' in self.dictTpl:
+					template = self.dictTpl['*'].bind(fieldnames)
 				else:
 					self.exceptions.append(elemType)
-					print "Отсутствует формат строки описания для элемента ", elemType
+					if self.verbose:
+						print "Отсутствует формат строки описания для элемента ", elemType
+					continue
+				templates[elemType] = template
+			yield self.__get_refdes(elemRefDes), template.render(row)
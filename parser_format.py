@@ -1,21 +1,122 @@
 import os
 import re
 
+# Matches a whole keyword of the format string
+FIELD_PATTERN = re.compile(r'^field([1-9]\d?)$')
+
+class NameTemplate(object):
+	"""
+		Compiled format string. Keywords fieldN are turned into zero-based column
+		numbers once, the rest of the format is kept as literal text.
+	"""
+	__slots__ = ('items',)
+
+	def __init__(self, listFormat):
+		# A list of (column number, literal) pairs, column number is None
+		# for literal text
+		self.items = []
+		for elem in listFormat:
+			match = FIELD_PATTERN.match(elem)
+			if match:
+				self.items.append((int(match.group(1)) - 1, elem))
+			else:
+				self.items.append((None, elem))
+
+	def bind(self, fieldnames):
+		"""
+			Resolves the template against the header of a BOM file. The result
+			follows the rules of the name composition used before: a field out of
+			the header is kept as literal text, a field with an empty column name
+			is dropped, and a literal equal to a column name is replaced with the
+			value of the column. If column names repeat, the last column is used.
+
+			fieldnames:	a list of column names from the BOM header;
+			return:		a BoundTemplate object.
+		"""
+		columns = {}
+		for index, name in enumerate(fieldnames):
+			columns[name] = index
+		items = []
+		for column, literal in self.items:
+			if column is not None and column < len(fieldnames):
+				name = fieldnames[column]
+				if not name:
+					continue
+				literal = name
+			if literal in columns:
+				items.append((columns[literal], None))
+			else:
+				items.append((-1, literal))
+		return BoundTemplate(items)
+
+class BoundTemplate(object):
+	"""
+		Template resolved against a particular BOM header, ready to render rows.
+	"""
+	__slots__ = ('items',)
+
+	def __init__(self, items):
+		self.items = tuple(items)
+
+	def render(self, row):
+		"""
+			Composes the name from a row read by csv.reader.
+
+			row:		a list of values of the row;
+			return:		a list of name parts, empty values are skipped.
+		"""
+		name = []
+		size = len(row)
+		for index, literal in self.items:
+			if index < 0:
+				name.append(literal)
+			elif index < size:
+				value = row[index]
+				if value:
+					name.append(value)
+		return name
+
+def compile_format(dictFormat):
+	"""
+		Compiles format strings of all elements into templates.
+
+		dictFormat:	a dictionary produced by FormatParser;
+		return:		a dictionary, element type -> NameTemplate.
+	"""
+	dictTemplate = {}
+	for element, listFormat in dictFormat.items():
+		if element in ("RefDes", "Quantity"):
+			continue
+		dictTemplate[element] = NameTemplate(listFormat)
+	return dictTemplate
+
 class FormatParser:
-	def __init__(self, fileName = None):
+	def __init__(self, fileName = None, lines = None):
 		self.dictFormat = {}
 		self.pattern = re.compile(r'(field\d{1,2})')
-		self.__OpenFile(fileName)
+		if lines is not None:
+			self.ParseLines(lines)
+		else:
+			self.__OpenFile(fileName)
+		self.dictTemplate = compile_format(self.dictFormat)
 
 	def __OpenFile(self, fileName):
 		if fileName == None or os.access(fileName, os.F_OK) == False:
 			return
 		f = open(fileName)
-		while True:
-			line = f.readline()
-			if len(line) == 0:
-				# Zero length indicates EOF
-				break
+		self.ParseLines(f)
+		f.close()
+
+	def ParseLines(self, lines):
+		"""
+			Parses the lines of the format file, also used for the format given in memory.
+
+			lines:		a string, a file-like object or an iterable of lines;
+			return:		none.
+		"""
+		if isinstance(lines, basestring):
+			lines = lines.splitlines(True)
+		for line in lines:
 			# Ignore lines containing comments (line starts with # sign) 
 			# and lines which seem not to be formatted correctly
 			if line.strip().startswith('#') or line.find(':') == -1:
@@ -36,4 +137,3 @@ class FormatParser:
 					if not each:
 						listFormat.remove(each)
 				self.dictFormat[element.upper()] = listFormat
-		f.close()
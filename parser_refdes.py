@@ -1,20 +1,32 @@
 import os
 
 class RefDesParser:
-	def __init__(self, fileName = None):
+	def __init__(self, fileName = None, lines = None):
 		self.dictDescription = {}
-		self.__OpenFile(fileName)
+		if lines is not None:
+			self.ParseLines(lines)
+		else:
+			self.__OpenFile(fileName)
 
 	def __OpenFile(self, fileName):
 		if fileName == None or os.access(fileName, os.F_OK) == False:
 			return
 
 		f = open(fileName)
-		while True:
-			line = f.readline()
-			if len(line) == 0:
-				# Zero length indicates EOF
-				break
+		self.ParseLines(f)
+		f.close()
+
+	def ParseLines(self, lines):
+		"""
+			Parses the lines of the description file, also used for the descriptions
+			given in memory.
+
+			lines:		a string, a file-like object or an iterable of lines;
+			return:		none.
+		"""
+		if isinstance(lines, basestring):
+			lines = lines.splitlines(True)
+		for line in lines:
 			# Ignore lines containing comments (line starts with # sign) 
 			# and lines which seem not to be formatted correctly
 			if line.strip().startswith('#') or line.find(':') == -1:
@@ -26,4 +38,3 @@ class RefDesParser:
 					descriptions = splits[1].split(',', 1)
 					stripped = [item.strip() for item in descriptions]
 					self.dictDescription[refdes] = stripped
-		f.close()
@@ -0,0 +1,895 @@
+# -*- coding: utf8 -*-
+
+import re
+import binascii
+from array import array
+from itertools import izip
+from bisect import bisect_right
+try:
+	import numpy
+except ImportError:
+	# The designator index is built by the pure Python code then
+	numpy = None
+
+TYPE_RE = re.compile('[0-9]')
+NUMBER_RE = re.compile('[A-Z\-\_\.]')
+# The common form of refdes: type letters followed by the position number
+REFDES_RE = re.compile(r'^([A-Za-z\-\_\.]+)([0-9]+)\Z')
+# A range of designators of the same type: R1-R400 or C10..C99
+RANGE_RE = re.compile(r'^([A-Za-z\-\_\.]+?)([0-9]+)\s*(?:-|\.\.)\s*\1([0-9]+)\Z')
+
+# Positions below this limit are tracked in a bitset, larger ones in a set
+BITSET_LIMIT = 1 << 20
+# Keys packing the type and the position number must stay below this limit
+INT64_LIMIT = 1 << 62
+# Shorter spans are stored in the table designator by designator, they are
+# cheaper to group and to write this way
+SPAN_MIN = 16
+
+def split_refdes(refdes):
+	"""
+		Splits the refdes into the type of the element and its position number.
+
+		refdes:		reference designator;
+		return:		a tuple (interned type string, position number).
+	"""
+	match = REFDES_RE.match(refdes)
+	if match:
+		return intern(match.group(1)), int(match.group(2))
+	# Digits are removed to get the type, everything else to get the number
+	return intern(TYPE_RE.sub('', refdes)), int(NUMBER_RE.sub('', refdes.upper()))
+
+def parse_range(refdes):
+	"""
+		Parses the range of designators such as R1-R400 or C10..C99.
+
+		refdes:		a single item of the RefDes cell;
+		return:		a tuple (interned type string, first number, last number) or
+					None if the item is not a range. Ranges going down and numbers
+					with leading zeros are not taken for ranges.
+	"""
+	match = RANGE_RE.match(refdes)
+	if match is None:
+		return None
+	first, last = match.group(2), match.group(3)
+	if (len(first) > 1 and first[0] == '0') or (len(last) > 1 and last[0] == '0'):
+		return None
+	start, end = int(first), int(last)
+	if start > end:
+		return None
+	return intern(match.group(1)), start, end
+
+def _canonical(entry):
+	# The refdes of the entry is the type followed by the number as is
+	return entry[3] is None or entry[3] == entry[0] + str(entry[1])
+
+class DesignatorSet(object):
+	"""
+		Designators kept as spans of position numbers. Every entry is a tuple
+		(type, start, end, refdes): refdes is the designator as written in the BOM
+		for a single one and None for a span, whose designators are the type
+		followed by the numbers from start to end. Neighbouring designators of the
+		same type are merged into a span when added, so both R1-R400 and the list
+		R1, R2, ..., R400 take one entry. The designators are iterated in the order
+		they were added and are never stored one by one.
+	"""
+	__slots__ = ('entries', 'size')
+
+	def __init__(self):
+		self.entries = []
+		self.size = 0
+
+	def add(self, elemType, start, end, refdes = None):
+		"""
+			Adds a span of designators or a single one.
+
+			elemType:	the type of the designators;
+			start:		the first position number;
+			end:		the last position number;
+			refdes:		the designator as written in the BOM if it is a single one;
+			return:		none.
+		"""
+		self.size += end - start + 1
+		entries = self.entries
+		if entries:
+			last = entries[-1]
+			# Designators such as R01 can not be derived from the number and stay
+			# apart, repeated positions too
+			if last[2] + 1 == start and last[0] == elemType and _canonical(last) and \
+					(refdes is None or refdes == elemType + str(start)):
+				entries[-1] = (elemType, last[1], end, None)
+				return
+		entries.append((elemType, start, end, refdes))
+
+	def merge(self, other):
+		"""
+			Combines the designators of two sets.
+
+			other:		DesignatorSet object;
+			return:		a new DesignatorSet with the designators of this set
+						followed by the ones of the other.
+		"""
+		merged = DesignatorSet()
+		for entry in self.entries:
+			merged.add(*entry)
+		for entry in other.entries:
+			merged.add(*entry)
+		return merged
+
+	def spans(self):
+		"""
+			Returns the list of (type, start, end) spans of the set.
+		"""
+		return [entry[:3] for entry in self.entries]
+
+	def __len__(self):
+		return self.size
+
+	def __iter__(self):
+		for elemType, start, end, refdes in self.entries:
+			if refdes is not None:
+				yield refdes
+			else:
+				for number in xrange(start, end + 1):
+					yield elemType + str(number)
+
+	def __getitem__(self, index):
+		if index < 0:
+			index += self.size
+		if index < 0 or index >= self.size:
+			raise IndexError("designator index out of range")
+		for elemType, start, end, refdes in self.entries:
+			if index <= end - start:
+				if refdes is not None:
+					return refdes
+				return elemType + str(start + index)
+			index -= end - start + 1
+
+	def __contains__(self, refdes):
+		try:
+			elemType, number = split_refdes(refdes)
+		except ValueError:
+			return False
+		canonical = refdes == elemType + str(number)
+		for entryType, start, end, entryRefDes in self.entries:
+			if entryRefDes is not None:
+				if entryRefDes == refdes:
+					return True
+			elif canonical and entryType == elemType and start <= number <= end:
+				return True
+		return False
+
+	def __eq__(self, other):
+		return isinstance(other, DesignatorSet) and self.entries == other.entries
+
+	def __ne__(self, other):
+		return not self == other
+
+	def __repr__(self):
+		items = []
+		for elemType, start, end, refdes in self.entries:
+			if refdes is not None:
+				items.append(refdes)
+			else:
+				items.append("%s%d-%s%d" % (elemType, start, elemType, end))
+		return "DesignatorSet(%s)" % ', '.join(items)
+
+def parse_designators(text):
+	"""
+		Parses the RefDes cell: a comma separated list of designators and ranges.
+		The designators are added the same way as by DesignatorSet.add(), which
+		is inlined here, since it is called for every designator of the BOM.
+
+		text:		the content of the cell, e.g. "R1, R5-R8, R10";
+		return:		DesignatorSet object.
+	"""
+	refdesSet = DesignatorSet()
+	entries = refdesSet.entries
+	size = 0
+	for item in text.split(','):
+		item = item.strip()
+		match = REFDES_RE.match(item)
+		if match is not None:
+			elemType, number = match.groups()
+			start = end = int(number)
+			refdes = item
+		else:
+			span = parse_range(item)
+			if span is not None:
+				elemType, start, end = span
+				refdes = None
+			else:
+				elemType, start = split_refdes(item)
+				end = start
+				refdes = item
+		size += end - start + 1
+		if entries:
+			last = entries[-1]
+			if last[2] + 1 == start and last[0] == elemType and _canonical(last) and \
+					(refdes is None or refdes == elemType + str(start)):
+				entries[-1] = (last[0], last[1], end, None)
+				continue
+		entries.append((intern(elemType), start, end, refdes))
+	refdesSet.size = size
+	return refdesSet
+
+class Designator(object):
+	"""
+		A single reference designator. It keeps the type and the position number
+		parsed from the refdes and the index of the part in the PartTable.
+	"""
+	__slots__ = ('type', 'number', 'part')
+
+	def __init__(self, elemType, number, part):
+		self.type = elemType
+		self.number = number
+		self.part = part
+
+	def __repr__(self):
+		return repr((self.type, self.number, self.part))
+
+class PartTable(object):
+	"""
+		Compact storage of the parsed BOM. Every distinct part is stored once as an
+		interned tuple of name parts, designators refer to it by index. Equal names
+		always share the same tuple object, so they may be compared by identity.
+	"""
+	def __init__(self):
+		# Part index -> tuple of name parts
+		self.names = []
+		# Part index -> number of designators referring to the part
+		self.quantities = array('l')
+		# Name tuple -> part index
+		self.partIds = {}
+		# Refdes -> Designator
+		self.designators = {}
+		# Refdes which repeat a type and position number seen before
+		self.duplicates = []
+		# Refdes -> number of parts the designator stands for. It is set only for
+		# the tables combining several BOMs, where designators are list positions.
+		self.amounts = None
+		# Groups of refdes computed before, e.g. loaded from BomStore; they are
+		# dropped when the table changes
+		self.groups = None
+		# Spans of designators added by add_set(): (type, start, end, part) tuples.
+		# Their designators are not put to the designators dictionary.
+		self.ranges = []
+		# Number of designators in the spans
+		self.rangeSize = 0
+		# Designators taken over by merge() are kept in parallel sequences
+		# instead of the designators dictionary: refdes, types, position numbers
+		# and part indices. They are moved to the dictionary once the table is
+		# changed in another way.
+		self.bulkRefDes = []
+		self.bulkTypes = []
+		self.bulkNumbers = array('l')
+		self.bulkParts = array('l')
+		# Type -> bitset of position numbers seen
+		self.__seen = {}
+		self.__seenLarge = set()
+		self.__index = None
+		# Type -> (sorted starts, spans), built by lookup()
+		self.__rangeIndex = None
+		# Refdes -> place in the bulk sequences, built by lookup()
+		self.__bulkPlaces = None
+
+	def __getstate__(self):
+		"""
+			The designators are pickled as arrays, which takes much less time
+			to pickle and to load than the Designator objects.
+		"""
+		state = dict(self.__dict__)
+		refdes = list(self.bulkRefDes)
+		types = list(self.bulkTypes)
+		numbers = array('l', self.bulkNumbers)
+		parts = array('l', self.bulkParts)
+		for each, designator in self.designators.iteritems():
+			refdes.append(each)
+			types.append(designator.type)
+			numbers.append(designator.number)
+			parts.append(designator.part)
+		state["designators"] = {}
+		state["bulkRefDes"] = refdes
+		state["bulkTypes"] = types
+		state["bulkNumbers"] = numbers.tostring()
+		state["bulkParts"] = parts.tostring()
+		state["quantities"] = self.quantities.tostring()
+		state["_PartTable__index"] = None
+		state["_PartTable__rangeIndex"] = None
+		state["_PartTable__bulkPlaces"] = None
+		return state
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		for name in ("bulkNumbers", "bulkParts", "quantities"):
+			values = array('l')
+			values.fromstring(state[name])
+			setattr(self, name, values)
+		# Interned strings are not interned after loading
+		types = dict([(elemType, intern(elemType)) for elemType in set(self.bulkTypes)])
+		self.bulkTypes = [types[elemType] for elemType in self.bulkTypes]
+		self.names = [tuple([intern(part) for part in name]) for name in self.names]
+		self.partIds = dict([(name, part) for part, name in enumerate(self.names)])
+		self.ranges = [(intern(elemType), start, end, part) for elemType, start, end, part in self.ranges]
+
+	def __len__(self):
+		return len(self.designators) + len(self.bulkRefDes) + self.rangeSize
+
+	def __contains__(self, refdes):
+		return self.lookup(refdes) is not None
+
+	def keys(self):
+		return [refdes for refdes, designator in self.iter_designators()]
+
+	def iter_designators(self):
+		"""
+			Yields (refdes, Designator) tuples of all designators of the table,
+			the ones of the spans included.
+		"""
+		for item in self.designators.iteritems():
+			yield item
+		for refdes, elemType, number, part in izip(self.bulkRefDes, self.bulkTypes, self.bulkNumbers, self.bulkParts):
+			yield refdes, Designator(elemType, number, part)
+		for elemType, start, end, part in self.ranges:
+			for number in xrange(start, end + 1):
+				yield elemType + str(number), Designator(elemType, number, part)
+
+	def lookup(self, refdes):
+		"""
+			Finds the designator in the table or in its spans.
+
+			refdes:		reference designator;
+			return:		Designator object or None if there is no such designator.
+		"""
+		designator = self.designators.get(refdes)
+		if designator is not None:
+			return designator
+		if self.bulkRefDes:
+			if self.__bulkPlaces is None:
+				self.__bulkPlaces = dict(izip(self.bulkRefDes, xrange(len(self.bulkRefDes))))
+			place = self.__bulkPlaces.get(refdes)
+			if place is not None:
+				return Designator(self.bulkTypes[place], self.bulkNumbers[place], self.bulkParts[place])
+		if not self.ranges:
+			return None
+		try:
+			elemType, number = split_refdes(refdes)
+		except ValueError:
+			return None
+		if refdes != elemType + str(number):
+			return None
+		if self.__rangeIndex is None:
+			rangeIndex = {}
+			for span in sorted(self.ranges):
+				starts, spans = rangeIndex.setdefault(span[0], ([], []))
+				starts.append(span[1])
+				spans.append(span)
+			self.__rangeIndex = rangeIndex
+		starts, spans = self.__rangeIndex.get(elemType, ((), ()))
+		position = bisect_right(starts, number) - 1
+		if position >= 0 and number <= spans[position][2]:
+			return Designator(elemType, number, spans[position][3])
+		return None
+
+	def add_part(self, nameStr):
+		"""
+			Registers the part name and returns its index. The same index is returned
+			for all equal names.
+
+			nameStr:	a list of name parts;
+			return:		index of the part.
+		"""
+		name = tuple([intern(part) for part in nameStr])
+		part = self.partIds.get(name)
+		if part is None:
+			part = len(self.names)
+			self.names.append(name)
+			self.quantities.append(0)
+			self.partIds[name] = part
+		return part
+
+	def add(self, refdes, part):
+		"""
+			Binds the refdes to the part. If the refdes is already in the table the
+			new part replaces the old one.
+
+			refdes:		reference designator;
+			part:		index of the part returned by add_part();
+			return:		none.
+		"""
+		elemType, number = split_refdes(refdes)
+		self.add_designator(refdes, elemType, number, part)
+
+	def add_designator(self, refdes, elemType, number, part):
+		"""
+			The same as add() for the refdes already split by split_refdes().
+		"""
+		if self.bulkRefDes:
+			self.__unpack_bulk()
+		duplicate = self.__mark_seen(elemType, number)
+		if duplicate:
+			self.duplicates.append(refdes)
+		previous = self.designators.get(refdes)
+		if previous is not None:
+			self.quantities[previous.part] -= 1
+		elif duplicate and self.ranges:
+			self.__cut_range(refdes, elemType, number)
+		self.designators[refdes] = Designator(elemType, number, part)
+		self.quantities[part] += 1
+		self.__index = None
+		self.__rangeIndex = None
+		self.groups = None
+
+	def add_set(self, refdesSet, part):
+		"""
+			Binds all designators of the set to the part.
+
+			refdesSet:	DesignatorSet object;
+			part:		index of the part returned by add_part();
+			return:		none.
+		"""
+		for elemType, start, end, refdes in refdesSet.entries:
+			if refdes is not None:
+				self.add_designator(refdes, elemType, start, part)
+			else:
+				self.add_span(elemType, start, end, part)
+
+	def add_span(self, elemType, start, end, part):
+		"""
+			Binds the designators of the type with the position numbers from start
+			to end to the part. The span takes a single entry of the table unless
+			it is shorter than SPAN_MIN or some of its positions are used already.
+		"""
+		if self.bulkRefDes:
+			self.__unpack_bulk()
+		if end - start + 1 >= SPAN_MIN and end < BITSET_LIMIT and not self.__mark_range(elemType, start, end):
+			self.ranges.append((elemType, start, end, part))
+			self.rangeSize += end - start + 1
+			self.quantities[part] += end - start + 1
+			self.__index = None
+			self.__rangeIndex = None
+			self.groups = None
+			return
+		# Used positions are replaced one by one as add() does
+		for number in xrange(start, end + 1):
+			self.add_designator(elemType + str(number), elemType, number, part)
+
+	def merge(self, other):
+		"""
+			Appends the designators of the table parsed from the next part of the
+			BOM. The designators are taken over in bulk, no Designator objects
+			are made, so a table loaded from another process is merged in a few
+			array operations.
+
+			other:		PartTable object;
+			return:		False if the other table has duplicates or some of its
+						positions are used in this table, nothing is merged then
+						and the part is to be added designator by designator to
+						keep the order of the duplicates; True otherwise.
+		"""
+		if other.duplicates or not self.__disjoint(other):
+			return False
+		ids = [self.add_part(name) for name in other.names]
+		for local, quantity in enumerate(other.quantities):
+			self.quantities[ids[local]] += quantity
+		self.bulkRefDes.extend(other.bulkRefDes)
+		self.bulkTypes.extend(other.bulkTypes)
+		self.bulkNumbers.extend(other.bulkNumbers)
+		if ids == range(len(ids)):
+			self.bulkParts.extend(other.bulkParts)
+		else:
+			self.bulkParts.extend(array('l', [ids[part] for part in other.bulkParts]))
+		for refdes, designator in other.designators.iteritems():
+			self.bulkRefDes.append(refdes)
+			self.bulkTypes.append(designator.type)
+			self.bulkNumbers.append(designator.number)
+			self.bulkParts.append(ids[designator.part])
+		self.ranges.extend([(elemType, start, end, ids[part]) for elemType, start, end, part in other.ranges])
+		self.rangeSize += other.rangeSize
+		for elemType, seen in other.__seen.iteritems():
+			self.__seen[elemType] = _bitset_or(self.__seen.get(elemType), seen)
+		self.__seenLarge.update(other.__seenLarge)
+		self.__index = None
+		self.__rangeIndex = None
+		self.__bulkPlaces = None
+		self.groups = None
+		return True
+
+	def __disjoint(self, other):
+		"""
+			Checks that no position is used in both tables.
+		"""
+		if not self.__seenLarge.isdisjoint(other.__seenLarge):
+			return False
+		for elemType, seen in other.__seen.iteritems():
+			mine = self.__seen.get(elemType)
+			if mine is not None and _bitset_value(mine, len(seen)) & _bitset_value(seen, len(mine)):
+				return False
+		return True
+
+	def __unpack_bulk(self):
+		"""
+			Moves the designators taken over by merge() to the dictionary.
+		"""
+		designators = self.designators
+		for refdes, elemType, number, part in izip(self.bulkRefDes, self.bulkTypes, self.bulkNumbers, self.bulkParts):
+			designators[refdes] = Designator(elemType, number, part)
+		self.bulkRefDes = []
+		self.bulkTypes = []
+		self.bulkNumbers = array('l')
+		self.bulkParts = array('l')
+		self.__bulkPlaces = None
+
+	def __cut_range(self, refdes, elemType, number):
+		"""
+			Takes the position out of the span containing it, the span is split
+			in two. A designator repeating the position in another way, such as R01
+			for R1, is sorted next to it, so the designator of the span is kept as
+			a single one then. The spans are scanned through, as repeated
+			designators are rare.
+		"""
+		for position, (spanType, start, end, part) in enumerate(self.ranges):
+			if spanType == elemType and start <= number <= end:
+				pieces = []
+				if start < number:
+					pieces.append((elemType, start, number - 1, part))
+				if number < end:
+					pieces.append((elemType, number + 1, end, part))
+				self.ranges[position:position + 1] = pieces
+				self.rangeSize -= 1
+				canonical = elemType + str(number)
+				if refdes == canonical:
+					self.quantities[part] -= 1
+				else:
+					self.designators[canonical] = Designator(elemType, number, part)
+				return
+
+	def __mark_seen(self, elemType, number):
+		"""
+			Marks the position of the type as used.
+
+			return:		True if the position was already used.
+		"""
+		if number >= BITSET_LIMIT:
+			key = (elemType, number)
+			if key in self.__seenLarge:
+				return True
+			self.__seenLarge.add(key)
+			return False
+		seen = self.__seen.get(elemType)
+		if seen is None:
+			seen = self.__seen[elemType] = bytearray()
+		offset = number >> 3
+		bit = 1 << (number & 7)
+		if offset >= len(seen):
+			seen.extend(bytearray(offset - len(seen) + 1))
+		if seen[offset] & bit:
+			return True
+		seen[offset] |= bit
+		return False
+
+	def __mark_range(self, elemType, start, end):
+		"""
+			Marks the positions of the type from start to end as used, unless any
+			of them is used already. The end must be below BITSET_LIMIT.
+
+			return:		True if some position was already used, nothing is marked then.
+		"""
+		seen = self.__seen.get(elemType)
+		if seen is None:
+			seen = self.__seen[elemType] = bytearray()
+		if (end >> 3) >= len(seen):
+			seen.extend(bytearray((end >> 3) - len(seen) + 1))
+		# Whole bytes are checked and set at once, the bits at the ends one by one
+		first = (start + 7) >> 3
+		last = (end + 1) >> 3
+		if first < last:
+			if seen.count('\x00', first, last) != last - first:
+				return True
+			edges = range(start, first << 3) + range(last << 3, end + 1)
+		else:
+			edges = range(start, end + 1)
+		for number in edges:
+			if seen[number >> 3] & (1 << (number & 7)):
+				return True
+		for number in edges:
+			seen[number >> 3] |= 1 << (number & 7)
+		if first < last:
+			seen[first:last] = '\xff' * (last - first)
+		return False
+
+	def index(self):
+		"""
+			Returns the DesignatorIndex of the table. The index is built once and
+			rebuilt only if the table was changed since then.
+		"""
+		if self.__index is None:
+			bulk = None
+			if self.bulkRefDes:
+				bulk = (self.bulkRefDes, self.bulkTypes, self.bulkNumbers, self.bulkParts)
+			self.__index = DesignatorIndex(self.designators, self.ranges, bulk = bulk)
+		return self.__index
+
+	def part(self, refdes):
+		"""
+			Returns the index of the part the refdes refers to.
+		"""
+		designator = self.lookup(refdes)
+		if designator is None:
+			raise KeyError(refdes)
+		return designator.part
+
+	def name(self, refdes):
+		"""
+			Returns the tuple of name parts for the refdes.
+		"""
+		return self.names[self.part(refdes)]
+
+def _bitset_value(seen, size):
+	"""
+		Turns the bitset into a number, the first byte being the lowest one.
+
+		seen:		bytearray;
+		size:		the size of the bitset compared with, the shorter one is
+					padded with zeroes;
+		return:		long.
+	"""
+	data = str(seen)
+	if len(data) < size:
+		data += '\x00' * (size - len(data))
+	if not data:
+		return 0
+	return long(binascii.hexlify(data[::-1]), 16)
+
+def _bitset_or(seen, other):
+	"""
+		Combines two bitsets of positions.
+
+		seen:		bytearray or None;
+		other:		bytearray;
+		return:		a new bytearray.
+	"""
+	if seen is None:
+		return bytearray(other)
+	size = max(len(seen), len(other))
+	value = _bitset_value(seen, size) | _bitset_value(other, size)
+	return bytearray(binascii.unhexlify('%0*x' % (size * 2, value))[::-1])
+
+def _int64(values):
+	"""
+		Returns the array('l') as NumPy array without copying it.
+	"""
+	if not values:
+		return numpy.zeros(0, numpy.int64)
+	return numpy.frombuffer(values, numpy.dtype('l')).astype(numpy.int64, copy = False)
+
+def _group(elemType, refdes, numbers, ends, start, end):
+	"""
+		Makes a group of the places from start to end of the sorted designators
+		of the type.
+
+		refdes, numbers, ends:	parallel sequences of the DesignatorIndex;
+		return:		a list of refdes if there are no spans among the places,
+					DesignatorSet otherwise.
+	"""
+	group = DesignatorSet()
+	hasSpans = False
+	for position in xrange(start, end):
+		number, last = int(numbers[position]), int(ends[position])
+		if number != last:
+			group.add(elemType, number, last)
+			hasSpans = True
+		else:
+			group.add(elemType, number, number, refdes[position])
+	if not hasSpans:
+		return refdes[start:end]
+	return group
+
+class DesignatorIndex(object):
+	"""
+		Designators of the table ordered by type and position number. For every
+		type it keeps the sorted refdes, their position numbers and part indices
+		in parallel arrays, and the number of designators.
+
+		A span of designators takes a single place in the arrays under the refdes
+		of its first designator, and the ends arrays keep the last position number
+		of every place. For a single designator it is its own position number.
+
+		Designators taken over by PartTable.merge() are passed as the bulk
+		sequences of the table.
+
+		If NumPy is available the index is built by vectorized code: a single
+		sort orders all designators by type and position, and the groups
+		are found by comparing neighbouring part indices. The numbers and parts
+		are NumPy arrays then. Otherwise the designators are sorted type by type
+		in Python. Both ways give the same order and the same groups.
+	"""
+	def __init__(self, designators, ranges = (), vectorized = None, bulk = None):
+		if vectorized is None:
+			vectorized = numpy is not None
+		self.vectorized = vectorized
+		self.refdes = {}
+		self.numbers = {}
+		self.ends = {}
+		self.parts = {}
+		self.counts = {}
+		# Types having spans
+		self.spanTypes = set()
+		if bulk is None:
+			bulk = ([], [], array('l'), array('l'))
+		if vectorized:
+			self.__build_vectorized(designators, ranges, bulk)
+		else:
+			self.__build(designators, ranges, bulk)
+
+	def __build(self, designators, ranges, bulk):
+		entries = {}
+		for refdes, designator in designators.iteritems():
+			entries.setdefault(designator.type, []).append((designator.number, refdes, designator.part))
+		for refdes, elemType, number, part in izip(*bulk):
+			entries.setdefault(elemType, []).append((number, refdes, part))
+		spans = {}
+		for elemType, start, end, part in ranges:
+			spans.setdefault(elemType, []).append((start, elemType + str(start), part, end))
+		self.spanTypes.update(spans.keys())
+		self.types = sorted(set(entries.keys()) | self.spanTypes)
+		for elemType in self.types:
+			items = entries.pop(elemType, [])
+			if elemType in spans:
+				items = [item + (item[0],) for item in items] + spans[elemType]
+			items.sort()
+			self.refdes[elemType] = [item[1] for item in items]
+			self.numbers[elemType] = array('l', [item[0] for item in items])
+			self.parts[elemType] = array('l', [item[2] for item in items])
+			if elemType in spans:
+				self.ends[elemType] = array('l', [item[3] for item in items])
+				self.counts[elemType] = sum(self.ends[elemType]) - sum(self.numbers[elemType]) + len(items)
+			else:
+				self.ends[elemType] = self.numbers[elemType]
+				self.counts[elemType] = len(items)
+
+	def __build_vectorized(self, designators, ranges, bulk):
+		listRefDes = designators.keys()
+		values = designators.values()
+		listTypes = [designator.type for designator in values]
+		listNumbers = [designator.number for designator in values]
+		listParts = [designator.part for designator in values]
+		bulkRefDes, bulkTypes, bulkNumbers, bulkParts = bulk
+		listRefDes.extend(bulkRefDes)
+		listTypes.extend(bulkTypes)
+		listEnds = None
+		if ranges:
+			listRefDes.extend([elemType + str(start) for elemType, start, end, part in ranges])
+			listTypes.extend([elemType for elemType, start, end, part in ranges])
+			listEnds = [end for elemType, start, end, part in ranges]
+			self.spanTypes.update(listTypes[len(values) + len(bulkRefDes):])
+		self.types = sorted(set(listTypes))
+		codes = dict([(elemType, code) for code, elemType in enumerate(self.types)])
+		count = len(listRefDes)
+		typeCodes = numpy.array(map(codes.__getitem__, listTypes), numpy.int64)
+		# The bulk arrays are taken as they are
+		numbers = numpy.concatenate((numpy.array(listNumbers, numpy.int64), _int64(bulkNumbers),
+			numpy.array([start for elemType, start, end, part in ranges], numpy.int64)))
+		parts = numpy.concatenate((numpy.array(listParts, numpy.int64), _int64(bulkParts),
+			numpy.array([part for elemType, start, end, part in ranges], numpy.int64)))
+		span = int(numbers.max()) + 1 if count else 1
+		if span * len(self.types) < INT64_LIMIT:
+			# Type and position packed into one key are sorted faster than by
+			# lexsort; the sort is stable as lexsort is
+			order = numpy.argsort(typeCodes * span + numbers, kind = 'mergesort')
+		else:
+			# The last key is the primary one
+			order = numpy.lexsort((numbers, typeCodes))
+		sortedCodes = typeCodes[order]
+		sortedNumbers = numbers[order]
+		if count > 1 and ((sortedCodes[1:] == sortedCodes[:-1]) & (sortedNumbers[1:] == sortedNumbers[:-1])).any():
+			# Refdes of the same type and position, e.g. R1 and R01, are ordered
+			# by the refdes as in the Python code
+			order = numpy.lexsort((numpy.array(listRefDes), numbers, typeCodes))
+			sortedCodes = typeCodes[order]
+			sortedNumbers = numbers[order]
+		if listEnds is not None:
+			ends = numpy.concatenate((numbers[:count - len(ranges)], numpy.array(listEnds, numpy.int64)))[order]
+		else:
+			ends = sortedNumbers
+		typeCodes = sortedCodes
+		numbers = sortedNumbers
+		parts = parts[order]
+		self.__sortedRefDes = [listRefDes[index] for index in order.tolist()]
+		self.__typeCodes = typeCodes
+		self.__numbers = numbers
+		self.__ends = ends
+		self.__parts = parts
+		bounds = numpy.searchsorted(typeCodes, numpy.arange(len(self.types) + 1)).tolist()
+		for code, elemType in enumerate(self.types):
+			start, end = bounds[code], bounds[code + 1]
+			self.refdes[elemType] = self.__sortedRefDes[start:end]
+			self.numbers[elemType] = numbers[start:end]
+			self.ends[elemType] = ends[start:end]
+			self.parts[elemType] = parts[start:end]
+			if elemType in self.spanTypes:
+				self.counts[elemType] = int((ends[start:end] - numbers[start:end]).sum()) + end - start
+			else:
+				self.counts[elemType] = end - start
+
+	def sorted_keys(self):
+		"""
+			Returns all refdes sorted by type and position number, the spans are
+			expanded.
+		"""
+		if self.vectorized and not self.spanTypes:
+			return list(self.__sortedRefDes)
+		keys = []
+		for elemType in self.types:
+			if elemType not in self.spanTypes:
+				keys.extend(self.refdes[elemType])
+				continue
+			for refdes, number, end in zip(self.refdes[elemType], self.numbers[elemType], self.ends[elemType]):
+				if number == end:
+					keys.append(refdes)
+				else:
+					keys.extend([elemType + str(position) for position in xrange(int(number), int(end) + 1)])
+		return keys
+
+	def groups(self):
+		"""
+			Combines the sorted designators into groups. Neighbouring designators
+			of the same type referring to the same part fall into one group. The
+			spans are not expanded, a group holding any is a DesignatorSet.
+
+			return:		a list of groups, each group is a list of refdes or
+						a DesignatorSet.
+		"""
+		if self.vectorized:
+			count = len(self.__sortedRefDes)
+			if not count:
+				return []
+			# A group starts where the type or the part changes
+			changes = (self.__typeCodes[1:] != self.__typeCodes[:-1]) | (self.__parts[1:] != self.__parts[:-1])
+			starts = [0] + (numpy.flatnonzero(changes) + 1).tolist()
+			ends = starts[1:] + [count]
+			listRefDes = self.__sortedRefDes
+			if not self.spanTypes:
+				return [listRefDes[start:end] for start, end in zip(starts, ends)]
+			# Number of spans before every place, the groups without spans
+			# are plain slices
+			isSpan = self.__ends != self.__numbers
+			spansBefore = numpy.concatenate(([0], numpy.cumsum(isSpan))).tolist()
+			codes = self.__typeCodes.tolist()
+			numbers = self.__numbers.tolist()
+			lastNumbers = self.__ends.tolist()
+			groupedKeys = []
+			for start, end in zip(starts, ends):
+				if spansBefore[end] == spansBefore[start]:
+					groupedKeys.append(listRefDes[start:end])
+				else:
+					groupedKeys.append(_group(self.types[codes[start]], listRefDes, numbers, lastNumbers, start, end))
+			return groupedKeys
+		groupedKeys = []
+		for elemType in self.types:
+			if elemType in self.spanTypes:
+				groupedKeys.extend(self.__span_groups(elemType))
+				continue
+			prevPart = None
+			# Equal names share the same part index
+			for refdes, currentPart in zip(self.refdes[elemType], self.parts[elemType]):
+				if currentPart == prevPart:
+					groupedKeys[-1].append(refdes)
+				else:
+					groupedKeys.append([refdes])
+					prevPart = currentPart
+		return groupedKeys
+
+	def __span_groups(self, elemType):
+		"""
+			Groups the designators of the type having spans.
+		"""
+		refdes = self.refdes[elemType]
+		parts = self.parts[elemType]
+		groups = []
+		first = 0
+		for position in xrange(1, len(parts) + 1):
+			if position == len(parts) or parts[position] != parts[first]:
+				groups.append(_group(elemType, refdes, self.numbers[elemType], self.ends[elemType], first, position))
+				first = position
+		return groups
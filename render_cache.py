@@ -0,0 +1,76 @@
+# -*- coding: utf8 -*-
+
+import threading
+from collections import OrderedDict
+
+# The number of rendered names kept by default
+RENDER_CACHE_SIZE = 4096
+
+class RenderCache:
+	"""
+		Bounded cache of rendered part names with least recently used eviction.
+		TexWriter keys it on the name parts and the quote state before the name,
+		and stores the escaped and cleaned up name with the quote state after it,
+		so the paired quotes stay correct. The cache may be shared by several
+		writers and threads.
+	"""
+	def __init__(self, maxSize = RENDER_CACHE_SIZE):
+		self.maxSize = maxSize
+		self.entries = OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def get(self, key):
+		"""
+			Returns the cached value or None.
+		"""
+		with self.lock:
+			value = self.entries.pop(key, None)
+			if value is None:
+				self.misses += 1
+				return None
+			# Move the entry to the end, the most recently used one
+			self.entries[key] = value
+			self.hits += 1
+			return value
+
+	def put(self, key, value):
+		with self.lock:
+			if self.maxSize <= 0:
+				return
+			# A replaced entry becomes the most recently used one as well
+			self.entries.pop(key, None)
+			self.entries[key] = value
+			while len(self.entries) > self.maxSize:
+				self.entries.popitem(last = False)
+				self.evictions += 1
+
+	def resize(self, maxSize):
+		"""
+			Changes the maximum number of entries, 0 disables the cache.
+		"""
+		with self.lock:
+			self.maxSize = maxSize
+			while len(self.entries) > max(maxSize, 0):
+				self.entries.popitem(last = False)
+				self.evictions += 1
+
+	def clear(self):
+		with self.lock:
+			self.entries.clear()
+
+	def stats(self):
+		"""
+			Returns the statistics of the cache.
+
+			return:		a dictionary with the numbers of hits, misses and evictions,
+						the current and the maximum number of entries.
+		"""
+		with self.lock:
+			return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+				"size": len(self.entries), "maxSize": self.maxSize}
+
+# The cache shared by the whole program
+renderCache = RenderCache()
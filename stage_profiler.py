@@ -0,0 +1,203 @@
+# -*- coding: utf8 -*-
+
+import sys
+import time
+import threading
+import parser_format
+import parser_refdes
+import parser_bom
+import part_table
+import tex_writer
+import bom_stream
+import bom_export
+from render_cache import renderCache
+
+# Stages in the order of the report: (name, description)
+STAGES = [
+	("config", "чтение format и description"),
+	("csv", "чтение BOM"),
+	("compose", "составление наименований"),
+	("expand", "разбор позиционных обозначений"),
+	("table", "заполнение таблицы элементов"),
+	("sort", "сортировка"),
+	("group", "группировка"),
+	("escape", "экранирование LaTeX"),
+	("beautify", "очистка строк"),
+	("write", "запись файла"),
+]
+
+class StageProfiler:
+	"""
+		Collects wall time and the number of calls of the conversion stages.
+		Nothing is measured until instrument() is called, so the profiler costs
+		nothing when it is not used.
+	"""
+	def __init__(self):
+		self.enabled = False
+		# Stages being timed by the current thread
+		self.local = threading.local()
+		self.reset()
+
+	def reset(self):
+		# Stage name -> [seconds, calls]
+		self.stages = dict([(name, [0.0, 0]) for name, description in STAGES])
+		# Number of BOM rows processed, used to compute the throughput
+		self.rows = 0
+		# Hits and misses of the render cache in other processes, and the counters
+		# of the cache in this process at the time of the reset
+		self.cache = [0, 0]
+		self.cacheBase = (renderCache.hits, renderCache.misses)
+
+	def cache_stats(self):
+		"""
+			Returns the hits and misses of the render cache since the reset.
+		"""
+		return (self.cache[0] + renderCache.hits - self.cacheBase[0],
+			self.cache[1] + renderCache.misses - self.cacheBase[1])
+
+	def add(self, stage, elapsed, calls = 1):
+		entry = self.stages[stage]
+		entry[0] += elapsed
+		entry[1] += calls
+
+	def enter(self, stage):
+		"""
+			Marks the stage as being timed by the current thread.
+
+			return:		False if the stage is being timed already, e.g. write_file()
+						called by write_parallel(); the inner call is not timed then.
+		"""
+		running = getattr(self.local, "stages", None)
+		if running is None:
+			running = self.local.stages = set()
+		if stage in running:
+			return False
+		running.add(stage)
+		return True
+
+	def leave(self, stage):
+		self.local.stages.discard(stage)
+
+	def collect(self):
+		"""
+			Returns the collected statistics and starts over. Used to pass the
+			statistics from worker processes.
+		"""
+		stats = (self.stages, self.rows, self.cache_stats())
+		self.reset()
+		return stats
+
+	def merge(self, stats):
+		"""
+			Adds the statistics returned by collect() in another process.
+		"""
+		stages, rows, (hits, misses) = stats
+		for stage, (elapsed, calls) in stages.items():
+			self.add(stage, elapsed, calls)
+		self.rows += rows
+		self.cache[0] += hits
+		self.cache[1] += misses
+
+	def instrument(self):
+		"""
+			Wraps the methods implementing the conversion stages with timers.
+		"""
+		if self.enabled:
+			return
+		self.enabled = True
+		_wrap_method(self, parser_format.FormatParser, "_FormatParser__OpenFile", "config")
+		_wrap_method(self, parser_refdes.RefDesParser, "_RefDesParser__OpenFile", "config")
+		_wrap_generator(self, parser_bom.BomParser, "IterSets", "csv")
+		_wrap_method(self, parser_format.BoundTemplate, "render", "compose", rows = True)
+		_wrap_method(self, parser_bom.BomParser, "_BomParser__get_refdes", "expand")
+		_wrap_method(self, parser_bom.BomParser, "ParseData", "table")
+		# The designators are sorted when the index is built, the ungrouped
+		# list only expands the spans
+		_wrap_method(self, part_table.DesignatorIndex, "__init__", "sort")
+		_wrap_method(self, tex_writer.TexWriter, "_TexWriter__sortElements", "sort")
+		_wrap_generator(self, bom_stream, "sort_elements", "sort")
+		_wrap_method(self, tex_writer.TexWriter, "_TexWriter__combineElements", "group")
+		_wrap_generator(self, bom_stream, "group_elements", "group")
+		_wrap_method(self, tex_writer.TexWriter, "_TexWriter__escape_latex", "escape")
+		_wrap_method(self, tex_writer.TexWriter, "_TexWriter__beautifyStr", "beautify")
+		_wrap_method(self, tex_writer.TexWriter, "_TexWriter__beautifyName", "beautify")
+		_wrap_method(self, tex_writer.TexWriter, "write_file", "write")
+		_wrap_method(self, tex_writer.TexWriter, "write_stream", "write")
+		_wrap_method(self, tex_writer.TexWriter, "write_parallel", "write")
+		_wrap_method(self, bom_export.CsvWriter, "write_file", "write")
+		_wrap_method(self, bom_export.JsonWriter, "write_file", "write")
+
+	def report(self, out = None):
+		"""
+			Prints the table of stages. Time of a stage includes the time of the
+			stages called from it, e.g. "csv" includes "compose" and "expand".
+		"""
+		if out is None:
+			out = sys.stdout
+		# Formatting is done in unicode, so that the columns are aligned
+		lines = [u"%-10s %-36s %10s %12s %14s" % (u"Этап", u"", u"Вызовы", u"Время, с", u"Строк/с")]
+		for name, description in STAGES:
+			elapsed, calls = self.stages[name]
+			# Configuration does not depend on the BOM size
+			if elapsed > 0 and self.rows and name != "config":
+				throughput = u"%14.0f" % (self.rows / elapsed)
+			else:
+				throughput = u"%14s" % u"-"
+			lines.append(u"%-10s %-36s %10d %12.4f %s" % (name, description.decode("utf-8"),
+				calls, elapsed, throughput))
+		lines.append(u"Обработано строк BOM: %d" % self.rows)
+		hits, misses = self.cache_stats()
+		if hits + misses:
+			lines.append(u"Кэш наименований: попаданий %d, промахов %d (%.1f%% попаданий)" %
+				(hits, misses, 100.0 * hits / (hits + misses)))
+		out.write(u"\n".join(lines).encode("utf-8"))
+		out.write("\n")
+
+def _owner_attribute(owner, name):
+	"""
+		Returns the plain function stored in the class or module.
+	"""
+	if isinstance(owner, type(sys)):
+		return getattr(owner, name)
+	return owner.__dict__[name]
+
+def _wrap_method(profiler, owner, name, stage, rows = False):
+	function = _owner_attribute(owner, name)
+	def wrapper(*args, **kwargs):
+		if not profiler.enter(stage):
+			return function(*args, **kwargs)
+		start = time.time()
+		try:
+			return function(*args, **kwargs)
+		finally:
+			profiler.add(stage, time.time() - start)
+			profiler.leave(stage)
+			if rows:
+				profiler.rows += 1
+	wrapper.__name__ = function.__name__
+	wrapper.__doc__ = function.__doc__
+	setattr(owner, name, wrapper)
+
+def _wrap_generator(profiler, owner, name, stage):
+	function = _owner_attribute(owner, name)
+	def wrapper(*args, **kwargs):
+		iterator = function(*args, **kwargs)
+		elapsed = 0.0
+		try:
+			while True:
+				start = time.time()
+				try:
+					item = iterator.next()
+				finally:
+					elapsed += time.time() - start
+				yield item
+		except StopIteration:
+			return
+		finally:
+			profiler.add(stage, elapsed)
+	wrapper.__name__ = function.__name__
+	wrapper.__doc__ = function.__doc__
+	setattr(owner, name, wrapper)
+
+# The profiler shared by the whole program
+profiler = StageProfiler()
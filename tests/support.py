@@ -0,0 +1,73 @@
+# -*- coding: utf8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+from parser_format import FormatParser
+from parser_refdes import RefDesParser
+
+# Sample BOM, configuration and the documents expected from it
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+def data_file(name):
+	"""
+		Returns the path of the file in the data directory.
+	"""
+	return os.path.join(DATA_DIR, name)
+
+def read_file(fileName):
+	f = open(fileName, 'rb')
+	data = f.read()
+	f.close()
+	return data
+
+def write_file(fileName, data):
+	f = open(fileName, 'wb')
+	f.write(data)
+	f.close()
+
+def load_config():
+	"""
+		Loads the sample configuration.
+
+		return:		a tuple (FormatParser, RefDesParser).
+	"""
+	return FormatParser(data_file("format")), RefDesParser(data_file("description"))
+
+def settings(**kwargs):
+	"""
+		Returns the settings dictionary with the defaults of the command line.
+	"""
+	result = {"group": "flat", "strings": 0, "stream": False, "incremental": False}
+	result.update(kwargs)
+	return result
+
+def element_lines(document):
+	"""
+		Returns the lines of the document listing the elements and the sections.
+	"""
+	return [line for line in document.splitlines() if line.startswith(("\\Element", "\\Part"))]
+
+class TempDirTestCase(unittest.TestCase):
+	"""
+		Test case working in a temporary directory removed afterwards.
+	"""
+	def setUp(self):
+		self.directory = tempfile.mkdtemp(prefix = "bomparser-test")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def path(self, name):
+		return os.path.join(self.directory, name)
+
+	def copy_data(self, name, target = None):
+		"""
+			Copies the file of the data directory to the temporary one.
+
+			return:		the path of the copy.
+		"""
+		target = self.path(target or name)
+		shutil.copyfile(data_file(name), target)
+		return target
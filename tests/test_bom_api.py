@@ -0,0 +1,38 @@
+# -*- coding: utf8 -*-
+
+import io
+import csv
+import unittest
+import bom_api
+from tests.support import data_file, read_file
+
+class UnicodeInputTest(unittest.TestCase):
+	"""
+		The BOM and the configuration given as unicode strings give the same
+		document as UTF-8 ones.
+	"""
+	def setUp(self):
+		self.fmt, self.dsc = bom_api.load_config(read_file(data_file("format")), read_file(data_file("description")))
+		self.data = read_file(data_file("bom.csv"))
+		self.expected = bom_api.convert(io.BytesIO(self.data), self.fmt, self.dsc)
+
+	def test_rows(self):
+		rows = [[field.decode("utf-8") for field in row] for row in csv.reader(io.BytesIO(self.data))]
+		self.assertEqual(bom_api.convert(rows, self.fmt, self.dsc), self.expected)
+
+	def test_file(self):
+		bom = io.StringIO(self.data.decode("utf-8"))
+		self.assertEqual(bom_api.convert(bom, self.fmt, self.dsc), self.expected)
+
+	def test_config(self):
+		fmt, dsc = bom_api.load_config(read_file(data_file("format")).decode("utf-8"),
+			read_file(data_file("description")).decode("utf-8"))
+		self.assertEqual(bom_api.convert(io.BytesIO(self.data), fmt, dsc), self.expected)
+		self.assertEqual(type(bom_api.convert(io.BytesIO(self.data), fmt, dsc)), str)
+
+	def test_byte_rows(self):
+		rows = list(csv.reader(io.BytesIO(self.data)))
+		self.assertEqual(bom_api.convert(rows, self.fmt, self.dsc), self.expected)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,141 @@
+# -*- coding: utf8 -*-
+
+import csv
+import random
+import cPickle
+import unittest
+import cStringIO
+import bom_chunks
+from parser_bom import BomParser
+from part_table import PartTable
+from tests.support import TempDirTestCase, write_file, load_config
+
+HEADER = "Designator,Value,Manufacturer,ManufacturerPartNumber,Quantity,Name,Package,Tolerance,TU/GOST,Type,Power/Voltage,TKC,TKE\n"
+
+def random_bom(rnd, rows, positions):
+	"""
+		Makes a BOM with ranges, designators with leading zeroes, values with
+		quotes and line feeds, and duplicates if positions are few.
+	"""
+	lines = [HEADER]
+	for row in range(rows):
+		elemType = rnd.choice(["R", "C", "DA"])
+		items = []
+		for index in range(rnd.randint(1, 3)):
+			number = rnd.randint(1, positions)
+			choice = rnd.random()
+			if choice < 0.1:
+				items.append("%s%d-%s%d" % (elemType, number, elemType, number + rnd.randint(0, 40)))
+			elif choice < 0.13:
+				items.append("%s0%d" % (elemType, number))
+			else:
+				items.append("%s%d" % (elemType, number))
+		value = rnd.choice(["10k", "1k", '5""x', "a\nb"])
+		lines.append('"%s","%s","M","P","1","N","","","","","","",""\n' % (", ".join(items), value))
+	return ''.join(lines)
+
+def table_content(table):
+	return (sorted([(refdes, designator.type, designator.number, table.names[designator.part])
+		for refdes, designator in table.iter_designators()]),
+		sorted([(table.names[part], quantity) for part, quantity in enumerate(table.quantities) if quantity]))
+
+class SplitRangesTest(unittest.TestCase):
+	def test_records_are_not_split(self):
+		data = HEADER + '"R1","a\nb","x"\n"R2","c",""""\n"R3","d\n\ne",""\n' * 20
+		for chunks in range(1, 30):
+			(headerStart, headerEnd), ranges = bom_chunks.split_ranges(data, chunks)
+			self.assertEqual(data[headerStart:headerEnd], HEADER)
+			self.assertEqual(ranges[0][0], headerEnd)
+			self.assertEqual(ranges[-1][1], len(data))
+			rows = []
+			for (start, end), following in zip(ranges, ranges[1:] + [(len(data), None)]):
+				self.assertEqual(end, following[0])
+				rows.extend(list(csv.reader(cStringIO.StringIO(data[start:end]))))
+			self.assertEqual(rows, list(csv.reader(cStringIO.StringIO(data[headerEnd:]))))
+
+class ParseChunksTest(TempDirTestCase):
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		self.chunkMin = bom_chunks.CHUNK_MIN
+		# Small files are split too
+		bom_chunks.CHUNK_MIN = 256
+		self.fmt, self.dsc = load_config()
+
+	def tearDown(self):
+		bom_chunks.CHUNK_MIN = self.chunkMin
+		TempDirTestCase.tearDown(self)
+
+	def parse(self, fileBom, jobs):
+		bom = BomParser(fileBom, self.fmt.dictFormat, self.dsc.dictDescription, stream = True,
+			dictTemplate = self.fmt.dictTemplate, jobs = jobs)
+		bom.verbose = False
+		bom.ParseData()
+		return bom
+
+	def check(self, data):
+		fileBom = self.path("bom.csv")
+		write_file(fileBom, data)
+		serial = self.parse(fileBom, 0)
+		chunked = self.parse(fileBom, 3)
+		self.assertEqual(table_content(chunked.data), table_content(serial.data))
+		self.assertEqual(chunked.data.duplicates, serial.data.duplicates)
+		self.assertEqual(chunked.data.index().groups(), serial.data.index().groups())
+		self.assertEqual(chunked.data.index().sorted_keys(), serial.data.index().sorted_keys())
+		return chunked
+
+	def test_same_as_serial(self):
+		rnd = random.Random(3)
+		merged = 0
+		for attempt in range(10):
+			bom = self.check(random_bom(rnd, 300, 200000))
+			if bom.data.bulkRefDes:
+				merged += 1
+		# Without duplicates the parts are merged in bulk
+		self.assertTrue(merged > 5)
+
+	def test_duplicates_across_chunks(self):
+		rnd = random.Random(4)
+		for attempt in range(10):
+			bom = self.check(random_bom(rnd, 300, 200))
+			self.assertTrue(bom.data.duplicates)
+
+class MergeTest(unittest.TestCase):
+	def table(self, items):
+		table = PartTable()
+		for refdes, name in items:
+			table.add(refdes, table.add_part([name]))
+		return table
+
+	def test_pickled_table(self):
+		table = self.table([("R1", "a"), ("R2", "b"), ("C5", "a")])
+		table.add_span("R", 10, 40, table.add_part(["c"]))
+		loaded = cPickle.loads(cPickle.dumps(table, cPickle.HIGHEST_PROTOCOL))
+		self.assertEqual(loaded.designators, {})
+		self.assertEqual(len(loaded), len(table))
+		self.assertEqual(table_content(loaded), table_content(table))
+		self.assertEqual(loaded.name("R2"), ("b",))
+		self.assertEqual(loaded.lookup("R20").part, table.lookup("R20").part)
+		self.assertEqual(loaded.index().groups(), table.index().groups())
+
+	def test_merge(self):
+		table = self.table([("R1", "a"), ("R2", "b")])
+		other = cPickle.loads(cPickle.dumps(self.table([("R3", "b"), ("C1", "c")]), cPickle.HIGHEST_PROTOCOL))
+		self.assertTrue(table.merge(other))
+		self.assertEqual(sorted(table.keys()), ["C1", "R1", "R2", "R3"])
+		self.assertEqual(table.name("R3"), ("b",))
+		self.assertEqual(list(table.quantities), [1, 2, 1])
+		self.assertEqual(table.index().groups(), [["C1"], ["R1"], ["R2", "R3"]])
+		# Adding a designator moves the merged ones to the dictionary
+		table.add("R4", 0)
+		self.assertEqual(table.bulkRefDes, [])
+		self.assertEqual(sorted(table.designators), ["C1", "R1", "R2", "R3", "R4"])
+
+	def test_merge_rejects_used_positions(self):
+		table = self.table([("R1", "a"), ("R2", "b")])
+		self.assertFalse(table.merge(self.table([("R3", "a"), ("R02", "b")])))
+		self.assertEqual(sorted(table.keys()), ["R1", "R2"])
+		other = self.table([("R3", "a"), ("R3", "b")])
+		self.assertFalse(table.merge(other))
+
+if __name__ == "__main__":
+	unittest.main()
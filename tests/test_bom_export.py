@@ -0,0 +1,67 @@
+# -*- coding: utf8 -*-
+
+import csv
+import json
+import unittest
+import cStringIO
+from converter import convert_file
+from parser_bom import BomParser
+from tex_writer import TexWriter
+from bom_export import parse_formats, output_name, plain_name, write_outputs
+from tests.support import TempDirTestCase, data_file, read_file, load_config, settings
+
+class FormatsTest(unittest.TestCase):
+	def test_parse_formats(self):
+		self.assertEqual(parse_formats("tex, CSV,json,csv"), ["tex", "csv", "json"])
+		self.assertEqual(parse_formats("tex,pdf"), None)
+		self.assertEqual(parse_formats(""), None)
+
+	def test_output_name(self):
+		self.assertEqual(output_name("board.tex", "tex"), "board.tex")
+		self.assertEqual(output_name("board.tex", "csv"), "board-elements.csv")
+		self.assertEqual(output_name("board.tex.gz", "json"), "board.json.gz")
+		self.assertEqual(output_name("-", "csv"), "-")
+
+	def test_plain_name(self):
+		self.assertEqual(plain_name([", Резистор", ",, ", "10 кОм", " , ", "", "0603, "]), "Резистор, 10 кОм, 0603")
+		self.assertEqual(plain_name(["a  b", "+/-5%"]), "a b+/-5%")
+
+class EmitTest(TempDirTestCase):
+	"""
+		All formats are written from the same parse and list the same groups.
+	"""
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		self.fmt, self.dsc = load_config()
+		self.fileBom = self.copy_data("bom.csv")
+
+	def groups(self):
+		bom = BomParser(self.fileBom, self.fmt.dictFormat, self.dsc.dictDescription, dictTemplate = self.fmt.dictTemplate)
+		tex = TexWriter(settings(), bom.data, self.dsc.dictDescription)
+		return [(elemType, list(elem), tex.count(elem)) for section, groups in tex.sections()
+			for elemType, elem, nameParts, plural in groups]
+
+	def test_all_formats(self):
+		names = convert_file(self.fileBom, settings(emit = ["tex", "csv", "json"]), self.fmt, self.dsc)
+		self.assertEqual(names, ', '.join([self.path("bom.tex"), self.path("bom-elements.csv"), self.path("bom.json")]))
+		self.assertEqual(read_file(self.path("bom.tex")), read_file(data_file("bom_flat.tex")))
+		rows = list(csv.reader(open(self.path("bom-elements.csv"), "rb")))
+		self.assertEqual(rows[0], ["Type", "Designator", "Name", "Quantity"])
+		expected = self.groups()
+		self.assertEqual([(row[0], row[1].split(", "), int(row[3])) for row in rows[1:]], expected)
+		document = json.loads(read_file(self.path("bom.json")))
+		elements = [(section["type"], element["designators"], element["quantity"], element["name"])
+			for section in document["sections"] for element in section["elements"]]
+		self.assertEqual([(elemType, designators, quantity) for elemType, designators, quantity, name in elements], expected)
+		self.assertEqual([name.encode("utf-8") for elemType, designators, quantity, name in elements], [row[2] for row in rows[1:]])
+		self.assertEqual(document["sections"][0]["title"], u"Конденсаторы")
+
+	def test_sink(self):
+		bom = BomParser(self.fileBom, self.fmt.dictFormat, self.dsc.dictDescription, dictTemplate = self.fmt.dictTemplate)
+		tex = TexWriter(settings(fileTex = "-"), bom.data, self.dsc.dictDescription)
+		sink = cStringIO.StringIO()
+		self.assertEqual(write_outputs(tex, ["csv"], sink), ["-"])
+		self.assertTrue(sink.getvalue().startswith("Type,Designator,Name,Quantity\nC,C1,"))
+
+if __name__ == "__main__":
+	unittest.main()
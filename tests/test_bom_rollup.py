@@ -0,0 +1,102 @@
+# -*- coding: utf8 -*-
+
+import unittest
+import cStringIO
+from bom_rollup import parse_input, rollup
+from converter import convert_rollup
+from tests.support import TempDirTestCase, data_file, load_config, read_file, settings, element_lines
+
+# A second board sharing the 10 kOhm resistors and the 10 uF capacitors with bom.csv
+HEADER = read_file(data_file("bom.csv")).splitlines()[0]
+SECOND_BOM = "\n".join([HEADER,
+	'"R1, R2","10 кОм","Yageo","RC0603","2","Резистор","0603","+/-1%","","","0,1 Вт","",""',
+	'"R3","2,2 кОм","Yageo","RC0603","1","Резистор","0603","+/-1%","","","0,1 Вт","",""',
+	'"C5","10 мкФ","Murata","GRM21","1","Конденсатор","0805","","","X5R","16 В","",""',
+	'"C6-C9","1 мкФ","Murata","GRM188","4","Конденсатор","0603","","","","","",""',
+	""])
+
+def amounts(table):
+	"""
+		Returns the quantities of the rolled up table by the composed names.
+	"""
+	return dict([("".join(table.name(refdes)), table.amounts[refdes]) for refdes in table.keys()])
+
+class ParseInputTest(unittest.TestCase):
+	def test_count(self):
+		self.assertEqual(parse_input("board.csv:3"), ("board.csv", 3))
+		self.assertEqual(parse_input("dir/a:b.csv:12"), ("dir/a:b.csv", 12))
+
+	def test_no_count(self):
+		self.assertEqual(parse_input("board.csv"), ("board.csv", 1))
+		# Not a number, the colon is a part of the name
+		self.assertEqual(parse_input("board.csv:x"), ("board.csv:x", 1))
+
+	def test_bad_count(self):
+		self.assertRaises(ValueError, parse_input, "board.csv:0")
+		self.assertRaises(ValueError, parse_input, "board.csv:-2")
+
+class RollupTest(TempDirTestCase):
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		self.fmt, self.dsc = load_config()
+		self.first = self.copy_data("bom.csv")
+		self.second = self.path("second.csv")
+		f = open(self.second, 'wb')
+		f.write(SECOND_BOM)
+		f.close()
+
+	def test_single(self):
+		result = amounts(rollup([(self.first, 1)], self.fmt, self.dsc))
+		self.assertEqual(result["Резистор, 10 кОм, 0603"], 5)
+		self.assertEqual(result["Резистор, 4,7 кОм, 0603"], 5)
+		self.assertEqual(result["10 мкФ 16 В , 0805"], 4)
+		self.assertEqual(result["Вилка, PLS-2, "], 2)
+		self.assertEqual(len(result), 10)
+
+	def test_count(self):
+		single = amounts(rollup([(self.first, 1)], self.fmt, self.dsc))
+		triple = amounts(rollup([(self.first, 3)], self.fmt, self.dsc))
+		self.assertEqual(triple, dict([(name, 3 * amount) for name, amount in single.items()]))
+
+	def test_shared_parts(self):
+		table = rollup([(self.first, 2), (self.second, 3)], self.fmt, self.dsc)
+		result = amounts(table)
+		# 2 * 5 + 3 * 2
+		self.assertEqual(result["Резистор, 10 кОм, 0603"], 16)
+		# 2 * 4 + 3 * 1
+		self.assertEqual(result["10 мкФ 16 В , 0805"], 11)
+		self.assertEqual(result["Резистор, 4,7 кОм, 0603"], 10)
+		self.assertEqual(result["Резистор, 2,2 кОм, 0603"], 3)
+		# A span counts all of its designators
+		self.assertEqual(result["1 мкФ  , 0603"], 12)
+		self.assertEqual(len(result), 12)
+		# Numbered in the order of appearance, the parts of the second BOM last
+		self.assertEqual("".join(table.name("R1")), "Резистор, 10 кОм, 0603")
+		self.assertEqual("".join(table.name("R5")), "Резистор, 2,2 кОм, 0603")
+		self.assertEqual("".join(table.name("C3")), "1 мкФ  , 0603")
+		self.assertNotIn("R6", table)
+
+	def test_same_file_twice(self):
+		once = amounts(rollup([(self.first, 5)], self.fmt, self.dsc))
+		twice = amounts(rollup([(self.first, 2), (self.first, 3)], self.fmt, self.dsc))
+		self.assertEqual(once, twice)
+
+	def test_pipeline(self):
+		inputs = [(self.first, 2), (self.second, 3)]
+		self.assertEqual(amounts(rollup(inputs, self.fmt, self.dsc, pipeline = True)),
+			amounts(rollup(inputs, self.fmt, self.dsc)))
+
+	def test_document(self):
+		sink = cStringIO.StringIO()
+		convert_rollup([(self.first, 2), (self.second, 3)], settings(), self.fmt, self.dsc, sink)
+		lines = element_lines(sink.getvalue())
+		# Quantities instead of the designators
+		self.assertIn("\\Element{Резистор, 10 кОм, 0603}{}{16}", lines)
+		self.assertIn("\\Element{Резистор, 2,2 кОм, 0603}{}{3}", lines)
+		self.assertIn("\\Element{10 мкФ 16 В, 0805}{}{11}", lines)
+		for line in lines:
+			if line.startswith("\\Element"):
+				self.assertTrue(line.split("}{")[1] == "", line)
+
+if __name__ == "__main__":
+	unittest.main()
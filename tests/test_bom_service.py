@@ -0,0 +1,87 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import time
+import signal
+import socket
+import unittest
+import multiprocessing
+import bom_api
+from bom_service import serve
+from tests.support import TempDirTestCase, data_file, read_file, load_config
+
+def _run_service(address, maxBody):
+	# The service reports the start and the requests
+	sys.stdout = sys.stderr = open(os.devnull, "w")
+	fmt, dsc = load_config()
+	serve(address, fmt, dsc, 1, 2, maxBody)
+
+class ServiceTest(TempDirTestCase):
+	"""
+		The service is started on a Unix socket in another process.
+	"""
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		self.socketPath = self.path("service.sock")
+		self.process = multiprocessing.Process(target = _run_service, args = ("unix:" + self.socketPath, 4096))
+		self.process.start()
+		for attempt in range(100):
+			if os.path.exists(self.socketPath):
+				break
+			time.sleep(0.05)
+
+	def tearDown(self):
+		# Ctrl+C stops the service
+		os.kill(self.process.pid, signal.SIGINT)
+		self.process.join(10)
+		if self.process.is_alive():
+			self.process.terminate()
+		TempDirTestCase.tearDown(self)
+
+	def request(self, head, body = ""):
+		"""
+			Sends the request and returns a tuple (status code, body of the reply).
+		"""
+		client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		client.connect(self.socketPath)
+		client.sendall(head + "\r\n\r\n" + body)
+		reply = []
+		while True:
+			data = client.recv(65536)
+			if not data:
+				break
+			reply.append(data)
+		client.close()
+		header, body = "".join(reply).split("\r\n\r\n", 1)
+		return int(header.split(" ", 2)[1]), body
+
+	def post(self, body, length = None):
+		if length is None:
+			length = str(len(body))
+		return self.request("POST /convert?group=flat&strings=3 HTTP/1.0\r\nContent-Length: " + length, body)
+
+	def test_convert(self):
+		data = read_file(data_file("bom.csv"))
+		code, body = self.post(data)
+		self.assertEqual(code, 200)
+		fmt, dsc = load_config()
+		self.assertEqual(body, bom_api.convert(open(data_file("bom.csv"), "rb"), fmt, dsc, "flat", 3))
+		code, body = self.request("GET /metrics HTTP/1.0")
+		self.assertEqual(code, 200)
+		self.assertIn('bomparser_requests_total{status="ok"} 1', body)
+		self.assertIn("bomparser_rows_total 12", body)
+		for stage in ("csv", "table", "sort", "group", "write"):
+			self.assertIn('bomparser_stage_seconds_count{stage="%s"} 1' % stage, body)
+
+	def test_invalid_length(self):
+		self.assertEqual(self.post("R1", "abc")[0], 400)
+		self.assertEqual(self.post("R1", "-2")[0], 400)
+		self.assertEqual(self.request("POST /convert HTTP/1.0")[0], 411)
+
+	def test_too_large(self):
+		self.assertEqual(self.post("", "4097")[0], 413)
+		self.assertEqual(self.post("x" * 5000)[0], 413)
+
+if __name__ == "__main__":
+	unittest.main()
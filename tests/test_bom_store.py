@@ -0,0 +1,41 @@
+# -*- coding: utf8 -*-
+
+import os
+import unittest
+from converter import convert_file
+from tex_cache import TexCache
+from bom_store import BomStore
+from tests.support import TempDirTestCase, read_file, load_config, settings
+
+class StoreTest(TempDirTestCase):
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		self.fmt, self.dsc = load_config()
+		self.fileBom = self.copy_data("bom.csv")
+		self.fileStore = self.path("boms.db")
+		self.cache = TexCache(self.fmt.dictFormat, self.dsc.dictDescription, self.path("cache"))
+
+	def convert(self, **kwargs):
+		convert_file(self.fileBom, settings(**kwargs), self.fmt, self.dsc, self.cache)
+		return read_file(self.path("bom.tex"))
+
+	def test_store_with_cache(self):
+		document = self.convert()
+		# The document is in the cache, the BOM gets stored all the same
+		self.assertEqual(self.convert(store = self.fileStore), document)
+		store = BomStore(self.fileStore, self.fmt.dictFormat, self.dsc.dictDescription)
+		self.assertEqual(store.db.execute("SELECT COUNT(*) FROM boms").fetchone()[0], 1)
+		results = store.query("R1")
+		self.assertEqual([(path, refdes) for path, refdes, name in results], [(os.path.abspath(self.fileBom), ["R1"])])
+		self.assertTrue(store.load(store.identity(self.fileBom)) is not None)
+		store.close()
+
+	def test_stored_bom(self):
+		document = self.convert(store = self.fileStore)
+		os.unlink(self.path("bom.tex"))
+		# Rendered from the store
+		self.assertEqual(self.convert(store = self.fileStore), document)
+		self.assertEqual(self.convert(store = self.fileStore, group = "none"), self.convert(group = "none"))
+
+if __name__ == "__main__":
+	unittest.main()
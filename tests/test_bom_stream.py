@@ -0,0 +1,94 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import random
+import unittest
+import bom_stream
+from bom_stream import sort_elements
+from part_table import parse_designators, split_refdes
+from converter import convert_file
+from tests.support import TempDirTestCase, read_file, write_file, load_config, settings
+from tests.test_part_table import random_cell
+from tests.test_bom_chunks import HEADER
+
+def expanded_sort(sets):
+	"""
+		Sorts the designators expanded one by one, the last of the repeated
+		ones is kept.
+	"""
+	records = []
+	for refdesSet, nameStr in sets:
+		for refdes in refdesSet:
+			elemType, number = split_refdes(refdes)
+			records.append((elemType, number, refdes, len(records), nameStr))
+	records.sort()
+	result = []
+	for record in records:
+		if result and result[-1][2] == record[2]:
+			result.pop()
+		result.append((record[0], record[1], record[2], record[4]))
+	return result
+
+class SortElementsTest(unittest.TestCase):
+	def setUp(self):
+		self.runBlock = bom_stream.RUN_BLOCK
+		# Spilled runs of several blocks
+		bom_stream.RUN_BLOCK = 3
+		self.random = random.Random(11)
+
+	def tearDown(self):
+		bom_stream.RUN_BLOCK = self.runBlock
+
+	def random_sets(self):
+		return [(parse_designators(random_cell(self.random)), (self.random.choice(["a", "b"]),))
+			for index in range(self.random.randint(0, 40))]
+
+	def test_same_as_expanded(self):
+		for attempt in range(300):
+			sets = self.random_sets()
+			expected = expanded_sort(sets)
+			for runSize in (1, 7, 1000):
+				self.assertEqual(list(sort_elements(iter(sets), runSize)), expected)
+
+	def test_long_spans(self):
+		sets = [(parse_designators("R1-R400"), ("a",)), (parse_designators("R5, R7, R500, R10-R12"), ("b",)),
+			(parse_designators("R300..R302, C1-C3"), ("c",))]
+		expected = expanded_sort(sets)
+		self.assertEqual(len(expected), 404)
+		self.assertEqual(list(sort_elements(iter(sets), 2)), expected)
+
+class WriteStreamTest(TempDirTestCase):
+	"""
+		The document written by the stream is the same as the one written from
+		the table.
+	"""
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		# The repeated designators are reported
+		self.stdout = sys.stdout
+		sys.stdout = open(os.devnull, "w")
+
+	def tearDown(self):
+		sys.stdout.close()
+		sys.stdout = self.stdout
+		TempDirTestCase.tearDown(self)
+
+	def test_same_as_table(self):
+		fmt, dsc = load_config()
+		rnd = random.Random(12)
+		fileBom = self.path("bom.csv")
+		for attempt in range(20):
+			rows = [HEADER]
+			for index in range(rnd.randint(1, 40)):
+				cell = random_cell(rnd)
+				rows.append('"%s","%s","M","P","1","N","","","","","","",""\n' % (cell, rnd.choice(["10k", "1k"])))
+			write_file(fileBom, ''.join(rows))
+			for group in ("flat", "none"):
+				convert_file(fileBom, settings(group = group, output = self.path("table.tex")), fmt, dsc)
+				convert_file(fileBom, settings(group = group, stream = True, runSize = 5,
+					output = self.path("stream.tex")), fmt, dsc)
+				self.assertEqual(read_file(self.path("stream.tex")), read_file(self.path("table.tex")))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,77 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import json
+import unittest
+import subprocess
+from tests.support import TempDirTestCase, data_file, read_file, write_file
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bomparser.py")
+
+class CommandLineTest(TempDirTestCase):
+	def run_script(self, *args):
+		"""
+			Runs the script in the temporary directory with the sample configuration.
+
+			return:		a tuple (exit code, output).
+		"""
+		command = [sys.executable, SCRIPT, "-f", data_file("format"), "-d", data_file("description"), "--no-cache"]
+		process = subprocess.Popen(command + list(args), cwd = self.directory, stdout = subprocess.PIPE,
+			stderr = subprocess.STDOUT)
+		output = process.communicate()[0]
+		return process.returncode, output
+
+	def test_missing_bom_fails(self):
+		fileBom = self.copy_data("bom.csv")
+		code, output = self.run_script(fileBom, "missing.csv")
+		self.assertEqual(code, 1)
+		self.assertIn("missing.csv", output)
+		self.assertTrue(os.path.exists(self.path("bom.tex")))
+
+	def test_missing_bom_fails_in_batch(self):
+		fileBom = self.copy_data("bom.csv")
+		code, output = self.run_script("-j", "2", fileBom, "missing.csv")
+		self.assertEqual(code, 1)
+		self.assertIn("missing.csv", output)
+		self.assertTrue(os.path.exists(self.path("bom.tex")))
+
+	def test_only_missing_boms(self):
+		code, output = self.run_script("missing.csv")
+		self.assertEqual(code, 1)
+
+	def test_rollup_bad_count(self):
+		fileBom = self.copy_data("bom.csv")
+		code, output = self.run_script("--rollup", fileBom + ":2", fileBom + ":0")
+		self.assertEqual(code, 2)
+		self.assertIn("bom.csv:0", output)
+		self.assertFalse(os.path.exists(self.path("rollup.tex")))
+
+	def test_incremental_summary(self):
+		"""
+			Only the summaries are printed to the standard output in the incremental
+			mode, the messages of the parser go to the standard error.
+		"""
+		rows = read_file(data_file("bom.csv")).splitlines(True)
+		# The repeated designators are reported by the parser
+		write_file(self.path("first.csv"), ''.join(rows + rows[1:2]))
+		write_file(self.path("second.csv"), ''.join(rows[:3]))
+		for jobs in ("0", "2"):
+			command = [sys.executable, SCRIPT, "-f", data_file("format"), "-d", data_file("description"),
+				"--incremental", "-j", jobs, "first.csv", "second.csv"]
+			process = subprocess.Popen(command, cwd = self.directory, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+			output, errors = process.communicate()
+			self.assertEqual(process.returncode, 0)
+			summaries = [json.loads(line) for line in output.splitlines()]
+			self.assertEqual(len(summaries), 2)
+			# The documents of the first run are reused by the second one
+			self.assertEqual(set([summary["full"] for summary in summaries]), set([jobs == "0"]))
+			self.assertIn("R1, R2, R3", errors)
+
+	def test_success(self):
+		fileBom = self.copy_data("bom.csv")
+		code, output = self.run_script(fileBom)
+		self.assertEqual(code, 0)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,164 @@
+# -*- coding: utf8 -*-
+
+import os
+import bz2
+import gzip
+import random
+import unittest
+import cStringIO
+import compression
+from compression import CompressedFile, DecompressedFile, detect, split_extension, iter_lines, open_input, read_blocks
+from converter import convert_file
+from tests.support import TempDirTestCase, data_file, read_file, write_file, load_config, settings
+
+def _has_xz():
+	if compression.lzma is not None:
+		return True
+	for directory in os.environ.get("PATH", "").split(os.pathsep):
+		if os.path.exists(os.path.join(directory, "xz")):
+			return True
+	return False
+
+def file_lines(data):
+	# Only line feeds end the lines of a file, unlike splitlines()
+	return list(cStringIO.StringIO(data))
+
+FORMATS = ["gz", "bz2"] + (["xz"] if _has_xz() else [])
+
+class NamesTest(unittest.TestCase):
+	def test_split_extension(self):
+		self.assertEqual(split_extension("board.csv.gz"), ("board.csv", "gz"))
+		self.assertEqual(split_extension("board.csv.XZ"), ("board.csv", "xz"))
+		self.assertEqual(split_extension("board.csv"), ("board.csv", None))
+
+	def test_iter_lines(self):
+		rnd = random.Random(7)
+		data = ''.join([rnd.choice(["a", "bc", "\n", "\r\n", "d\n"]) for index in range(2000)])
+		for attempt in range(50):
+			cuts = sorted([rnd.randint(0, len(data)) for index in range(rnd.randint(0, 20))])
+			blocks = [data[start:end] for start, end in zip([0] + cuts, cuts + [len(data)])]
+			self.assertEqual(list(iter_lines(blocks)), file_lines(data))
+
+class RoundTripTest(TempDirTestCase):
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		rnd = random.Random(8)
+		self.data = ''.join([chr(rnd.randint(0, 255)) if rnd.random() < 0.1 else rnd.choice(["R1,", "10k\n"])
+			for index in range(200000)])
+		self.readSize = compression.READ_SIZE
+		# Many blocks even for small files
+		compression.READ_SIZE = 1000
+
+	def tearDown(self):
+		compression.READ_SIZE = self.readSize
+		TempDirTestCase.tearDown(self)
+
+	def compress(self, fmt, data):
+		fileName = self.path("data." + fmt)
+		f = CompressedFile(fileName, fmt)
+		for start in range(0, len(data), 7777):
+			f.write(data[start:start + 7777])
+		f.close()
+		return fileName
+
+	def test_round_trip(self):
+		for fmt in FORMATS:
+			fileName = self.compress(fmt, self.data)
+			self.assertEqual(detect(fileName), fmt)
+			f = open_input(fileName)
+			self.assertEqual(f.read(), self.data, fmt)
+			f.close()
+			f = open_input(fileName)
+			self.assertEqual(list(f), file_lines(self.data), fmt)
+			f.close()
+			self.assertEqual(''.join(read_blocks(fileName)), self.data, fmt)
+
+	def test_standard_tools(self):
+		self.assertEqual(gzip.open(self.compress("gz", self.data), "rb").read(), self.data)
+		self.assertEqual(bz2.BZ2File(self.compress("bz2", self.data)).read(), self.data)
+		fileName = self.path("data.csv.gz")
+		f = gzip.open(fileName, "wb")
+		f.write(self.data)
+		f.close()
+		self.assertEqual(''.join(read_blocks(fileName)), self.data)
+
+	def test_concatenated_streams(self):
+		for fmt in FORMATS:
+			first = read_file(self.compress(fmt, self.data[:1000]))
+			second = read_file(self.compress(fmt, self.data[1000:]))
+			fileName = self.path("joined")
+			write_file(fileName, first + second)
+			f = DecompressedFile(fileName, fmt)
+			self.assertEqual(f.read(), self.data, fmt)
+			f.close()
+
+	def test_truncated(self):
+		for fmt in FORMATS:
+			data = read_file(self.compress(fmt, self.data))
+			fileName = self.path("truncated." + fmt)
+			for size in (len(data) // 2, len(data) - 1, len(data) - 5, 20):
+				write_file(fileName, data[:size])
+				f = open_input(fileName)
+				self.assertRaises(IOError, f.read)
+				f.close()
+				self.assertRaises(IOError, lambda: list(read_blocks(fileName)))
+
+	def test_truncated_second_stream(self):
+		for fmt in FORMATS:
+			first = read_file(self.compress(fmt, self.data[:1000]))
+			second = read_file(self.compress(fmt, self.data[1000:]))
+			fileName = self.path("joined")
+			write_file(fileName, first + second[:len(second) // 2])
+			f = DecompressedFile(fileName, fmt)
+			self.assertRaises(IOError, f.read)
+			f.close()
+
+	def test_damaged(self):
+		data = read_file(self.compress("gz", self.data))
+		fileName = self.path("damaged.gz")
+		# The checksum at the end does not match
+		write_file(fileName, data[:-8] + chr(ord(data[-8]) ^ 1) + data[-7:])
+		self.assertRaises(IOError, lambda: list(read_blocks(fileName)))
+
+	def test_plain_file(self):
+		fileName = self.path("data.csv")
+		write_file(fileName, self.data)
+		self.assertEqual(detect(fileName), None)
+		self.assertEqual(''.join(read_blocks(fileName, 999)), self.data)
+
+class ConversionTest(TempDirTestCase):
+	"""
+		Compressed BOMs and documents give the same document as plain ones.
+	"""
+	def test_compressed_bom_and_document(self):
+		fmt, dsc = load_config()
+		expected = read_file(data_file("bom_flat.tex"))
+		for compress in FORMATS:
+			fileBom = self.path("bom.csv." + compress)
+			f = CompressedFile(fileBom, compress)
+			f.write(read_file(data_file("bom.csv")))
+			f.close()
+			for stream in (False, True):
+				names = convert_file(fileBom, settings(compress = compress, stream = stream), fmt, dsc)
+				self.assertEqual(names, self.path("bom.tex." + compress))
+				f = open_input(names)
+				self.assertEqual(f.read(), expected, compress)
+				f.close()
+
+	def test_truncated_bom(self):
+		fmt, dsc = load_config()
+		header, rows = read_file(data_file("bom.csv")).split("\n", 1)
+		data = header + "\n" + rows * 20
+		for compress in FORMATS:
+			fileBom = self.path("bom.csv." + compress)
+			f = CompressedFile(fileBom, compress)
+			f.write(data)
+			f.close()
+			write_file(fileBom, read_file(fileBom)[:-10])
+			for stream in (False, True):
+				# No document is written from a part of the BOM
+				self.assertRaises(IOError, convert_file, fileBom, settings(stream = stream), fmt, dsc)
+				self.assertFalse(os.path.exists(self.path("bom.tex")))
+
+if __name__ == "__main__":
+	unittest.main()
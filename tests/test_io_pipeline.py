@@ -0,0 +1,128 @@
+# -*- coding: utf8 -*-
+
+import random
+import unittest
+import cStringIO
+from io_pipeline import PrefetchedFile, BackgroundWriter, prefetch_files
+from compression import CompressedFile
+from converter import convert_file, convert_pipelined
+from tests.support import TempDirTestCase, data_file, read_file, write_file, load_config, settings
+
+class Target:
+	"""
+		File-like object keeping the data written, optionally failing on the
+		write given.
+	"""
+	def __init__(self, failAt = None):
+		self.data = []
+		self.failAt = failAt
+		self.closed = False
+
+	def write(self, data):
+		if len(self.data) == self.failAt:
+			raise IOError("no space left on device")
+		self.data.append(data)
+
+	def close(self):
+		self.closed = True
+
+class PrefetchedFileTest(TempDirTestCase):
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		rnd = random.Random(13)
+		self.data = ''.join([rnd.choice(["R1,", "10k", "\n", '"a\nb"']) for index in range(50000)])
+		self.fileName = self.path("data.csv")
+		write_file(self.fileName, self.data)
+
+	def test_read(self):
+		f = PrefetchedFile(self.fileName, 777, 2)
+		self.assertEqual(f.read(), self.data)
+		f.close()
+		f = PrefetchedFile(self.fileName, 777, 1)
+		self.assertEqual(list(f), list(cStringIO.StringIO(self.data)))
+		f.close()
+
+	def test_compressed(self):
+		fileName = self.path("data.csv.gz")
+		f = CompressedFile(fileName, "gz")
+		f.write(self.data)
+		f.close()
+		f = PrefetchedFile(fileName, 1000, 2)
+		self.assertEqual(f.read(), self.data)
+		f.close()
+
+	def test_missing_file(self):
+		f = PrefetchedFile(self.path("missing.csv"))
+		self.assertRaises(IOError, f.read)
+		f.close()
+
+	def test_close_early(self):
+		f = PrefetchedFile(self.fileName, 10, 1)
+		self.assertEqual(f.blocks().next(), self.data[:10])
+		f.close()
+		self.assertFalse(f.thread.is_alive())
+
+	def test_prefetch_files(self):
+		names = []
+		for index in range(3):
+			names.append(self.path("%d.csv" % index))
+			write_file(names[-1], str(index) * 100)
+		files = prefetch_files(names)
+		for fileName, source in files:
+			self.assertEqual(source.read(), read_file(fileName))
+		self.assertEqual([fileName for fileName, source in prefetch_files(names)], names)
+
+class BackgroundWriterTest(unittest.TestCase):
+	def test_write(self):
+		target = Target()
+		writer = BackgroundWriter(target, 2)
+		chunks = [str(index) * index for index in range(200)]
+		for chunk in chunks:
+			writer.write(chunk)
+		writer.close()
+		self.assertEqual(target.data, chunks)
+		self.assertTrue(target.closed)
+
+	def test_error(self):
+		target = Target(failAt = 5)
+		writer = BackgroundWriter(target, 2)
+		def write_all():
+			for index in range(100):
+				writer.write("data")
+			writer.close()
+		self.assertRaises(IOError, write_all)
+		self.assertEqual(len(target.data), 5)
+
+	def test_error_on_close(self):
+		target = Target(failAt = 0)
+		writer = BackgroundWriter(target)
+		writer.write("data")
+		self.assertRaises(IOError, writer.close)
+		self.assertTrue(target.closed)
+
+class PipelineTest(TempDirTestCase):
+	"""
+		Documents converted with the input and the output in threads are the
+		same as the ones converted in turn.
+	"""
+	def document(self, index, compress):
+		fileTex = self.path("%d.tex" % index)
+		if compress:
+			fileTex = '.'.join([fileTex, compress])
+		return read_file(fileTex)
+
+	def test_same_documents(self):
+		fmt, dsc = load_config()
+		names = [self.copy_data("bom.csv", "%d.csv" % index) for index in range(3)]
+		for stream in (False, True):
+			for compress in (None, "gz"):
+				options = settings(stream = stream, compress = compress)
+				convert_pipelined(names, options, fmt, dsc)
+				documents = [self.document(index, compress) for index in range(3)]
+				for index in range(3):
+					convert_file(names[index], options, fmt, dsc)
+					self.assertEqual(self.document(index, compress), documents[index])
+		self.assertEqual(self.document(0, None), read_file(data_file("bom_flat.tex")))
+
+if __name__ == "__main__":
+	unittest.main()
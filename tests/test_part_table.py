@@ -0,0 +1,205 @@
+# -*- coding: utf8 -*-
+
+import random
+import cPickle
+import unittest
+import part_table
+from part_table import PartTable, DesignatorIndex, DesignatorSet, parse_designators, parse_range, split_refdes, REFDES_RE
+
+def random_table(rnd, spans = True, large = False):
+	"""
+		Makes a table with designators written with leading zeroes, spans,
+		replaced parts and, if large, position numbers far above the bitsets.
+	"""
+	table = PartTable()
+	parts = [table.add_part(["part", str(index)]) for index in range(4)]
+	for index in range(rnd.randint(0, 150)):
+		elemType = rnd.choice(["R", "C", "DA", "X"])
+		number = rnd.randint(1, 300)
+		if large and rnd.random() < 0.2:
+			number = rnd.randint(1, 1 << 40)
+		choice = rnd.random()
+		if spans and choice < 0.1:
+			table.add_span(elemType, number, number + rnd.randint(0, 40), rnd.choice(parts))
+		elif choice < 0.15:
+			table.add("%s0%d" % (elemType, number), rnd.choice(parts))
+		else:
+			table.add("%s%d" % (elemType, number), rnd.choice(parts))
+	return table
+
+def bulk_table(rnd):
+	"""
+		Makes a table with a part of the designators merged in bulk.
+	"""
+	table = random_table(rnd, spans = False)
+	other = PartTable()
+	part = other.add_part(["part", "bulk"])
+	# Positions above the ones of random_table() of the same types
+	for number in rnd.sample(xrange(301, 1000), rnd.randint(1, 100)):
+		other.add("%s%d" % (rnd.choice(["R", "V"]), number), part)
+	if table.merge(cPickle.loads(cPickle.dumps(other, cPickle.HIGHEST_PROTOCOL))):
+		return table
+	return None
+
+def bulk(table):
+	if table.bulkRefDes:
+		return (table.bulkRefDes, table.bulkTypes, table.bulkNumbers, table.bulkParts)
+	return None
+
+def content(index):
+	"""
+		Everything the writers take from the index, as plain lists.
+	"""
+	groups = [(type(group), list(group)) for group in index.groups()]
+	arrays = [(elemType, list(index.refdes[elemType]), [int(value) for value in index.numbers[elemType]],
+		[int(value) for value in index.ends[elemType]], [int(value) for value in index.parts[elemType]],
+		index.counts[elemType]) for elemType in index.types]
+	return index.types, index.sorted_keys(), groups, arrays
+
+class DesignatorIndexTest(unittest.TestCase):
+	"""
+		The index built by NumPy is the same as the one built in Python.
+	"""
+	def setUp(self):
+		if part_table.numpy is None:
+			self.skipTest("NumPy is not installed")
+		self.random = random.Random(9)
+
+	def check(self, table):
+		python = DesignatorIndex(table.designators, table.ranges, False, bulk(table))
+		vectorized = DesignatorIndex(table.designators, table.ranges, True, bulk(table))
+		self.assertEqual(content(vectorized), content(python))
+		self.assertEqual(len(python.sorted_keys()), len(table))
+		return python
+
+	def test_designators(self):
+		for attempt in range(200):
+			self.check(random_table(self.random, spans = False))
+
+	def test_spans(self):
+		withSpans = 0
+		for attempt in range(200):
+			index = self.check(random_table(self.random))
+			if index.spanTypes:
+				withSpans += 1
+				self.assertTrue([group for group in index.groups() if isinstance(group, DesignatorSet)])
+		self.assertTrue(withSpans > 100)
+
+	def test_large_numbers(self):
+		for attempt in range(100):
+			self.check(random_table(self.random, large = True))
+
+	def test_bulk(self):
+		merged = 0
+		for attempt in range(100):
+			table = bulk_table(self.random)
+			if table is not None:
+				self.check(table)
+				merged += 1
+		self.assertTrue(merged > 50)
+
+	def test_order(self):
+		table = PartTable()
+		part = table.add_part(["a"])
+		for refdes in ["R10", "C2", "R02", "R2", "R1", "DA1", "C1"]:
+			table.add(refdes, part)
+		for vectorized in (False, True):
+			index = DesignatorIndex(table.designators, vectorized = vectorized)
+			self.assertEqual(index.sorted_keys(), ["C1", "C2", "DA1", "R1", "R02", "R2", "R10"])
+			self.assertEqual(index.groups(), [["C1", "C2"], ["DA1"], ["R1", "R02", "R2", "R10"]])
+
+def random_cell(rnd):
+	"""
+		Makes the content of a RefDes cell with runs of designators, ranges,
+		leading zeroes, repeats and odd spacing.
+	"""
+	items = []
+	number = rnd.randint(0, 20)
+	for index in range(rnd.randint(1, 12)):
+		elemType = rnd.choice(["R", "R", "C", "DA", "X_"])
+		number = rnd.choice([number + 1, number + 1, number, rnd.randint(0, 30)])
+		choice = rnd.random()
+		if choice < 0.15:
+			items.append("%s%d-%s%d" % (elemType, number, elemType, number + rnd.randint(-1, 5)))
+		elif choice < 0.2:
+			items.append("%s0%d" % (elemType, number))
+		elif choice < 0.25:
+			items.append("%s%d..%s%d" % (elemType, number, elemType, number + rnd.randint(0, 3)))
+		else:
+			items.append("%s%d" % (elemType, number))
+	return rnd.choice([",", ", ", " , "]).join(items)
+
+class ParseDesignatorsTest(unittest.TestCase):
+	def reference(self, text):
+		"""
+			Adds the items of the cell one by one by DesignatorSet.add().
+		"""
+		refdesSet = DesignatorSet()
+		for item in text.split(','):
+			item = item.strip()
+			if REFDES_RE.match(item):
+				elemType, number = split_refdes(item)
+				refdesSet.add(elemType, number, number, item)
+			elif parse_range(item) is not None:
+				refdesSet.add(*parse_range(item))
+			else:
+				elemType, number = split_refdes(item)
+				refdesSet.add(elemType, number, number, item)
+		return refdesSet
+
+	def test_same_as_add(self):
+		rnd = random.Random(10)
+		for attempt in range(5000):
+			text = random_cell(rnd)
+			refdesSet = parse_designators(text)
+			expected = self.reference(text)
+			self.assertEqual(refdesSet, expected, text)
+			self.assertEqual(len(refdesSet), len(expected), text)
+			self.assertEqual(list(refdesSet), list(expected), text)
+
+	def test_spans(self):
+		self.assertEqual(parse_designators("R1, R2, R3-R5, R07, R8").entries,
+			[("R", 1, 5, None), ("R", 7, 7, "R07"), ("R", 8, 8, "R8")])
+		self.assertEqual(len(parse_designators("C1..C10, C10")), 11)
+
+class SpanTest(unittest.TestCase):
+	"""
+		A table of spans holds the same designators as the table of the
+		designators added one by one.
+	"""
+	def tables(self, cells):
+		spans = PartTable()
+		single = PartTable()
+		for text, name in cells:
+			spans.add_set(parse_designators(text), spans.add_part([name]))
+			part = single.add_part([name])
+			for refdes in parse_designators(text):
+				single.add(refdes, part)
+		return spans, single
+
+	def test_same_designators(self):
+		spans, single = self.tables([("R1-R400", "a"), ("R401..R420, C1-C40", "b"), ("R500, R5", "c")])
+		self.assertTrue(spans.ranges)
+		self.assertEqual(len(spans), len(single))
+		self.assertEqual(len(spans), 461)
+		self.assertEqual(sorted(spans.keys()), sorted(single.keys()))
+		self.assertEqual(spans.name("R5"), ("c",))
+		self.assertEqual(spans.name("R300"), ("a",))
+		self.assertEqual(spans.lookup("R421"), None)
+		self.assertEqual(spans.index().sorted_keys(), single.index().sorted_keys())
+		groups = spans.index().groups()
+		self.assertEqual([list(group) for group in groups], single.index().groups())
+		self.assertTrue(isinstance(groups[1], DesignatorSet))
+		self.assertEqual(spans.index().counts, single.index().counts)
+		self.assertEqual(spans.duplicates, single.duplicates)
+
+	def test_overlapping_spans(self):
+		spans, single = self.tables([("R1-R40", "a"), ("R20-R60", "b")])
+		self.assertEqual(len(spans), 60)
+		self.assertEqual(sorted(spans.keys()), sorted(single.keys()))
+		self.assertEqual(spans.name("R30"), ("b",))
+		self.assertEqual(spans.duplicates, single.duplicates)
+		self.assertEqual([list(group) for group in spans.index().groups()], single.index().groups())
+
+if __name__ == "__main__":
+	unittest.main()
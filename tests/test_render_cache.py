@@ -0,0 +1,88 @@
+# -*- coding: utf8 -*-
+
+import unittest
+import cStringIO
+from part_table import PartTable
+from render_cache import RenderCache
+from tex_writer import TexWriter
+from tests.support import settings, element_lines
+
+class RenderCacheTest(unittest.TestCase):
+	def test_eviction_order(self):
+		cache = RenderCache(3)
+		for key in "abc":
+			cache.put(key, key.upper())
+		# "a" becomes the most recently used one, "b" is evicted first
+		self.assertEqual(cache.get("a"), "A")
+		cache.put("d", "D")
+		self.assertEqual(cache.entries.keys(), ["c", "a", "d"])
+		self.assertEqual(cache.get("b"), None)
+		# Replacing the value refreshes the entry as well
+		cache.put("c", "C2")
+		cache.put("e", "E")
+		self.assertEqual(cache.entries.keys(), ["d", "c", "e"])
+		self.assertEqual(cache.get("c"), "C2")
+		self.assertEqual(cache.stats()["evictions"], 2)
+
+	def test_resize(self):
+		cache = RenderCache(4)
+		for key in "abcd":
+			cache.put(key, key)
+		cache.get("a")
+		cache.resize(2)
+		self.assertEqual(cache.entries.keys(), ["d", "a"])
+		cache.put("e", "e")
+		self.assertEqual(cache.entries.keys(), ["a", "e"])
+		cache.resize(0)
+		self.assertEqual(len(cache.entries), 0)
+		# A disabled cache keeps nothing
+		cache.put("f", "f")
+		self.assertEqual(cache.get("f"), None)
+		stats = cache.stats()
+		self.assertEqual((stats["evictions"], stats["size"], stats["maxSize"]), (5, 0, 0))
+
+	def test_stats(self):
+		cache = RenderCache(2)
+		cache.put("a", 1)
+		cache.get("a")
+		cache.get("a")
+		cache.get("b")
+		self.assertEqual(cache.stats(), {"hits": 2, "misses": 1, "evictions": 0, "size": 1, "maxSize": 2})
+		cache.clear()
+		self.assertEqual(cache.get("a"), None)
+		self.assertEqual(cache.stats()["misses"], 2)
+
+class QuoteStateTest(unittest.TestCase):
+	"""
+		The same names rendered after an odd and an even number of quotes are
+		cached apart, so the hits keep the paired quotes.
+	"""
+	def render(self, cache):
+		table = PartTable()
+		opened = table.add_part(('a "b',))
+		quoted = table.add_part(('c "d"',))
+		for refdes, part in (("R1", opened), ("R2", quoted), ("R3", opened), ("R4", quoted)):
+			table.add(refdes, part)
+		tex = TexWriter(settings(), table, {})
+		tex.renderCache = cache
+		sink = cStringIO.StringIO()
+		tex.write_file(sink)
+		return element_lines(sink.getvalue())
+
+	def test_quote_state(self):
+		cache = RenderCache()
+		expected = ["\\Element{a <<b}{\\refbox{R1}}{1}",
+			"\\Element{c >>d<<}{\\refbox{R2}}{1}",
+			"\\Element{a >>b}{\\refbox{R3}}{1}",
+			"\\Element{c <<d>>}{\\refbox{R4}}{1}"]
+		self.assertEqual(self.render(cache), expected)
+		self.assertEqual(cache.stats()["misses"], 4)
+		self.assertEqual(cache.stats()["hits"], 0)
+		# Every name is taken from the cache
+		self.assertEqual(self.render(cache), expected)
+		self.assertEqual(cache.stats()["misses"], 4)
+		self.assertEqual(cache.stats()["hits"], 4)
+		self.assertEqual(self.render(RenderCache(0)), expected)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,57 @@
+# -*- coding: utf8 -*-
+
+import unittest
+from parser_bom import BomParser
+from tex_writer import TexWriter, TextSink
+from stage_profiler import profiler
+from render_cache import renderCache
+from tests.support import data_file, load_config, settings
+
+class StageProfilerTest(unittest.TestCase):
+	"""
+		The profiler wraps the classes for good, so the shared one is used.
+	"""
+	def setUp(self):
+		profiler.instrument()
+		self.fmt, self.dsc = load_config()
+		self.bom = BomParser(data_file("bom.csv"), self.fmt.dictFormat, self.dsc.dictDescription,
+			dictTemplate = self.fmt.dictTemplate)
+		# Cached names are not escaped again
+		renderCache.clear()
+		profiler.reset()
+
+	def calls(self, stage):
+		return profiler.stages[stage][1]
+
+	def test_parallel_fallback_is_timed_once(self):
+		tex = TexWriter(settings(), self.bom.data, self.dsc.dictDescription)
+		# A single job writes the document by write_file()
+		tex.write_parallel(1, TextSink())
+		self.assertEqual(self.calls("write"), 1)
+		tex.write_file(TextSink())
+		self.assertEqual(self.calls("write"), 2)
+
+	def test_stages_of_conversion(self):
+		profiler.reset()
+		bom = BomParser(data_file("bom.csv"), self.fmt.dictFormat, self.dsc.dictDescription,
+			dictTemplate = self.fmt.dictTemplate)
+		TexWriter(settings(), bom.data, self.dsc.dictDescription).write_file(TextSink())
+		self.assertEqual(profiler.rows, 12)
+		for stage in ("csv", "compose", "table", "sort", "group", "escape", "beautify", "write"):
+			self.assertTrue(self.calls(stage) > 0, stage)
+
+	def test_sort_of_flat_list(self):
+		profiler.reset()
+		bom = BomParser(data_file("bom.csv"), self.fmt.dictFormat, self.dsc.dictDescription,
+			dictTemplate = self.fmt.dictTemplate)
+		# The designators are sorted by the index built with the table
+		self.assertEqual(self.calls("sort"), 1)
+		self.assertTrue(profiler.stages["sort"][0] > 0)
+		TexWriter(settings(group = "flat"), bom.data, self.dsc.dictDescription)
+		self.assertEqual(self.calls("sort"), 1)
+		# The ungrouped list expands the spans of the index
+		TexWriter(settings(group = "none"), bom.data, self.dsc.dictDescription)
+		self.assertEqual(self.calls("sort"), 2)
+
+if __name__ == "__main__":
+	unittest.main()
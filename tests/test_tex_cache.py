@@ -0,0 +1,144 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import unittest
+import subprocess
+import converter
+import tex_cache
+from converter import convert_file
+from tex_cache import TexCache
+from tests.support import TempDirTestCase, data_file, read_file, write_file, load_config, settings
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bomparser.py")
+
+def fail(*args, **kwargs):
+	raise AssertionError("the document is not taken from the cache")
+
+class VersionTest(TempDirTestCase):
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		self.fmt, self.dsc = load_config()
+		self.fileBom = self.copy_data("bom.csv")
+		self.settings = settings(fileTex = self.path("bom.tex"))
+		self.version = tex_cache.CACHE_VERSION
+
+	def tearDown(self):
+		tex_cache.CACHE_VERSION = self.version
+		TempDirTestCase.tearDown(self)
+
+	def cache(self):
+		return TexCache(self.fmt.dictFormat, self.dsc.dictDescription, self.path("cache"))
+
+	def test_documents_of_other_version_are_dropped(self):
+		tex_cache.CACHE_VERSION = "old"
+		cache = self.cache()
+		key = cache.key(self.fileBom, self.settings)
+		write_file(self.path("old.tex"), "old document")
+		cache.store(key, self.path("old.tex"))
+		self.assertTrue(cache.fetch(key, self.settings["fileTex"]))
+		tex_cache.CACHE_VERSION = self.version
+		cache = self.cache()
+		self.assertFalse(cache.fetch(cache.key(self.fileBom, self.settings), self.settings["fileTex"]))
+		self.assertFalse(cache.fetch(key, self.settings["fileTex"]))
+
+class TexCacheTest(TempDirTestCase):
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		self.fmt, self.dsc = load_config()
+		self.fileBom = self.copy_data("bom.csv")
+
+	def cache(self, dictDescription = None, maxSize = tex_cache.CACHE_SIZE):
+		if dictDescription is None:
+			dictDescription = self.dsc.dictDescription
+		return TexCache(self.fmt.dictFormat, dictDescription, self.path("cache"), maxSize)
+
+	def entries(self):
+		return sorted([name for name in os.listdir(self.path("cache")) if name.endswith(".tex")])
+
+	def store(self, cache, name, data, mtime = None):
+		"""
+			Puts the document with the key name to the cache.
+		"""
+		write_file(self.path("doc.tex"), data)
+		cache.store(name, self.path("doc.tex"))
+		if mtime is not None:
+			os.utime(os.path.join(self.path("cache"), name + ".tex"), (mtime, mtime))
+
+	def test_hit_skips_conversion(self):
+		cache = self.cache()
+		convert_file(self.fileBom, settings(output = self.path("first.tex")), self.fmt, self.dsc, cache)
+		self.assertEqual(len(self.entries()), 1)
+		parser, writer = converter.BomParser, converter.TexWriter
+		converter.BomParser = converter.TexWriter = fail
+		try:
+			convert_file(self.fileBom, settings(output = self.path("second.tex")), self.fmt, self.dsc, cache)
+		finally:
+			converter.BomParser, converter.TexWriter = parser, writer
+		self.assertEqual(read_file(self.path("second.tex")), read_file(self.path("first.tex")))
+		self.assertEqual(read_file(self.path("second.tex")), read_file(data_file("bom_flat.tex")))
+
+	def test_settings_change_the_key(self):
+		cache = self.cache()
+		keys = set([cache.key(self.fileBom, settings(group = group, strings = strings, fileTex = "bom.tex"))
+			for group in ("flat", "none") for strings in (0, 3)])
+		self.assertEqual(len(keys), 4)
+		self.assertNotEqual(cache.key(self.fileBom, settings(fileTex = "bom.tex.gz")),
+			cache.key(self.fileBom, settings(fileTex = "bom.tex")))
+
+	def test_config_change_clears_entries(self):
+		cache = self.cache()
+		self.store(cache, "a", "first")
+		self.store(cache, "b", "second")
+		# The same configuration keeps the entries
+		cache = self.cache()
+		self.assertEqual(self.entries(), ["a.tex", "b.tex"])
+		dictDescription = dict(self.dsc.dictDescription)
+		dictDescription["L"] = ["Дроссель", "Дроссели"]
+		cache = self.cache(dictDescription)
+		self.assertEqual(self.entries(), [])
+		self.assertFalse(cache.fetch("a", self.path("out.tex")))
+		self.store(cache, "c", "third")
+		# Back to the first configuration, the format file changed as well
+		dictFormat = dict(self.fmt.dictFormat)
+		dictFormat["*"] = []
+		TexCache(dictFormat, self.dsc.dictDescription, self.path("cache"))
+		self.assertEqual(self.entries(), [])
+
+	def test_eviction(self):
+		cache = self.cache(maxSize = 25)
+		self.store(cache, "a", "a" * 10, 100)
+		self.store(cache, "b", "b" * 10, 200)
+		# The fetched entry becomes the most recently used one
+		self.assertTrue(cache.fetch("a", self.path("out.tex")))
+		self.store(cache, "c", "c" * 10)
+		self.assertEqual(self.entries(), ["a.tex", "c.tex"])
+		self.assertFalse(cache.fetch("b", self.path("out.tex")))
+		self.store(cache, "d", "d" * 20)
+		self.assertEqual(self.entries(), ["d.tex"])
+		# A document larger than the cache is not kept
+		self.store(cache, "e", "e" * 30)
+		self.assertEqual(self.entries(), [])
+
+	def run_script(self, *args):
+		command = [sys.executable, SCRIPT, "-f", data_file("format"), "-d", data_file("description"),
+			"--cache-dir", "cache"]
+		process = subprocess.Popen(command + list(args), cwd = self.directory, stdout = subprocess.PIPE,
+			stderr = subprocess.STDOUT)
+		process.communicate()
+		return process.returncode
+
+	def test_no_cache(self):
+		self.assertEqual(self.run_script(self.fileBom), 0)
+		entries = self.entries()
+		self.assertEqual(len(entries), 1)
+		# A damaged entry is taken as it is unless the cache is bypassed
+		write_file(os.path.join(self.path("cache"), entries[0]), "cached")
+		self.assertEqual(self.run_script(self.fileBom), 0)
+		self.assertEqual(read_file(self.path("bom.tex")), "cached")
+		self.assertEqual(self.run_script("--no-cache", self.fileBom), 0)
+		self.assertEqual(read_file(self.path("bom.tex")), read_file(data_file("bom_flat.tex")))
+		self.assertEqual(read_file(os.path.join(self.path("cache"), entries[0])), "cached")
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf8 -*-
+
+import unittest
+from parser_format import FormatParser
+from parser_refdes import RefDesParser
+from tex_diff import write_incremental
+from tests.support import TempDirTestCase, data_file, read_file, write_file, load_config, settings
+
+class IncrementalTest(TempDirTestCase):
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		self.fileBom = self.copy_data("bom.csv")
+		self.settings = settings(incremental = True, fileTex = self.path("bom.tex"))
+
+	def convert(self, fmt, dsc):
+		return write_incremental(self.fileBom, self.settings, fmt.dictFormat, dsc.dictDescription, fmt.dictTemplate)
+
+	def statuses(self, summary):
+		return dict([(section["type"], section["status"]) for section in summary["sections"]])
+
+	def test_unchanged(self):
+		fmt, dsc = load_config()
+		self.assertTrue(self.convert(fmt, dsc)["full"])
+		summary = self.convert(fmt, dsc)
+		self.assertFalse(summary["full"])
+		self.assertEqual(set(self.statuses(summary).values()), set(["unchanged"]))
+		self.assertEqual(read_file(self.path("bom.tex")), read_file(data_file("bom_flat.tex")))
+
+	def test_changed_section(self):
+		fmt, dsc = load_config()
+		self.convert(fmt, dsc)
+		write_file(self.fileBom, read_file(self.fileBom).replace('"DA1","LM358"', '"DA1","LM324"'))
+		summary = self.convert(fmt, dsc)
+		statuses = self.statuses(summary)
+		self.assertEqual(statuses.pop("DA"), "changed")
+		self.assertEqual(set(statuses.values()), set(["unchanged"]))
+		self.assertEqual(summary["sections"][1]["changed"], ["DA1"])
+
+	def test_description_changed(self):
+		fmt, dsc = load_config()
+		self.convert(fmt, dsc)
+		description = read_file(data_file("description")).replace("Резисторы", "Сопротивления")
+		fileDescription = self.path("description")
+		write_file(fileDescription, description)
+		summary = self.convert(fmt, RefDesParser(fileDescription))
+		# The state of another configuration is not used
+		self.assertTrue(summary["full"])
+		document = read_file(self.path("bom.tex"))
+		self.assertIn("\\Part{Сопротивления}", document)
+		self.assertNotIn("\\Part{Резисторы}", document)
+
+	def test_format_changed(self):
+		fmt, dsc = load_config()
+		self.convert(fmt, dsc)
+		fileFormat = self.path("format")
+		write_file(fileFormat, read_file(data_file("format")).replace("field6, field2", "field2, field6"))
+		summary = self.convert(FormatParser(fileFormat), dsc)
+		self.assertTrue(summary["full"])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf8 -*-
+
+import sys
+import unittest
+import cStringIO
+import bomparser
+from tex_output import OutputBuffer, open_output, BUFFER_SIZE
+from tests.support import TempDirTestCase, data_file, read_file
+
+class ChunkSink:
+	"""
+		In-memory sink remembering the sizes of the writes.
+	"""
+	def __init__(self):
+		self.data = cStringIO.StringIO()
+		self.writes = []
+		self.flushes = 0
+
+	def write(self, data):
+		self.writes.append(len(data))
+		self.data.write(data)
+
+	def flush(self):
+		self.flushes += 1
+
+class OutputBufferTest(unittest.TestCase):
+	def test_chunks(self):
+		sink = ChunkSink()
+		output = OutputBuffer(sink)
+		lines = ["\\Element{Резистор %d}{\\refbox{R%d}}{1}\n" % (index, index) for index in range(30000)]
+		for line in lines:
+			output.write(line)
+		self.assertTrue(len(sink.writes) > 1)
+		# Every chunk passed to the sink takes at least the whole buffer
+		for size in sink.writes:
+			self.assertTrue(BUFFER_SIZE <= size < BUFFER_SIZE + len(lines[-1]), size)
+		written = sum(sink.writes)
+		output.close()
+		self.assertTrue(sum(sink.writes) - written < BUFFER_SIZE)
+		self.assertEqual(sink.data.getvalue(), ''.join(lines))
+		self.assertEqual(sink.flushes, 1)
+
+	def test_unicode(self):
+		sink = cStringIO.StringIO()
+		output = OutputBuffer(sink)
+		output.write(u"Резистор, ")
+		output.write("0603")
+		output.close()
+		# The sink is left open
+		self.assertEqual(sink.getvalue(), "Резистор, 0603")
+
+	def test_exact_buffer(self):
+		sink = ChunkSink()
+		output = OutputBuffer(sink, bufferSize = 8)
+		output.write("1234")
+		self.assertEqual(sink.writes, [])
+		output.write("5678")
+		self.assertEqual(sink.writes, [8])
+		output.flush()
+		self.assertEqual(sink.writes, [8])
+		output.write("9")
+		output.close()
+		self.assertEqual(sink.writes, [8, 1])
+		self.assertEqual(sink.data.getvalue(), "123456789")
+
+	def test_open_output(self):
+		sink = cStringIO.StringIO()
+		output = open_output("bom.tex", sink)
+		self.assertFalse(output.owned)
+		output.write("text")
+		output.close()
+		self.assertEqual(sink.getvalue(), "text")
+
+class StandardOutputTest(TempDirTestCase):
+	def run_main(self, *args):
+		"""
+			Runs the program with the standard output taken by a buffer.
+
+			return:		the data written to the standard output.
+		"""
+		stdout, stderr = sys.stdout, sys.stderr
+		sink = cStringIO.StringIO()
+		sys.stdout = sink
+		sys.stderr = cStringIO.StringIO()
+		try:
+			bomparser.main(["-f", data_file("format"), "-d", data_file("description"), "--no-cache"] + list(args))
+		finally:
+			sys.stdout, sys.stderr = stdout, stderr
+		return sink.getvalue()
+
+	def test_standard_output(self):
+		fileBom = self.copy_data("bom.csv")
+		for options in ([], ["-g", "none", "-s", "4"], ["--stream"], ["-r", "2"]):
+			output = self.run_main(*(options + ["-o", self.path("bom.tex"), fileBom]))
+			document = read_file(self.path("bom.tex"))
+			self.assertNotIn("\\begin", output)
+			self.assertEqual(self.run_main(*(options + ["-o", "-", fileBom])), document)
+		self.assertEqual(document, read_file(data_file("bom_flat.tex")))
+
+if __name__ == "__main__":
+	unittest.main()
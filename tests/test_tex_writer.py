@@ -0,0 +1,253 @@
+# -*- coding: utf8 -*-
+
+import re
+import random
+import unittest
+import cStringIO
+from converter import convert_file
+from parser_bom import BomParser
+from part_table import PartTable
+from tex_writer import TexWriter
+from tests.support import TempDirTestCase, data_file, read_file, write_file, load_config, settings, element_lines
+
+def baseline_sort(refdes):
+	"""
+		Sorting of the first version of TexWriter: by the position number, then
+		by the type, both sorts being stable.
+	"""
+	elements = [(re.sub('[0-9]', '', each), int(re.sub('[A-Z\-\_\.]', '', each.upper())), each) for each in refdes]
+	elements.sort(key = lambda element: element[1])
+	elements.sort(key = lambda element: element[0])
+	return [element[2] for element in elements]
+
+def baseline_groups(sortedKeys, names):
+	"""
+		Grouping of the first version of TexWriter, the loop removing the grouped
+		refdes from the list.
+
+		sortedKeys:	the sorted refdes;
+		names:		refdes -> name parts;
+		return:		a list of groups.
+	"""
+	refdes = list(sortedKeys)
+	groupedKeys = []
+	for currentElement in refdes:
+		if len(refdes) == refdes.index(currentElement) + 1:
+			pass
+		else:
+			process = True
+			offset = 1
+			currentType = re.sub('[0-9]', '', currentElement)
+			currentStr = names[currentElement]
+			currentGroup = [currentElement]
+			while process is True:
+				nextElement = refdes[refdes.index(currentElement) + offset]
+				nextType = re.sub('[0-9]', '', nextElement)
+				if currentType == nextType and list(currentStr) == list(names[nextElement]):
+					currentGroup.append(nextElement)
+					refdes.remove(nextElement)
+					if len(refdes) < refdes.index(currentElement) + offset + 1:
+						break
+				else:
+					process = False
+			groupedKeys.append(currentGroup)
+	return groupedKeys
+
+class GroupingTest(unittest.TestCase):
+	def random_table(self, rnd):
+		table = PartTable()
+		names = [("Resistor", str(value)) for value in range(3)]
+		used = set()
+		for index in range(rnd.randint(1, 60)):
+			refdes = "%s%d" % (rnd.choice(["C", "DA", "R"]), rnd.randint(1, 40))
+			if refdes in used:
+				continue
+			used.add(refdes)
+			table.add(refdes, table.add_part(rnd.choice(names)))
+		return table
+
+	def test_groups_match_baseline(self):
+		rnd = random.Random(1)
+		for attempt in range(300):
+			table = self.random_table(rnd)
+			tex = TexWriter(settings(), table, {})
+			names = dict([(refdes, table.name(refdes)) for refdes in table.keys()])
+			sortedKeys = baseline_sort(table.keys())
+			expected = baseline_groups(sortedKeys, names)
+			# The first version lost the last designator unless it joined a group
+			if sum([len(group) for group in expected]) < len(sortedKeys):
+				expected.append([sortedKeys[-1]])
+			self.assertEqual([list(group) for group in tex.groupedKeys], expected)
+
+	def test_groups_are_computed_once(self):
+		table = PartTable()
+		table.add("R1", table.add_part(["10k"]))
+		tex = TexWriter(settings(), table, {})
+		self.assertIs(tex.groupedKeys, tex.groupedKeys)
+		self.assertEqual(tex.sections()[0][1][0][1], ["R1"])
+
+# Replacements of the first version of TexWriter
+BASELINE_SPECIAL = {
+	'&': '\\&',
+	'%': '\\%',
+	'$': '\\$',
+	'#': '\\#',
+	'_': '\\_',
+	'{': '\\{',
+	'}': '\\}',
+	'"': '',
+	'~': '\\lettertilde{}',
+	'^': '\\letterhat{}',
+	'\\': '\\letterbackslash{}',
+	'\n': '\\\\',
+}
+
+def baseline_escape(text, firstQuote):
+	"""
+		Escaping of the first version of TexWriter, character by character.
+	"""
+	escaped = []
+	for char in text:
+		if char not in BASELINE_SPECIAL:
+			escaped.append(char)
+		elif char != '"':
+			escaped.append(BASELINE_SPECIAL[char])
+		elif firstQuote:
+			firstQuote = False
+			escaped.append('<<')
+		else:
+			firstQuote = True
+			escaped.append('>>')
+	return ''.join(escaped), firstQuote
+
+def baseline_beautify(elem):
+	"""
+		Clean up of the first version of TexWriter, a chain of substitutions
+		over the whole line.
+	"""
+	elem = re.sub('^[, ]*|[, ]*$', '', elem)
+	elem = re.sub(',{2,}', ',', elem)
+	elem = re.sub('(, ){2,}', ', ', elem)
+	elem = re.sub('( ){2,}', ' ', elem)
+	elem = re.sub(' *,', ',', elem)
+	elem = re.sub('\+-|\+\\-|\+/-', "$\\pm$", elem)
+	return elem
+
+# Pieces of the random strings: special characters of LaTeX, commas, spaces,
+# signs and Cyrillic
+PIECES = list(', , ,,  +-/"&%$#_{}~^\\\nab1') + ['\xd0\xb0', '+/-', ', ', '+-', ' ,']
+
+class EscapeTest(unittest.TestCase):
+	"""
+		The escaping and the clean up by precompiled expressions give the same
+		strings as the first version on random input.
+	"""
+	def setUp(self):
+		self.tex = TexWriter(settings(), PartTable(), {})
+		self.random = random.Random(5)
+
+	def random_text(self):
+		return ''.join([self.random.choice(PIECES) for index in range(self.random.randint(0, 25))])
+
+	def test_escape(self):
+		escape = self.tex._TexWriter__escape_latex
+		for attempt in range(20000):
+			text = self.random_text()
+			firstQuote = self.random.random() < 0.5
+			self.assertEqual(escape(text, firstQuote), baseline_escape(text, firstQuote), repr(text))
+
+	def test_beautify(self):
+		beautify = self.tex._TexWriter__beautifyStr
+		for attempt in range(20000):
+			text = self.random_text()
+			# A line ending with a line feed is never written
+			if text.endswith('\n'):
+				continue
+			self.assertEqual(beautify(text), baseline_beautify(text), repr(text))
+
+	def test_element_line(self):
+		"""
+			The name is cleaned up apart from the rest of the line.
+		"""
+		beautifyName = self.tex._TexWriter__beautifyName
+		beautify = self.tex._TexWriter__beautifyStr
+		for attempt in range(20000):
+			name = baseline_escape(self.random_text(), True)[0]
+			refdes = self.random.choice(['{\\refbox{R1}}{1}', '{\\refbox{R1, R2}}{2}', '{}{3}'])
+			line = baseline_beautify(''.join(['\\Element{', name, '}', refdes]))
+			self.assertEqual(''.join(['\\Element{', beautifyName(name), beautify('}' + refdes)]), line, repr(name))
+
+class DocumentTest(TempDirTestCase):
+	"""
+		The documents expected for the sample BOM were produced by the first
+		version of the program.
+	"""
+	def convert(self, **kwargs):
+		fmt, dsc = load_config()
+		fileTex = self.path("bom.tex")
+		convert_file(data_file("bom.csv"), settings(output = fileTex, **kwargs), fmt, dsc)
+		return read_file(fileTex)
+
+	def check(self, expectedName, **kwargs):
+		expected = read_file(data_file(expectedName))
+		document = self.convert(**kwargs)
+		self.assertEqual(element_lines(document), element_lines(expected))
+		self.assertEqual(document, expected)
+
+	def test_flat(self):
+		self.check("bom_flat.tex")
+
+	def test_flat_empty_lines(self):
+		self.check("bom_flat_s3.tex", strings = 3)
+
+	def test_ungrouped_empty_lines(self):
+		self.check("bom_none_s4.tex", group = "none", strings = 4)
+
+class ParallelTest(TempDirTestCase):
+	"""
+		Sections rendered by the processes make the same document as the one
+		written in turn. A quote opened in a section is closed in the following
+		ones, so the names of every type hold odd and even numbers of quotes.
+	"""
+	def random_bom(self, rnd):
+		rows = ["Designator,Value,Manufacturer,ManufacturerPartNumber,Quantity,Name,Package,Tolerance,TU/GOST,Type,Power/Voltage,TKC,TKE\n"]
+		numbers = {}
+		for index in range(rnd.randint(5, 60)):
+			elemType = rnd.choice(["C", "DA", "R", "V", "X"])
+			numbers[elemType] = numbers.get(elemType, 0) + rnd.randint(1, 3)
+			value = rnd.choice(["10k", '5""x', '"" a ""', "1k"])
+			maker = rnd.choice(["Yageo", 'a ""b', ""])
+			rows.append('"%s%d","%s","%s","P","1","N","0603","","","","","",""\n' %
+				(elemType, numbers[elemType], value, maker))
+		fileBom = self.path("bom.csv")
+		write_file(fileBom, ''.join(rows))
+		return fileBom
+
+	def render(self, bom, dsc, jobs, **kwargs):
+		sink = cStringIO.StringIO()
+		tex = TexWriter(settings(**kwargs), bom.data, dsc.dictDescription)
+		if jobs:
+			tex.write_parallel(jobs, sink)
+		else:
+			tex.write_file(sink)
+		return sink.getvalue()
+
+	def test_same_as_serial(self):
+		fmt, dsc = load_config()
+		rnd = random.Random(14)
+		for attempt in range(8):
+			bom = BomParser(self.random_bom(rnd), fmt.dictFormat, dsc.dictDescription, dictTemplate = fmt.dictTemplate)
+			for group, strings in (("flat", 0), ("flat", 2), ("none", 3)):
+				serial = self.render(bom, dsc, 0, group = group, strings = strings)
+				self.assertTrue(serial.count("\\Part{") > 2)
+				self.assertEqual(self.render(bom, dsc, 3, group = group, strings = strings), serial)
+
+	def test_quotes_across_sections(self):
+		fmt, dsc = load_config()
+		bom = BomParser(data_file("bom.csv"), fmt.dictFormat, dsc.dictDescription, dictTemplate = fmt.dictTemplate)
+		serial = self.render(bom, dsc, 0, strings = 1)
+		self.assertIn("<<", serial)
+		self.assertEqual(self.render(bom, dsc, 2, strings = 1), serial)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,105 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import unittest
+from watcher import BomWatcher
+from tests.support import TempDirTestCase, data_file, read_file, write_file, load_config, settings
+
+class WatcherTest(TempDirTestCase):
+	"""
+		The watcher is driven by scan() and convert_pending() with a single
+		worker process.
+	"""
+	def setUp(self):
+		TempDirTestCase.setUp(self)
+		self.stdout = sys.stdout
+		sys.stdout = open(os.devnull, "w")
+		self.fileBom = self.copy_data("bom.csv")
+		fileFormat = self.copy_data("format")
+		fileDescription = self.copy_data("description")
+		fmt, dsc = load_config()
+		options = settings(fileFormat = fileFormat, fileDescription = fileDescription, cache = False)
+		self.watcher = BomWatcher([self.directory], options, fmt, dsc, 1, 0, 0)
+		self.watcher._BomWatcher__start_pool()
+
+	def tearDown(self):
+		self.watcher.pool.terminate()
+		self.watcher.pool.join()
+		sys.stdout.close()
+		sys.stdout = self.stdout
+		TempDirTestCase.tearDown(self)
+
+	def rewrite(self, fileName, data):
+		"""
+			Writes the file making sure its modification time changes.
+		"""
+		stamp = os.stat(fileName).st_mtime + 1
+		write_file(fileName, data)
+		os.utime(fileName, (stamp, stamp))
+
+	def convert(self):
+		self.watcher.scan()
+		return self.watcher.convert_pending()
+
+	def test_new_and_changed_files(self):
+		self.assertEqual(self.convert(), 1)
+		self.assertEqual(read_file(self.path("bom.tex")), read_file(data_file("bom_flat.tex")))
+		self.assertEqual(self.convert(), 0)
+		self.rewrite(self.fileBom, read_file(self.fileBom).replace("LM358", "LM324"))
+		self.assertEqual(self.convert(), 1)
+		self.assertIn("LM324", read_file(self.path("bom.tex")))
+
+	def test_delay(self):
+		self.watcher.delay = 60
+		self.assertEqual(self.convert(), 0)
+		self.assertEqual(list(self.watcher.pending), [self.fileBom])
+		# The file has not changed for the delay
+		self.watcher.delay = 0
+		self.assertEqual(self.watcher.convert_pending(), 1)
+		self.assertEqual(self.watcher.pending, {})
+
+	def test_touched_file(self):
+		self.assertEqual(self.convert(), 1)
+		os.remove(self.path("bom.tex"))
+		stamp = os.stat(self.fileBom).st_mtime + 10
+		os.utime(self.fileBom, (stamp, stamp))
+		self.watcher.scan()
+		self.assertEqual(list(self.watcher.pending), [self.fileBom])
+		# The content digest is the same
+		self.assertEqual(self.watcher.convert_pending(), 0)
+		self.assertFalse(os.path.exists(self.path("bom.tex")))
+
+	def test_listed_files(self):
+		write_file(self.path("bom-elements.csv"), "Type,Designator,Name,Quantity\n")
+		write_file(self.path("notes.txt"), "")
+		self.copy_data("bom.csv", "board.CSV")
+		self.watcher.scan()
+		self.assertEqual(sorted(self.watcher.stamps), [self.path("board.CSV"), self.fileBom])
+		self.assertEqual(self.watcher.convert_pending(), 2)
+		os.remove(self.fileBom)
+		self.watcher.scan()
+		self.assertEqual(list(self.watcher.stamps), [self.path("board.CSV")])
+		self.assertEqual(list(self.watcher.digests), [self.path("board.CSV")])
+
+	def test_config_changed(self):
+		self.assertEqual(self.convert(), 1)
+		fileDescription = self.path("description")
+		self.rewrite(fileDescription, read_file(fileDescription).replace("Резисторы", "Сопротивления"))
+		# All BOMs are converted again with the new configuration
+		self.assertEqual(self.convert(), 1)
+		self.assertIn("\\Part{Сопротивления}", read_file(self.path("bom.tex")))
+
+	def test_broken_config(self):
+		self.assertEqual(self.convert(), 1)
+		dsc = self.watcher.dsc
+		self.rewrite(self.path("description"), "")
+		self.assertEqual(self.convert(), 0)
+		# The previous configuration is kept
+		self.assertIs(self.watcher.dsc, dsc)
+		self.rewrite(self.fileBom, read_file(self.fileBom).replace("LM358", "LM324"))
+		self.assertEqual(self.convert(), 1)
+		self.assertIn("\\Part{Резисторы}", read_file(self.path("bom.tex")))
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,177 @@
+# -*- coding: utf8 -*-
+
+import os
+import shutil
+import hashlib
+import tempfile
+from tex_output import BUFFER_SIZE
+from compression import split_extension
+
+# Bump the version whenever the output of TexWriter changes, so that the
+# documents produced by older versions are not reused
+CACHE_VERSION = "2"
+CACHE_DIR = ".bomparser-cache"
+CACHE_SIZE = 64 * 1024 * 1024
+
+def config_digest(dictFormat, dictDescription):
+	"""
+		Computes a digest of the parsed configuration.
+
+		dictFormat:		format description from FormatParser;
+		dictDescription:	refdes descriptions from RefDesParser;
+		return:			hex digest string.
+	"""
+	digest = hashlib.sha1(CACHE_VERSION)
+	digest.update(repr(sorted(dictFormat.items())))
+	digest.update(repr(sorted(dictDescription.items())))
+	return digest.hexdigest()
+
+def file_digest(fileName):
+	"""
+		Computes a digest of the file content.
+
+		fileName:	the name of the file;
+		return:		hex digest string.
+	"""
+	digest = hashlib.sha1()
+	f = open(fileName, 'rb')
+	while True:
+		block = f.read(1 << 20)
+		if not block:
+			break
+		digest.update(block)
+	f.close()
+	return digest.hexdigest()
+
+class TexCache:
+	"""
+		On-disk cache of generated LaTeX documents. An entry is keyed on the content
+		of the BOM and the output settings; the whole cache is dropped when the
+		configuration changes. Least recently used entries are evicted once the
+		cache grows beyond maxSize bytes.
+	"""
+	def __init__(self, dictFormat, dictDescription, directory = CACHE_DIR, maxSize = CACHE_SIZE):
+		self.directory = directory
+		self.maxSize = maxSize
+		self.config = config_digest(dictFormat, dictDescription)
+		if not os.path.isdir(self.directory):
+			os.makedirs(self.directory)
+		self.__check_config()
+
+	def __check_config(self):
+		"""
+			Clears the cache if it was filled with a different configuration.
+		"""
+		fileConfig = os.path.join(self.directory, "config")
+		try:
+			f = open(fileConfig)
+			config = f.read().strip()
+			f.close()
+		except IOError:
+			config = None
+		if config == self.config:
+			return
+		for name, path, size, mtime in self.__entries():
+			self.__remove(path)
+		self.__write_atomic(fileConfig, self.config)
+
+	def __entries(self):
+		"""
+			Lists the cache entries.
+
+			return:		a list of (name, path, size, modification time) tuples.
+		"""
+		entries = []
+		for name in os.listdir(self.directory):
+			if not name.endswith(".tex"):
+				continue
+			path = os.path.join(self.directory, name)
+			try:
+				stat = os.stat(path)
+			except OSError:
+				# Removed by a concurrent process
+				continue
+			entries.append((name, path, stat.st_size, stat.st_mtime))
+		return entries
+
+	def __remove(self, path):
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+
+	def __write_atomic(self, fileName, data):
+		hnd, tmpName = tempfile.mkstemp(dir = self.directory, prefix = ".tmp")
+		os.write(hnd, data)
+		os.close(hnd)
+		os.rename(tmpName, fileName)
+
+	def key(self, fileBom, settings):
+		"""
+			Computes the cache key for the BOM converted with the settings given.
+
+			fileBom:	the name of the BOM file;
+			settings:	the settings dictionary;
+			return:		the key string.
+		"""
+		digest = hashlib.sha1(self.config)
+		digest.update(repr((settings["group"], settings["strings"])))
+		# A compressed document is cached as is
+		compression = split_extension(settings.get("fileTex", ""))[1]
+		if compression is not None:
+			digest.update(compression)
+		digest.update(file_digest(fileBom))
+		return digest.hexdigest()
+
+	def fetch(self, key, fileTex, sink = None):
+		"""
+			Copies the cached document to fileTex.
+
+			key:		the key returned by key();
+			fileTex:	the name of the output file;
+			sink:		binary file-like object to copy the document to instead of fileTex;
+			return:		True on cache hit, False otherwise.
+		"""
+		path = os.path.join(self.directory, key + ".tex")
+		try:
+			if sink is None:
+				shutil.copyfile(path, fileTex)
+			else:
+				f = open(path, 'rb')
+				shutil.copyfileobj(f, sink, BUFFER_SIZE)
+				f.close()
+				sink.flush()
+			# The modification time keeps the order of use for eviction
+			os.utime(path, None)
+		except (IOError, OSError):
+			return False
+		return True
+
+	def store(self, key, fileTex):
+		"""
+			Puts the document to the cache and evicts old entries if needed.
+
+			key:		the key returned by key();
+			fileTex:	the name of the generated file;
+			return:		none.
+		"""
+		hnd, tmpName = tempfile.mkstemp(dir = self.directory, prefix = ".tmp")
+		os.close(hnd)
+		shutil.copyfile(fileTex, tmpName)
+		os.rename(tmpName, os.path.join(self.directory, key + ".tex"))
+		self.evict()
+
+	def evict(self):
+		"""
+			Removes least recently used entries until the cache fits into maxSize.
+		"""
+		entries = self.__entries()
+		total = sum([entry[2] for entry in entries])
+		if total <= self.maxSize:
+			return
+		entries.sort(key = lambda entry: entry[3])
+		for name, path, size, mtime in entries:
+			if total <= self.maxSize:
+				break
+			self.__remove(path)
+			total -= size
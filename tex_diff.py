@@ -0,0 +1,154 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import json
+import hashlib
+import cPickle
+import tempfile
+from parser_bom import BomParser
+from tex_writer import TexWriter
+from tex_output import open_output
+from compression import open_input
+from tex_cache import config_digest
+
+STATE_VERSION = 3
+
+def state_file_name(fileTex):
+	"""
+		Returns the name of the file keeping the state of the previous conversion.
+	"""
+	return fileTex + ".state"
+
+def load_state(fileTex, settings, config):
+	"""
+		Loads the state of the previous conversion. The state is discarded if it was
+		produced with other settings or configuration, or the document was changed
+		since then.
+
+		fileTex:	the name of the LaTeX file;
+		settings:	the settings dictionary;
+		config:		the digest of the configuration returned by config_digest();
+		return:		the state dictionary or None.
+	"""
+	try:
+		f = open(state_file_name(fileTex), 'rb')
+		state = cPickle.load(f)
+		f.close()
+		f = open_input(fileTex)
+		digest = hashlib.sha1(f.read()).hexdigest()
+		f.close()
+	except (IOError, EOFError, cPickle.UnpicklingError):
+		return None
+	if state.get("version") != STATE_VERSION:
+		return None
+	if state["settings"] != (settings["group"], settings["strings"]):
+		return None
+	# The titles of the sections come from the description file
+	if state["config"] != config:
+		return None
+	if state["digest"] != digest:
+		return None
+	return state
+
+def diff_section(oldTable, newTable):
+	"""
+		Compares designator tables of a section.
+
+		oldTable:	a list of (refdes, name parts) tuples of the previous conversion;
+		newTable:	a list of (refdes, name parts) tuples of the current conversion;
+		return:		a tuple of sorted lists (added, removed, changed refdes).
+	"""
+	oldNames = dict(oldTable)
+	newNames = dict(newTable)
+	added = [refdes for refdes, name in newTable if refdes not in oldNames]
+	removed = [refdes for refdes, name in oldTable if refdes not in newNames]
+	changed = [refdes for refdes, name in newTable
+		if refdes in oldNames and oldNames[refdes] != name]
+	return added, removed, changed
+
+def write_incremental(fileBom, settings, dictFormat, dictDescription, dictTemplate = None, source = None):
+	"""
+		Converts the BOM file to LaTeX document re-rendering only the sections whose
+		elements were changed since the previous conversion. The sections rendered
+		before are taken from the state file kept next to the document.
+
+		fileBom:		the name of the BOM file;
+		settings:		the settings dictionary, as for TexWriter;
+		dictFormat:		format description from FormatParser;
+		dictDescription:	refdes descriptions from RefDesParser;
+		dictTemplate:		compiled format templates from FormatParser;
+		source:			the input of the BOM file opened in advance, see BomParser;
+		return:			the change summary dictionary.
+	"""
+	fileTex = settings["fileTex"]
+	bom = BomParser(fileBom, dictFormat, dictDescription, dictTemplate = dictTemplate,
+		jobs = settings.get("parseJobs", 0), source = source)
+	tex = TexWriter(settings, bom.data, dictDescription)
+	config = config_digest(dictFormat, dictDescription)
+	state = load_state(fileTex, settings, config)
+	oldSections = {}
+	if state is not None:
+		for section in state["sections"]:
+			oldSections[section[0]] = section
+
+	summary = {"bom": fileBom, "tex": fileTex, "full": state is None, "sections": []}
+	sections = []
+	firstQuote = True
+	for elemType, groups in tex.sections():
+		table = []
+		for groupType, refdes, nameParts, plural in groups:
+			name = tuple(nameParts)
+			table.extend([(each, name) for each in refdes])
+		old = oldSections.pop(elemType, None)
+		if old is not None and old[1] == table and old[2] == firstQuote:
+			text = old[4]
+			quoteOut = old[3]
+			status = "unchanged"
+		else:
+			text, quoteOut = tex.render_section(groups, firstQuote)
+			status = "added" if old is None else "changed"
+		entry = {"type": elemType, "status": status}
+		if old is not None and status == "changed":
+			entry["added"], entry["removed"], entry["changed"] = diff_section(old[1], table)
+		summary["sections"].append(entry)
+		sections.append((elemType, table, firstQuote, quoteOut, text))
+		firstQuote = quoteOut
+	summary["removed"] = sorted(oldSections.keys())
+
+	content = [tex.render_header()]
+	content.extend([section[4] for section in sections])
+	content.append(tex.render_footer())
+	data = ''.join(content)
+	f = open_output(fileTex)
+	f.write(data)
+	f.close()
+
+	state = {
+		"version": STATE_VERSION,
+		"settings": (settings["group"], settings["strings"]),
+		"config": config,
+		"digest": hashlib.sha1(data).hexdigest(),
+		"sections": sections,
+	}
+	fileState = state_file_name(fileTex)
+	hnd, tmpName = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(fileState)), prefix = ".tmp")
+	f = os.fdopen(hnd, 'wb')
+	cPickle.dump(state, f, cPickle.HIGHEST_PROTOCOL)
+	f.close()
+	os.rename(tmpName, fileState)
+	return summary
+
+def print_summary(summary, stream = None):
+	"""
+		Prints the change summary as a single line of JSON.
+
+		summary:	the summary returned by write_incremental();
+		stream:		text file-like object to print to, the standard output by default;
+		return:		none.
+	"""
+	if stream is None:
+		stream = sys.stdout
+	stream.write(json.dumps(summary, sort_keys = True) + "\n")
+	# The lines of the worker processes are not mixed
+	stream.flush()
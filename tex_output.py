@@ -0,0 +1,70 @@
+# -*- coding: utf8 -*-
+
+import sys
+from compression import CompressedFile, split_extension
+from io_pipeline import BackgroundWriter
+
+# Amount of data collected before it is passed to the sink
+BUFFER_SIZE = 256 * 1024
+
+class OutputBuffer:
+	"""
+		Buffered writer on top of any binary file-like object: a file, the standard
+		output, a pipe or an in-memory buffer. Unicode strings are encoded, byte
+		strings are expected to be in UTF-8 already and are passed as is. The data
+		reaches the sink in large chunks.
+	"""
+	def __init__(self, sink, owned = False, bufferSize = BUFFER_SIZE):
+		self.sink = sink
+		self.owned = owned
+		self.bufferSize = bufferSize
+		self.chunks = []
+		self.size = 0
+
+	def write(self, data):
+		if isinstance(data, unicode):
+			data = data.encode("utf-8")
+		self.chunks.append(data)
+		self.size += len(data)
+		if self.size >= self.bufferSize:
+			self.flush()
+
+	def flush(self):
+		if self.chunks:
+			self.sink.write(''.join(self.chunks))
+			self.chunks = []
+			self.size = 0
+
+	def close(self):
+		"""
+			Writes the rest of the data. The sink is closed only if it was opened
+			by open_output().
+		"""
+		self.flush()
+		if self.owned:
+			self.sink.close()
+		else:
+			self.sink.flush()
+
+def open_output(fileName, sink = None, background = False):
+	"""
+		Opens the buffered output.
+
+		fileName:	the name of the file to create, "-" stands for the standard output;
+					the file is compressed if its name ends with .gz, .xz or .bz2;
+		sink:		binary file-like object to write to instead of the file;
+		background:	write and compress the file in a background thread;
+		return:		OutputBuffer object.
+	"""
+	if sink is not None:
+		return OutputBuffer(sink)
+	if fileName == "-":
+		return OutputBuffer(sys.stdout)
+	base, fmt = split_extension(fileName)
+	if fmt is not None:
+		hndFile = CompressedFile(fileName, fmt)
+	else:
+		hndFile = open(fileName, 'wb')
+	if background:
+		hndFile = BackgroundWriter(hndFile)
+	return OutputBuffer(hndFile, owned = True)
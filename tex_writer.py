@@ -2,68 +2,296 @@
 
 import os
 import re
-import operator
-import codecs
+import multiprocessing
+from tex_output import open_output
+from render_cache import renderCache
+
+# Special characters of LaTeX and their replacements. Quotes are handled
+# separately as they are replaced with paired typographic symbols.
+LATEX_SPECIAL = {
+	'&': '\&',
+	'%': '\%',
+	'$': '\$',
+	'#': '\#',
+	'_': '\_',
+	'{': '\{',
+	'}': '\}',
+	'~': '\lettertilde{}',
+	'^': '\letterhat{}',
+	'\\': '\letterbackslash{}',
+	'\n': '\\\\',
+}
+LATEX_SPECIAL_RE = re.compile('[&%$#_{}~^\\\\\n]')
+
+# Runs of two or more commas and spaces, and plus-minus signs
+BEAUTIFY_RE = re.compile(r'[, ]{2,}|\+/?-')
+COMMAS_RE = re.compile(',{2,}')
+COMMA_SPACES_RE = re.compile('(, ){2,}')
+SPACES_RE = re.compile('( ){2,}')
+SPACE_COMMA_RE = re.compile(' *,')
+
+def _replace_special(match):
+	return LATEX_SPECIAL[match.group(0)]
+
+def clean_run(run):
+	"""
+		Cleans up a single run of commas and spaces. The rules are applied in
+		the same order as they used to be applied to the whole string, none of
+		them reaches beyond the run.
+	"""
+	# Replace the sequences of commas with just one
+	# corresponding symbol
+	run = COMMAS_RE.sub(',', run)
+	run = COMMA_SPACES_RE.sub(', ', run)
+	# Remove excessive spaces
+	run = SPACES_RE.sub(' ', run)
+	# Remove spaces before comma
+	run = SPACE_COMMA_RE.sub(',', run)
+	return run
+
+def _beautify_match(match):
+	"""
+		Cleans up a single run of commas and spaces or puts a plus-minus symbol.
+	"""
+	run = match.group(0)
+	if run[0] == '+':
+		return "$\\pm$"
+	return clean_run(run)
 
-class Element:
+class TextSink(list):
 	"""
-		Helper class wich will be used for sorting.
+		File-like object collecting the written strings in memory as UTF-8.
 	"""
-	def __init__(self, refdes, element, pos):
-		self.refdes = refdes
-		self.element = element
-		self.pos = pos
+	def write(self, text):
+		if isinstance(text, unicode):
+			text = text.encode("utf-8")
+		self.append(text)
+
+	def flush(self):
+		pass
+
+	def getvalue(self):
+		return ''.join(self)
+
+# The writer and its sections shared by the rendering processes, set up by the
+# pool initializer and inherited by the forked workers
+_config = {}
 
-	def __repr__(self):
-		return repr((self.refdes, self.element, self.pos))
+def _init_render_worker(tex, sections):
+	# Drop the statistics inherited from the main process
+	from stage_profiler import profiler
+	profiler.reset()
+	_config["tex"] = tex
+	_config["sections"] = sections
+
+def _render_job(args):
+	"""
+		Renders one section in a worker process.
+
+		args:		a tuple (index of the section, quote state at its start);
+		return:		a tuple (UTF-8 string, profiler statistics or None).
+	"""
+	index, firstQuote = args
+	text, firstQuote = _config["tex"].render_section(_config["sections"][index][1], firstQuote)
+	# Imported here, the profiler module imports the writer itself
+	from stage_profiler import profiler
+	stats = None
+	if profiler.enabled:
+		stats = profiler.collect()
+	return text, stats
 
 class TexWriter:
-	def __init__(self, settings, dictBom, dictDescription):
-		self.fileName = settings["fileTex"]
-		self.dictBom = dictBom
+	"""
+		Renders the parsed BOM to LaTeX. The writer keeps no state between the
+		calls of its output methods, so several threads may render the same
+		writer at once.
+	"""
+	def __init__(self, settings, partTable, dictDescription):
+		self.fileName = settings.get("fileTex")
+		# Files are written by a background thread
+		self.pipeline = settings.get("pipeline", False)
+		self.partTable = partTable
 		self.dictDescription = dictDescription
-		self.__firstQuote = True
-		self.sortedKeys = self.__sortElements(self.dictBom.keys())
-		self.groupedKeys = []
+		# Rendered names, shared by all writers unless replaced
+		self.renderCache = renderCache
+		# Positions and counts of the elements of every type
+		self.index = self.partTable.index()
 		self.groupMode = settings["group"]
 		self.strings = settings["strings"]
-		# This list will be used to check whether an element is unique or
-		# there are other elements of the same type
-		self.elementTypes = [re.sub('[0-9]', '', elem) for elem in self.sortedKeys]
-
-		self.latexSpecial = {
-			'&': '\&',
-			'%': '\%',
-			'$': '\$',
-			'#': '\#',
-			'_': '\_',
-			'{': '\{',
-			'}': '\}',
-			'"': '',
-			'~': '\lettertilde{}',
-			'^': '\letterhat{}',
-			'\\': '\letterbackslash{}',
-			'\n': '\\\\',
-		}
-		self.__combineElements()
-
-	def write_file(self):
+		# The ungrouped list is the only one needing the spans expanded
+		self.sortedKeys = None
+		if self.groupMode == "none":
+			self.sortedKeys = self.__sortElements(self.index)
+		# Rolled-up tables count the parts, not the designators
+		self.typeAmounts = None
+		if self.partTable.amounts is not None:
+			self.typeAmounts = dict([(elemType, sum([self.partTable.amounts[refdes] for refdes in self.index.refdes[elemType]]))
+				for elemType in self.index.types])
+
+		# Groups are computed once and reused by write_file()
+		if self.partTable.groups is not None:
+			self.groupedKeys = self.partTable.groups
+		else:
+			self.groupedKeys = self.__combineElements()
+
+	def write_file(self, sink = None):
 		"""
 		Create LaTeX document containing bill of materials.
 
-		input:			none;
+		sink:			binary file-like object to write the document to; by default
+						the file settings["fileTex"] is created, "-" stands for
+						the standard output;
 		return:			none.
 		"""
-		hndFile = codecs.open(self.fileName, mode='w', encoding='utf-8')
+		hndFile = open_output(self.fileName, sink, self.pipeline)
 		self.__write_header(hndFile)
 
 		if self.groupMode == "none":
 			self.__writeUngrouped(self.sortedKeys, hndFile)
 		else:
-			self.groupedKeys = self.__combineElements()
 			self.__writeGrouped(self.groupedKeys, hndFile)
+		self.__write_footer(hndFile)
+		hndFile.close()
+
+	def write_parallel(self, jobs, sink = None):
+		"""
+		Create LaTeX document rendering its sections in a pool of processes. The
+		quote state at the start of every section is found in advance by counting
+		the quotes of the names before it, and the empty string counter starts
+		over in every section, so the document is the same as of write_file().
+
+		jobs:			the number of worker processes;
+		sink:			binary file-like object, see write_file();
+		return:			none.
+		"""
+		sections = self.sections()
+		if jobs < 2 or len(sections) < 2:
+			self.write_file(sink)
+			return
+		starts = []
+		firstQuote = True
+		for elemType, groups in sections:
+			starts.append((len(starts), firstQuote))
+			for group in groups:
+				if ''.join(group[2]).count('"') & 1:
+					firstQuote = not firstQuote
+
+		from stage_profiler import profiler
+		hndFile = open_output(self.fileName, sink, self.pipeline)
+		self.__write_header(hndFile)
+		pool = multiprocessing.Pool(min(jobs, len(sections)), _init_render_worker, (self, sections))
+		try:
+			for text, stats in pool.imap(_render_job, starts):
+				if stats is not None:
+					profiler.merge(stats)
+				hndFile.write(text)
+			pool.close()
+		except:
+			pool.terminate()
+			raise
+		finally:
+			pool.join()
+		self.__write_footer(hndFile)
 		hndFile.close()
 
+	def write_stream(self, groups, sink = None):
+		"""
+		Create LaTeX document from a stream of already sorted and grouped elements.
+		The writer does not need to hold the whole BOM in this case.
+
+		groups:			an iterable of (type, refdes list, name parts, plural) tuples, where
+						plural tells whether the type of the group has more than one element;
+		sink:			binary file-like object, see write_file();
+		return:			none.
+		"""
+		hndFile = open_output(self.fileName, sink, self.pipeline)
+		self.__write_header(hndFile)
+		self.__writeGroups(groups, hndFile)
+		self.__write_footer(hndFile)
+		hndFile.close()
+
+	def sections(self):
+		"""
+		Split the sorted elements into sections, one section per element type.
+
+		input:			none;
+		return:			a list of (type, groups) tuples, where groups is a list
+						of (type, refdes list, name parts, plural) tuples.
+		"""
+		if self.groupMode == "none":
+			listKeys = [[elem] for elem in self.sortedKeys]
+		else:
+			listKeys = self.groupedKeys
+		sections = []
+		for group in self.__iterGroups(listKeys):
+			if not sections or sections[-1][0] != group[0]:
+				sections.append((group[0], []))
+			sections[-1][1].append(group)
+		return sections
+
+	def render_header(self):
+		"""
+		Render LaTeX document header to a string.
+
+		input:			none;
+		return:			UTF-8 string.
+		"""
+		sink = TextSink()
+		self.__write_header(sink)
+		return sink.getvalue()
+
+	def render_footer(self):
+		"""
+		Render LaTeX document footer to a string.
+
+		input:			none;
+		return:			UTF-8 string.
+		"""
+		sink = TextSink()
+		self.__write_footer(sink)
+		return sink.getvalue()
+
+	def render_section(self, groups, firstQuote = True):
+		"""
+		Render a single section of the document to a string. Quotes are paired
+		across the whole document, so the state of pairing has to be passed in.
+
+		groups:			groups of the section as returned by sections();
+		firstQuote:		True if the next quote in the document is an opening one;
+		return:			a tuple (UTF-8 string, quote state after the section).
+		"""
+		sink = TextSink()
+		firstQuote = self.__writeGroups(groups, sink, firstQuote)
+		return sink.getvalue(), firstQuote
+
+	def count(self, elem):
+		"""
+		Count the elements of a group.
+
+		elem:			the refdes list of the group;
+		return:			the number of elements, the number of parts for rolled-up tables.
+		"""
+		if self.partTable.amounts is not None:
+			return sum([self.partTable.amounts[each] for each in elem])
+		return len(elem)
+
+	def __iterGroups(self, listKeys):
+		"""
+			Attach name parts and section plural form to the groups of refdes
+			taken from the parsed BOM.
+
+			listKeys:	a list of grouped refdes,
+			return:		a generator of (type, refdes list, name parts, plural) tuples.
+		"""
+		designators = self.partTable.designators
+		lookup = self.partTable.lookup
+		counts = self.typeAmounts or self.index.counts
+		for elem in listKeys:
+			# The first designator of a span is not in the dictionary
+			designator = designators.get(elem[0]) or lookup(elem[0])
+			plural = counts[designator.type] > 1
+			yield designator.type, elem, self.partTable.names[designator.part], plural
+
 	def __writeUngrouped(self, listKeys, hndFile):
 		"""
 			Write ungrouped list of elements to file.
@@ -72,34 +300,7 @@ class TexWriter:
 			hndFile:	a descriptor to open file,
 			return:		none.
 		"""
-		prevType = ''
-		stringCounter = self.strings
-		for elem in listKeys:
-			elemType = re.sub('[0-9]', '', elem)
-			if elemType != prevType:
-				self.__write_section(hndFile, elemType)
-				prevType = elemType
-				stringsCounter = self.strings
-
-			elemString = ['\\Element{']
-			currentElem = self.dictBom[elem]
-			# Find and convert special character in the string
-			convertedStr = []
-			for part in currentElem[0]:
-				for char in part:
-					convertedStr.append(self.__escape_latex(char))
-			elemString.extend(convertedStr)
-			elemString.extend(["}{\\refbox{", elem, "}}{", currentElem[-1], "}"])
-			beautyStr = self.__beautifyStr(''.join(elemString))
-			hndFile.write(beautyStr.decode("utf-8"))
-			hndFile.write('\n')
-			if self.strings != 0:
-				stringsCounter -= 1
-				if stringsCounter == 0:
-					self.__writeEmptyString(hndFile)
-					stringsCounter = self.strings
-
-		self.__write_footer(hndFile)
+		self.__writeGrouped([[elem] for elem in listKeys], hndFile)
 
 	def __writeGrouped(self, listKeys, hndFile):
 		"""
@@ -109,34 +310,53 @@ class TexWriter:
 			hndFile:	a descriptor to open file,
 			return:		none.
 		"""
+		self.__writeGroups(self.__iterGroups(listKeys), hndFile)
+
+	def __writeGroups(self, groups, hndFile, firstQuote = True):
+		"""
+			Write groups of elements to file.
+
+			groups:		an iterable of (type, refdes list, name parts, plural) tuples,
+			hndFile:	a descriptor to open file,
+			firstQuote:	True if the next quote is an opening one,
+			return:		the quote state after the groups.
+		"""
 		prevType = ''
 		stringsCounter = self.strings
-		for elem in listKeys:
-			elemType = re.sub('[0-9]', '', elem[0])
+		amounts = self.partTable.amounts
+		cache = self.renderCache
+		for elemType, elem, nameParts, plural in groups:
 			if elemType != prevType:
-				self.__write_section(hndFile, elemType)
+				self.__write_section(hndFile, elemType, plural)
 				prevType = elemType
 				stringsCounter = self.strings
 
-			elemString = ['\\Element{']
-			currentElem = self.dictBom[elem[0]]
-			# Find and convert special character in the string
-			convertedStr = []
-			for part in currentElem[0]:
-				for char in part:
-					convertedStr.append(self.__escape_latex(char))
-			elemString.extend(convertedStr)
-			elemString.append("}{")
+			# The name is enclosed in braces, so no run of commas and spaces crosses
+			# its bounds and it is cleaned up apart from the rest of the line. The
+			# result depends on the quote state, which is a part of the key.
+			key = (tuple(nameParts), firstQuote)
+			rendered = cache.get(key)
+			if rendered is None:
+				# Find and convert special character in the string
+				escaped, quoteState = self.__escape_latex(''.join(nameParts), firstQuote)
+				rendered = (self.__beautifyName(escaped), quoteState)
+				cache.put(key, rendered)
+			name, firstQuote = rendered
+			elemString = ["}{"]
 
 			# Choose the representation of RefDes in the corresponding field
-			if len(elem) == 1:
+			count = self.count(elem)
+			if amounts is not None:
+				# Designators of a rolled-up table are not shown
+				refdeselem = ''
+			elif len(elem) == 1:
 				# There is the only element in the elem. Proceed without modufication
 				refdeselem = ''.join(['\\refbox{', elem[0], '}'])
-			if len(elem) == 2:
+			elif len(elem) == 2:
 				# There are two elements in the elem. Separate them with comma.
 				refdes = ', '.join(elem)
 				refdeselem = ''.join(['\\refbox{', refdes, '}'])
-			if len(elem) == 3:
+			elif len(elem) == 3:
 				# There are three elements in the elem. Deside upon ellipsis or
 				# comma separated list
 				refdes = ', '.join(elem)
@@ -144,24 +364,22 @@ class TexWriter:
 					# Resulting string is too long, let's elem it
 					refdes = ''.join([elem[0], '\ldots{}', elem[-1]])
 				refdeselem = ''.join(['\\refbox{', refdes, '}'])
-			if len(elem) > 3:
+			else:
 				refdeselem = ''.join(['\\refbox{', elem[0], '\ldots{}', elem[-1], '}'] )
 
-			elemString.extend(refdeselem)
-			elemString.extend('}')
+			elemString.append(refdeselem)
+			elemString.append('}')
 
 			# Add the number of elements
-			elemString.extend(["{", str(len(elem)), "}"])
+			elemString.extend(["{", str(count), "}"])
 			beautyStr = self.__beautifyStr(''.join(elemString))
-			hndFile.write(beautyStr.decode("utf-8"))
-			hndFile.write('\n')
+			hndFile.write(''.join(['\\Element{', name, beautyStr, '\n']))
 			if self.strings != 0:
 				stringsCounter -= 1
 				if stringsCounter == 0:
 					self.__writeEmptyString(hndFile)
 					stringsCounter = self.strings
-
-		self.__write_footer(hndFile)
+		return firstQuote
 
 	def __writeEmptyString(self, hndFile):
 		"""
@@ -170,7 +388,7 @@ class TexWriter:
 			return:		none.
 		"""
 		string = "\\Element{}{}{}\n"
-		hndFile.write(string.decode("utf-8"))
+		hndFile.write(string)
 
 	def __findSequences(self, refdes):
 		"""
@@ -181,14 +399,15 @@ class TexWriter:
 			return:		a list containing consequent refdes grouped into lists.
 		"""
 		listKeys = list(refdes)
+		lookup = self.partTable.lookup
 		groupedKeys = []
 		currentGroup = []
 		for index in range(len(listKeys)):
 			if index == 0:
 				currentGroup.append(listKeys[0])
-				prevNum = int(re.sub('[A-Z/-/_/.]', '', listKeys[0]))
+				prevNum = lookup(listKeys[0]).number
 				continue
-			currentNum = int(re.sub('[A-Z/-/_/.]', '', listKeys[index]))
+			currentNum = lookup(listKeys[index]).number
 			if currentNum == prevNum + 1:
 				currentGroup.append(listKeys[index])
 			else:
@@ -227,115 +446,78 @@ class TexWriter:
 		hndFile.write("\\end{ElementList}\n")
 		hndFile.write("\\end{document}\n")
 
-	def __write_section(self, hndFile, refdes):
+	def __write_section(self, hndFile, element, plural):
 		"""
 			Write new section header to the file based on the RefDes descriptions.
 
 			hndFile:	the handler of open file;
-			refdes:		refdes of an element for which new section will be created;
+			element:	type of elements for which new section will be created;
+			plural:		True if there are several elements of this type;
 			return:		none.
 		"""
-		header = ['\\Part{']
-		element = re.sub('[0-9]', '', refdes)
-		if element in self.dictDescription.keys():
-			if self.elementTypes.count(element) > 1:
+		title = self.section_title(element, plural)
+		if title is not None:
+			hndFile.write(''.join(['\\Part{', title, '}\n']))
+
+	def section_title(self, element, plural):
+		"""
+		Find the title of the section in the RefDes descriptions.
+
+		element:		type of elements of the section;
+		plural:			True if there are several elements of this type;
+		return:			the title or None if the type has no description.
+		"""
+		if element in self.dictDescription:
+			if plural:
 				count = 1
 			else:
 				count = 0
 			# Check whether descrition contains the requered string or not
 			if len(self.dictDescription[element]) - 1 >= count:
-				header.extend(self.dictDescription[element][count])
-				header.append('}')
-				hndFile.write(''.join(header).decode("utf-8"))
-				hndFile.write('\n')
+				return self.dictDescription[element][count]
+		return None
 
-	def __escape_latex(self, char):
+	def __escape_latex(self, text, firstQuote):
 		"""
-			Escape special characters in LaTeX document.
+			Escape special characters in LaTeX document. Quotes are replaced with
+			russian typographic symbols, the opening and closing ones are paired
+			across the whole document.
 
-			symbol:		symbol to convert;
-			return:		escaped symbol in case it has special meaning,
-						or the same symbol otherwise.
+			text:		string to convert;
+			firstQuote:	True if the next quote is an opening one;
+			return:		a tuple (escaped string, quote state after the string).
 		"""
-		if char in self.latexSpecial.keys():
-			# Replace quotes with russian typographic symbol
-			if char != '"':
-				return self.latexSpecial[char]
+		pieces = text.split('"')
+		escaped = [LATEX_SPECIAL_RE.sub(_replace_special, pieces[0])]
+		for piece in pieces[1:]:
+			if firstQuote:
+				escaped.append('<<')
 			else:
-				if self.__firstQuote:
-					self.__firstQuote = False
-					return '<<'
-				else:
-					self.__firstQuote = True
-					return '>>'
-		else:
-			return char
+				escaped.append('>>')
+			firstQuote = not firstQuote
+			escaped.append(LATEX_SPECIAL_RE.sub(_replace_special, piece))
+		return ''.join(escaped), firstQuote
 
-	def __sortElements(self, elements):
+	def __sortElements(self, index):
 		"""
 			Sorts a list of elements.
 
-			elements:	unsorted list of elements;
+			index:		DesignatorIndex of the elements;
 			return:		sorted list of elements.
 		"""
-		# Separate the type of an element from its position number
-		elemList = []
-		for refdes in elements:
-			elemType = re.sub('[0-9]', '', refdes)
-			elemPos = int(re.sub('[A-Z\-\_\.]', '', refdes.upper()))
-			elemList.append(Element(refdes, elemType, elemPos))
-		# Sort elements in two stages
-		elemList = sorted(elemList, key = operator.attrgetter('pos'))
-		elemList = sorted(elemList, key = operator.attrgetter('element'))
-		return [elem.refdes for elem in elemList]
+		# The index keeps the elements of every type sorted by position
+		return index.sorted_keys()
 
 	def __combineElements(self):
 		"""
-			Combine elements in a sorted list into groups.
+			Combine elements in a sorted list into groups. Neighbouring elements
+			of the same type with identical name parts fall into one group, so
+			a single pass over the designator index is enough.
+
 			input:		none, this method operates on class member;
-			return:		none.
+			return:		a list of groups, each group is a list of refdes.
 		"""
-		refdes = list(self.sortedKeys)
-		groupedKeys = []
-		for currentElement in refdes:
-			if (len(refdes) == refdes.index(currentElement) + 1):
-				# We've reached the end of list
-				pass
-			else:
-				process = True
-				offset = 1
-				currentType = re.sub('[0-9]', '', currentElement)
-				currentStr = self.dictBom[currentElement][0]
-				currentGroup = []
-				currentGroup.append(currentElement)
-				while process is True:
-					# Compare elements' types and process them in case they are identical
-					nextElement = refdes[refdes.index(currentElement) + offset]
-					nextType = re.sub('[0-9]', '', nextElement)
-					if (currentType == nextType):
-						nextStr = self.dictBom[nextElement][0]
-						if len(currentStr) == len(nextStr):
-							matched = 0
-							for part in zip(currentStr, nextStr):
-								if part[0] == part[1]:
-									matched += 1
-								else:
-									break
-							if matched == len(currentStr):
-								currentGroup.append(nextElement)
-								refdes.remove(nextElement)
-								# Check whether we've reached the end of list
-								if (len(refdes) < refdes.index(currentElement) + offset + 1):
-									break
-							else:
-								process = False
-						else:
-							process = False
-					else:
-						process = False
-				if currentGroup:
-					groupedKeys.append(currentGroup)
-		return groupedKeys
+		return self.index.groups()
 
 	def __beautifyStr(self, elem):
 		"""
@@ -345,15 +527,16 @@ class TexWriter:
 			return:		processed string.
 		"""
 		# Remove leading or trailing commas and spaces
-		elem = re.sub('^[, ]*|[, ]*$', '', elem)
-		# Replace the sequences of commas with just one 
-		# corresponding symbol
-		elem = re.sub(',{2,}', ',', elem)
-		elem = re.sub('(, ){2,}', ', ', elem)
-		# Remove excessive spaces
-		elem = re.sub('( ){2,}', ' ', elem)
-		# Remove spaces before comma
-		elem = re.sub(' *,', ',', elem)
-		# Put mathematical plus-minus symbol
-		elem = re.sub('\+-|\+\\-|\+/-', "$\\pm$", elem)
-		return elem
+		elem = elem.strip(', ')
+		return BEAUTIFY_RE.sub(_beautify_match, elem)
+
+	def __beautifyName(self, name):
+		"""
+			Remove excessive commas and spaces from the name placed inside a line.
+			Unlike __beautifyStr() the ends of the name are kept, as they are not
+			the ends of the line.
+
+			name:		the escaped name;
+			return:		processed string.
+		"""
+		return BEAUTIFY_RE.sub(_beautify_match, name)
@@ -0,0 +1,194 @@
+# -*- coding: utf8 -*-
+
+import os
+import sys
+import time
+import signal
+import multiprocessing
+from parser_refdes import RefDesParser
+from parser_format import FormatParser
+from tex_cache import TexCache, file_digest
+from batch import _init_worker, _convert_job
+from stage_profiler import profiler
+from bom_export import EMIT_SUFFIXES
+from compression import split_extension
+
+# Seconds between the scans of the directories
+WATCH_INTERVAL = 0.2
+# A changed file is converted when it has not changed for this many seconds
+WATCH_DELAY = 0.3
+# Worker processes used if -j is not given
+WATCH_JOBS = 2
+# Extension of the BOM files in the watched directories, possibly followed
+# by the extension of a compressed file
+BOM_EXTENSION = ".csv"
+
+def _init_watch_worker(settings, fmt, dsc, cache):
+	# Ctrl+C is handled by the main process only
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	_init_worker(settings, fmt, dsc, cache)
+
+def file_stamp(fileName):
+	"""
+		Returns a cheap stamp of the file which changes when the file is modified.
+
+		return:		a tuple (modification time, size) or None if the file is gone.
+	"""
+	try:
+		stat = os.stat(fileName)
+	except OSError:
+		return None
+	return stat.st_mtime, stat.st_size
+
+class BomWatcher:
+	"""
+		Watches the directories for changed BOM files and converts them. The
+		configuration is parsed once and kept in the worker processes; when a
+		configuration file changes it is reloaded and all BOMs are converted again.
+		Modification time and size are checked on every scan, the content digest
+		only when they change, so touching a file does not convert it.
+	"""
+	def __init__(self, directories, settings, fmt, dsc, jobs = WATCH_JOBS,
+			interval = WATCH_INTERVAL, delay = WATCH_DELAY):
+		self.directories = directories
+		self.settings = settings
+		self.fmt = fmt
+		self.dsc = dsc
+		self.jobs = jobs
+		self.interval = interval
+		self.delay = delay
+		self.pool = None
+		self.cache = None
+		# BOM name -> stamp of the file
+		self.stamps = {}
+		# BOM name -> content digest at the time of the last conversion
+		self.digests = {}
+		# BOM name -> time of the last change seen, for the files waiting for conversion
+		self.pending = {}
+		self.configStamps = self.__config_stamps()
+
+	def __config_stamps(self):
+		return [file_stamp(self.settings["fileFormat"]), file_stamp(self.settings["fileDescription"])]
+
+	def __start_pool(self):
+		"""
+			Starts the worker processes with the current configuration.
+		"""
+		if self.pool is not None:
+			self.pool.close()
+			self.pool.join()
+		if self.settings["cache"]:
+			self.cache = TexCache(self.fmt.dictFormat, self.dsc.dictDescription, self.settings["cacheDir"])
+		self.pool = multiprocessing.Pool(self.jobs, _init_watch_worker, (self.settings, self.fmt, self.dsc, self.cache))
+
+	def __reload_config(self):
+		"""
+			Parses the configuration files again.
+
+			return:		True if the configuration was read, False if it is broken
+						and the previous one is kept.
+		"""
+		fmt = FormatParser(self.settings["fileFormat"])
+		if not fmt.dictFormat:
+			print "Не удалось прочитать файл, содержаший формат описания наименования элементов."
+			return False
+		dsc = RefDesParser(self.settings["fileDescription"])
+		if not dsc.dictDescription:
+			print "Не удалось прочитать файл, содержащий описания элементов."
+			return False
+		self.fmt = fmt
+		self.dsc = dsc
+		return True
+
+	def __list_boms(self):
+		listBom = []
+		for directory in self.directories:
+			try:
+				names = os.listdir(directory)
+			except OSError:
+				continue
+			for name in names:
+				base = split_extension(name)[0]
+				# CSV element lists written by --emit are not BOMs
+				if base.lower().endswith(BOM_EXTENSION) and not base.endswith(EMIT_SUFFIXES["csv"]):
+					listBom.append(os.path.join(directory, name))
+		return listBom
+
+	def scan(self):
+		"""
+			Checks the configuration and the BOM files and marks the changed ones
+			as pending.
+
+			return:		none.
+		"""
+		now = time.time()
+		configStamps = self.__config_stamps()
+		if configStamps != self.configStamps:
+			self.configStamps = configStamps
+			if self.__reload_config():
+				print "Файлы настроек изменены, все BOM будут преобразованы заново."
+				sys.stdout.flush()
+				self.__start_pool()
+				self.digests = {}
+				for fileBom in self.stamps:
+					self.pending[fileBom] = now
+		listBom = self.__list_boms()
+		for fileBom in set(self.stamps) - set(listBom):
+			del self.stamps[fileBom]
+			self.digests.pop(fileBom, None)
+			self.pending.pop(fileBom, None)
+		for fileBom in listBom:
+			stamp = file_stamp(fileBom)
+			if stamp is not None and stamp != self.stamps.get(fileBom):
+				self.stamps[fileBom] = stamp
+				self.pending[fileBom] = now
+
+	def convert_pending(self):
+		"""
+			Converts the pending BOM files which have not changed for the delay.
+
+			return:		the number of files converted.
+		"""
+		now = time.time()
+		ready = []
+		for fileBom, changed in self.pending.items():
+			if now - changed < self.delay:
+				continue
+			del self.pending[fileBom]
+			try:
+				digest = file_digest(fileBom)
+			except IOError:
+				continue
+			if digest == self.digests.get(fileBom):
+				continue
+			self.digests[fileBom] = digest
+			ready.append(fileBom)
+		ready.sort()
+		for fileBom, fileTex, elapsed, error, stats in self.pool.imap(_convert_job, ready):
+			if stats is not None:
+				profiler.merge(stats)
+			if error is None:
+				print "%s -> %s: %.3f с" % (fileBom, fileTex, elapsed)
+			else:
+				# Try again on the next change of the file
+				self.digests.pop(fileBom, None)
+				print "%s: ошибка: %s (%.3f с)" % (fileBom, error, elapsed)
+			sys.stdout.flush()
+		return len(ready)
+
+	def run(self):
+		"""
+			Watches the directories until interrupted.
+		"""
+		self.__start_pool()
+		print "Отслеживание изменений в каталогах: %s. Для завершения нажмите Ctrl+C." % ', '.join(self.directories)
+		sys.stdout.flush()
+		try:
+			while True:
+				self.scan()
+				self.convert_pending()
+				time.sleep(self.interval)
+		except KeyboardInterrupt:
+			pass
+		self.pool.terminate()
+		self.pool.join()